@@ -0,0 +1,265 @@
+"""Offline reports across all users of a user data file.
+
+Reports study hours and sessions per subject, users active by the date of
+their last session, and how long sessions are. The file is never loaded
+whole: it is split into byte ranges on user boundaries, and each range is
+parsed one user at a time by a worker process. The partial reports are
+merged at the end.
+
+    python analytics.py user_data.json --workers 8 --json
+
+The bot writes the file with indent=2, which puts every user on lines of
+their own. Files without those line breaks are still read incrementally,
+but in a single process.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+# Upper bounds in minutes of the session length buckets
+LENGTH_BUCKETS = [15, 30, 60, 120, 240]
+
+# An indent=2 line that starts a user entry
+ENTRY_START = b'  "'
+
+
+class Report:
+    """Aggregates of any number of users, partial reports add up with merge()."""
+
+    def __init__(self):
+        self.users = 0
+        self.seconds = Counter()  # subject -> study seconds
+        self.sessions = Counter()  # subject -> sessions
+        self.active = Counter()  # date of a last session -> users
+        self.lengths = Counter()  # bucket label -> subjects of a user with that average session
+
+    def add(self, user):
+        self.users += 1
+        dates = set()
+        for subject, stats in (user.get("stats") or {}).items():
+            seconds = stats.get("total_work_time", 0)
+            sessions = stats.get("total_sessions", 0)
+            self.seconds[subject] += seconds
+            self.sessions[subject] += sessions
+            if sessions:
+                self.lengths[length_bucket(seconds / sessions / 60)] += 1
+            if stats.get("last_session"):
+                dates.add(stats["last_session"][:10])
+        self.active.update(dates)
+
+    def merge(self, other):
+        self.users += other.users
+        self.seconds.update(other.seconds)
+        self.sessions.update(other.sessions)
+        self.active.update(other.active)
+        self.lengths.update(other.lengths)
+        return self
+
+    def as_dict(self):
+        return {
+            "users": self.users,
+            "subjects": {subject: {"hours": round(seconds / 3600, 1), "sessions": self.sessions[subject]}
+                         for subject, seconds in self.seconds.most_common()},
+            "active_users_by_date": dict(sorted(self.active.items())),
+            "session_length_minutes": {label: self.lengths[label] for label in bucket_labels()
+                                       if self.lengths[label]},
+        }
+
+    def format(self):
+        lines = [f"Users: {self.users}", "", f"{'subject':<28} {'hours':>10} {'sessions':>9}"]
+        for subject, seconds in self.seconds.most_common():
+            lines.append(f"{subject:<28} {seconds / 3600:10.1f} {self.sessions[subject]:9}")
+        lines += ["", "Users by date of last session"]
+        lines += [f"  {date} {users:7}" for date, users in sorted(self.active.items())]
+        lines += ["", "Average session length (minutes), subjects of users"]
+        lines += [f"  {label:>8} {self.lengths[label]:7}" for label in bucket_labels()]
+        return "\n".join(lines)
+
+
+def length_bucket(minutes):
+    low = 0
+    for high in LENGTH_BUCKETS:
+        if minutes < high:
+            return f"{low}-{high}"
+        low = high
+    return f"{low}+"
+
+
+def bucket_labels():
+    bounds = [0] + LENGTH_BUCKETS
+    return [f"{low}-{high}" for low, high in zip(bounds, bounds[1:])] + [f"{bounds[-1]}+"]
+
+
+def iter_users(f, chunk_size=1 << 16):
+    """Yield (user_id, data) from a text stream of one JSON object, incrementally.
+
+    Only the user being parsed and one chunk are held in memory.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    eof = False
+
+    def skip(chars):
+        nonlocal buffer, position
+        while True:
+            while position < len(buffer) and buffer[position] in chars:
+                position += 1
+            if position < len(buffer) or not fill():
+                return
+
+    def fill():
+        nonlocal buffer, position, eof
+        if eof:
+            return False
+        chunk = f.read(chunk_size)
+        if not chunk:
+            eof = True
+            return False
+        buffer = buffer[position:] + chunk
+        position = 0
+        return True
+
+    def value():
+        nonlocal position
+        while True:
+            try:
+                result, end = decoder.raw_decode(buffer, position)
+                # A number at the end of the buffer may continue in the next chunk
+                if end < len(buffer) or eof:
+                    position = end
+                    return result
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            if not fill():
+                result, position = decoder.raw_decode(buffer, position)
+                return result
+
+    skip(" \t\r\n")
+    if buffer[position:position + 1] != "{":
+        raise ValueError("expected a JSON object")
+    position += 1
+    while True:
+        skip(" \t\r\n,")
+        if buffer[position:position + 1] in ("}", ""):
+            return
+        key = value()
+        skip(" \t\r\n:")
+        yield key, value()
+
+
+def shard_ranges(path, shards):
+    """Split a file into up to `shards` byte ranges that start at user entries.
+
+    Returns None when the file isn't laid out one user entry per line start.
+    """
+    size = os.path.getsize(path)
+    starts = []
+    with open(path, "rb") as f:
+        # indent=2 puts the opening brace on a line of its own
+        if f.readline(8).rstrip() != b"{":
+            return None
+        for i in range(shards):
+            f.seek(max(size * i // shards, f.tell()) if i else f.tell())
+            # A seek most likely lands in the middle of a line
+            at_line_start = i == 0
+            while True:
+                offset = f.tell()
+                line = f.readline(1 << 16)
+                if not line:
+                    offset = size
+                    break
+                if at_line_start and line.startswith(ENTRY_START):
+                    break
+                at_line_start = line.endswith(b"\n")
+            if offset == size:
+                break
+            if not starts or offset > starts[-1]:
+                starts.append(offset)
+    if not starts:
+        return None
+    return list(zip(starts, starts[1:] + [size]))
+
+
+def aggregate_range(path, start, end):
+    """Report of the user entries starting within [start, end) of an indent=2 file."""
+    report = Report()
+    entry = []
+
+    def flush():
+        if entry:
+            text = b"".join(entry).rstrip().rstrip(b",")
+            for user_id, data in json.loads(b"{" + text + b"}").items():
+                report.add(data)
+            entry.clear()
+
+    with open(path, "rb") as f:
+        f.seek(start)
+        while True:
+            offset = f.tell()
+            line = f.readline()
+            if not line or line.startswith(b"}"):
+                break
+            if line.startswith(ENTRY_START):
+                flush()
+                if offset >= end:
+                    break
+            entry.append(line)
+    flush()
+    return report
+
+
+def aggregate_stream(path):
+    report = Report()
+    with open(path, encoding="utf-8") as f:
+        for user_id, data in iter_users(f):
+            report.add(data)
+    return report
+
+
+def aggregate(path, workers=None):
+    """Report of a whole user data file, using up to `workers` processes."""
+    workers = workers or os.cpu_count() or 1
+    # Several ranges per worker even out differences in range cost
+    ranges = shard_ranges(path, workers * 4) if workers > 1 else None
+    if not ranges:
+        return aggregate_stream(path)
+    report = Report()
+    with ProcessPoolExecutor(workers) as pool:
+        for partial in pool.map(aggregate_range, [path] * len(ranges), *zip(*ranges)):
+            report.merge(partial)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", nargs="?", default=os.getenv("USER_DATA_FILE", "user_data.json"))
+    parser.add_argument("--workers", type=int, default=None, help="processes, all cores by default")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--stats", action="store_true", help="print run time and peak memory to stderr")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    report = aggregate(args.path, args.workers)
+    if args.json:
+        print(json.dumps(report.as_dict(), ensure_ascii=False, indent=2))
+    else:
+        print(report.format())
+
+    if args.stats:
+        import resource
+
+        # ru_maxrss is in KiB on Linux, the largest of the processes is reported
+        peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                   resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+        print(f"{time.perf_counter() - started:.2f} s, peak RSS {peak / 1024:.0f} MiB", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,83 @@
+"""analytics.py on a generated user data file: json.load vs. streaming vs. process pool.
+
+Each variant runs in its own process, so the peak RSS reported is its own.
+
+Usage: python benchmarks/bench_analytics.py [users] [workers]
+"""
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SUBJECTS = ["Математика", "Физика", "Химия", "Биология", "История Беларуси", "Английский язык",
+            "Белорусский язык", "Русский язык", "География", "Информатика"]
+
+# Loads the whole file like the bot does, then builds the same report
+JSON_LOAD = """
+import json, resource, sys, time
+sys.path.insert(0, {root!r})
+from analytics import Report
+started = time.perf_counter()
+report = Report()
+with open({path!r}, encoding="utf-8") as f:
+    for data in json.load(f).values():
+        report.add(data)
+print(json.dumps(report.as_dict(), ensure_ascii=False))
+print(f"{{time.perf_counter() - started:.2f}} s, peak RSS "
+      f"{{resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f}} MiB", file=sys.stderr)
+"""
+
+
+def write_user_data(path, users, rng):
+    """Write users one at a time in the bot's indent=2 layout."""
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("{\n")
+        for user_id in range(users):
+            stats = {}
+            for subject in rng.sample(SUBJECTS, rng.randint(1, 6)):
+                sessions = rng.randint(1, 60)
+                stats[subject] = {"total_sessions": sessions,
+                                  "total_work_time": sessions * rng.randint(600, 10800),
+                                  "total_work_intervals": sessions * rng.randint(1, 6),
+                                  "last_session": f"2024-05-{rng.randint(1, 31):02d} 18:30"}
+            entry = json.dumps({str(100000 + user_id): {"stats": stats, "custom_subjects": []}},
+                               ensure_ascii=False, indent=2)
+            f.write(entry[2:-2])
+            f.write(",\n" if user_id < users - 1 else "\n")
+        f.write("}")
+
+
+def run(args):
+    result = subprocess.run([sys.executable] + args, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout), result.stderr.strip()
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count()
+    rng = random.Random(1)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "user_data.json")
+        write_user_data(path, users, rng)
+        print(f"users={users} file={os.path.getsize(path) / 2 ** 20:.0f} MiB workers={workers}")
+
+        analytics = [os.path.join(ROOT, "analytics.py"), path, "--json", "--stats"]
+        variants = [
+            ("json.load", ["-c", JSON_LOAD.format(root=ROOT, path=path)]),
+            ("streaming", analytics + ["--workers", "1"]),
+            (f"pool x{workers}", analytics + ["--workers", str(workers)]),
+        ]
+        reports = []
+        for name, args in variants:
+            report, figures = run(args)
+            reports.append(report)
+            print(f"{name:>10}: {figures}")
+        print("reports identical:", all(report == reports[0] for report in reports))
+
+
+if __name__ == "__main__":
+    main()
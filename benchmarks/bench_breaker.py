@@ -0,0 +1,128 @@
+"""Bot API calls and log lines during an outage, with and without the circuit breaker.
+
+Runs the real run_timer loop for many sessions on a VirtualClock. The fake
+Bot API goes down for a while in the middle of the run: every call then
+hangs for the read timeout and fails with TimedOut. The fake bot gates and
+reports calls through the breaker the same way PooledRequest does.
+
+Usage: python benchmarks/bench_breaker.py [sessions] [outage_minutes]
+"""
+import asyncio
+import logging
+import os
+import sys
+import time
+from collections import Counter
+from datetime import timedelta
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram.error import NetworkError, TimedOut  # noqa: E402
+
+import cadence  # noqa: E402
+import main as bot  # noqa: E402
+from circuit import CircuitBreaker  # noqa: E402
+from clock import VirtualClock  # noqa: E402
+
+WORK, BREAK, CYCLES = 25, 5, 3
+OUTAGE_START = 20 * 60
+READ_TIMEOUT = 10
+
+
+class LogCounter(logging.Handler):
+    def __init__(self):
+        super().__init__(logging.WARNING)
+        self.records = 0
+
+    def emit(self, record):
+        self.records += 1
+
+
+class FlakyBot:
+    def __init__(self, clock, outage_end):
+        self.clock = clock
+        self.outage_end = outage_end
+        self.calls = Counter()
+
+    async def _call(self, method):
+        if not bot.bot_api.allow():
+            self.calls["refused"] += 1
+            raise NetworkError("Bot API unavailable, circuit breaker is open")
+        self.calls[method] += 1
+        if OUTAGE_START <= self.clock.monotonic() < self.outage_end:
+            await self.clock.sleep(READ_TIMEOUT)
+            self.calls["failed"] += 1
+            bot.bot_api.record_failure()
+            raise TimedOut()
+        bot.bot_api.record_success()
+
+    async def send_message(self, **kwargs):
+        await self._call("sendMessage")
+        return SimpleNamespace(message_id=self.calls["sendMessage"])
+
+    async def edit_message_text(self, **kwargs):
+        await self._call("editMessageText")
+
+
+async def simulate(sessions, outage, breaker):
+    clock = VirtualClock()
+    bot.use_timer_clock(clock)
+    bot.bot_api = breaker
+    breaker.clock = clock.monotonic
+    bot.deferred_notifications.drain()
+    fake_bot = FlakyBot(clock, OUTAGE_START + outage)
+    breaker.on_close = lambda: asyncio.ensure_future(bot.deliver_deferred(fake_bot))
+    finished = 0
+
+    async def credit(user_id, session):
+        nonlocal finished
+        finished += 1
+
+    bot.update_statistics = credit
+
+    async def one_session(user_id):
+        session = bot.UserSession()
+        session.subject = "Математика"
+        session.work_time, session.break_time = WORK, BREAK
+        session.is_working = True
+        session.progress_mode = cadence.FIXED
+        session.end_time = clock.now() + timedelta(minutes=CYCLES * (WORK + BREAK))
+        bot.active_timers[user_id] = session
+
+        update = SimpleNamespace(effective_chat=SimpleNamespace(id=user_id))
+        context = SimpleNamespace(bot=fake_bot, user_data={})
+        await bot.run_timer(update, context, user_id)
+
+    counter = LogCounter()
+    logging.getLogger().addHandler(counter)
+    cpu_started = time.process_time()
+    try:
+        await asyncio.gather(*(one_session(user_id) for user_id in range(1, sessions + 1)))
+        # Let the delivery of deferred notifications run
+        await asyncio.sleep(0)
+    finally:
+        logging.getLogger().removeHandler(counter)
+    return (time.process_time() - cpu_started, fake_bot.calls, counter.records, finished,
+            len(bot.deferred_notifications))
+
+
+def main():
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    outage = int(sys.argv[2]) * 60 if len(sys.argv) > 2 else 20 * 60
+    # Only the LogCounter handler is attached while a run is going
+    logging.getLogger().setLevel(logging.WARNING)
+
+    print(f"sessions={sessions} {WORK}/{BREAK} min x{CYCLES}, outage of {outage // 60} min "
+          f"from minute {OUTAGE_START // 60}")
+    for name, threshold in (("no breaker", float("inf")), ("breaker", 5)):
+        breaker = CircuitBreaker(threshold, reset_timeout=30)
+        cpu, calls, logged, finished, undelivered = asyncio.run(simulate(sessions, outage, breaker))
+        attempted = calls["sendMessage"] + calls["editMessageText"]
+        print(f"{name:>10}: attempted={attempted:6} failed={calls['failed']:6} "
+              f"refused={calls['refused']:6} log lines={logged:6} finished={finished}/{sessions} "
+              f"undelivered={undelivered} CPU={cpu:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
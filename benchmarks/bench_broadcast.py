@@ -0,0 +1,134 @@
+"""A broadcast next to timer traffic: a plain send loop vs. the Broadcaster.
+
+The fake Bot API allows 30 messages per second in all and answers the
+rest with 429 RetryAfter, like Telegram. Timer notifications go out at a
+steady rate the whole time. Everything runs on a VirtualClock. The
+Broadcaster run is interrupted halfway and resumed by a new Broadcaster
+from the saved cursor, as after a restart.
+
+Usage: python benchmarks/bench_broadcast.py [users] [timer_rate]
+"""
+import asyncio
+import json
+import os
+import sys
+import tempfile
+from collections import Counter
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram.error import RetryAfter  # noqa: E402
+
+from broadcast import Broadcaster  # noqa: E402
+from cadence import ApiPressure  # noqa: E402
+from clock import VirtualClock  # noqa: E402
+
+LIMIT = 30  # Messages per second the fake Bot API accepts
+SHARE = 0.5  # Of LIMIT for the Broadcaster
+
+
+class LimitedBot:
+    """Fake Bot API with a global token bucket of LIMIT per second."""
+
+    def __init__(self, clock, traffic):
+        self.clock = clock
+        self.traffic = traffic
+        self.tokens = LIMIT
+        self.updated = 0.0
+        self.calls = Counter()
+        self.delivered = Counter()  # chat_id -> messages
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.traffic.record()
+        now = self.clock.monotonic()
+        self.tokens = min(LIMIT, self.tokens + (now - self.updated) * LIMIT)
+        self.updated = now
+        kind = "timer" if chat_id < 0 else "broadcast"
+        if self.tokens < 1:
+            self.calls[f"{kind} 429"] += 1
+            raise RetryAfter(1)
+        self.tokens -= 1
+        self.calls[kind] += 1
+        self.delivered[chat_id] += 1
+        return SimpleNamespace(message_id=1)
+
+    async def edit_message_text(self, **kwargs):
+        pass
+
+
+async def timer_traffic(bot, clock, rate, stop):
+    """Timer notifications, sent once each, late ones count as failures."""
+    while not stop.is_set():
+        try:
+            await bot.send_message(chat_id=-1, text="🔔")
+        except RetryAfter:
+            pass
+        await clock.sleep(1 / rate)
+
+
+async def plain_loop(bot, users):
+    for user_id in users:
+        while True:
+            try:
+                await bot.send_message(chat_id=user_id, text="📣")
+                break
+            except RetryAfter as e:
+                await bot.clock.sleep(e.retry_after)
+
+
+async def run(variant, users, timer_rate, tmp):
+    clock = VirtualClock()
+    traffic = ApiPressure(clock=clock.monotonic)
+    bot = LimitedBot(clock, traffic)
+    stop = asyncio.Event()
+    timers = asyncio.create_task(timer_traffic(bot, clock, timer_rate, stop))
+    await clock.sleep(5)
+    started = clock.monotonic()
+
+    if variant == "plain loop":
+        await plain_loop(bot, range(1, users + 1))
+    else:
+        state = os.path.join(tmp, "broadcast.json")
+
+        def broadcaster():
+            return Broadcaster(state, lambda: iter(range(1, users + 1)), budget=LIMIT, share=SHARE,
+                               traffic=traffic, clock=clock.monotonic, sleep=clock.sleep)
+
+        first = broadcaster()
+        await first.start(bot, "📣", chat_id=0)
+        # Restart halfway through
+        while first.job.position < users // 2:
+            await clock.sleep(1)
+        await first.shutdown()
+        second = broadcaster()
+        assert second.load() is not None
+        second.resume(bot)
+        await second.task
+        with open(state, encoding="utf-8") as f:
+            bot.calls["job sent"] = json.load(f)["sent"]
+
+    duration = clock.monotonic() - started
+    stop.set()
+    await timers
+    duplicates = sum(count - 1 for chat_id, count in bot.delivered.items() if chat_id > 0 and count > 1)
+    missing = users - sum(1 for chat_id in bot.delivered if chat_id > 0)
+    return duration, bot.calls, duplicates, missing
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    timer_rate = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+    print(f"{users} users, Bot API limit {LIMIT}/s, broadcast share {SHARE:.0%}, "
+          f"timer notifications {timer_rate:g}/s")
+    with tempfile.TemporaryDirectory() as tmp:
+        for variant in ("plain loop", "Broadcaster"):
+            duration, calls, duplicates, missing = asyncio.run(run(variant, users, timer_rate, tmp))
+            timer_total = calls["timer"] + calls["timer 429"]
+            print(f"{variant:>12}: {duration:6.0f} s, broadcast 429s {calls['broadcast 429']:5}, "
+                  f"timer notifications lost {calls['timer 429']:5} of {timer_total} "
+                  f"({calls['timer 429'] / timer_total:.0%}), duplicates {duplicates}, missing {missing}")
+
+
+if __name__ == "__main__":
+    main()
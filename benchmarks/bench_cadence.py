@@ -0,0 +1,59 @@
+"""Bot API calls per session-hour for each progress update mode.
+
+Simulates run_timer's poll loop for common work/break settings.
+
+Usage: python benchmarks/bench_cadence.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cadence  # noqa: E402
+
+POLL_INTERVAL = 15
+MESSAGES_PER_CYCLE = 5  # work start, "Дзинь", break start, "Дзинь", "Перерыв окончен"
+SETTINGS = [(25, 5), (45, 15), (50, 10), (60, 60)]
+
+
+def legacy_edits(phase_seconds, interval):
+    """Edits of the old loop that slept `interval` and edited after every sleep."""
+    return -(-phase_seconds // interval)
+
+
+def policy_edits(policy, phase_seconds, is_break, mode):
+    """Edits of the current loop for a given mode."""
+    edits = 0
+    remaining = phase_seconds
+    last_edit = 0
+    while remaining > 0:
+        remaining -= min(POLL_INTERVAL, remaining)
+        interval = policy.interval(phase_seconds, is_break=is_break, mode=mode)
+        elapsed = phase_seconds - remaining
+        if interval is None or remaining <= 0 or elapsed - last_edit < interval:
+            continue
+        last_edit = elapsed
+        edits += 1
+    return edits
+
+
+def per_hour(work, rest, edits_per_cycle):
+    cycle_hours = (work + rest) / 60
+    return (edits_per_cycle + MESSAGES_PER_CYCLE) / cycle_hours
+
+
+def main():
+    policy = cadence.CadencePolicy(edit_budget=float("inf"))
+    print(f"{'work/break':>10} {'before':>8} {'adaptive':>9} {'fixed':>7} {'transitions':>12}  (API calls per session-hour)")
+    for work, rest in SETTINGS:
+        before = legacy_edits(work * 60, 30) + legacy_edits(rest * 60, 15)
+        row = [per_hour(work, rest, before)]
+        for mode in (cadence.ADAPTIVE, cadence.FIXED, cadence.TRANSITIONS):
+            edits = (policy_edits(policy, work * 60, False, mode)
+                     + policy_edits(policy, rest * 60, True, mode))
+            row.append(per_hour(work, rest, edits))
+        print(f"{work:>4}/{rest:<5} {row[0]:8.1f} {row[1]:9.1f} {row[2]:7.1f} {row[3]:12.1f}")
+
+
+if __name__ == "__main__":
+    main()
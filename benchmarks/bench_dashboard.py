@@ -0,0 +1,78 @@
+"""Bot API calls per work/break cycle: message stream vs. live dashboard.
+
+Runs the real run_timer loop on a VirtualClock with an instant fake bot for
+a session of several full cycles, for each progress update mode.
+
+Usage: python benchmarks/bench_dashboard.py [cycles]
+"""
+import asyncio
+import os
+import sys
+from collections import Counter
+from datetime import timedelta
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cadence  # noqa: E402
+import main as bot  # noqa: E402
+from clock import VirtualClock  # noqa: E402
+
+WORK, BREAK = 25, 5
+
+
+class FakeBot:
+    def __init__(self):
+        self.calls = Counter()
+
+    async def send_message(self, **kwargs):
+        self.calls["send"] += 1
+        return SimpleNamespace(message_id=self.calls["send"])
+
+    async def edit_message_text(self, **kwargs):
+        self.calls["edit"] += 1
+
+
+async def run_session(cycles, dashboard, progress_mode):
+    clock = VirtualClock()
+    bot.use_timer_clock(clock)
+    fake_bot = FakeBot()
+
+    session = bot.UserSession()
+    session.subject = "Математика"
+    session.work_time, session.break_time = WORK, BREAK
+    session.is_working = True
+    session.dashboard = dashboard
+    session.progress_mode = progress_mode
+    # end_time is checked between cycles, so this ends after the last full one
+    session.end_time = clock.now() + timedelta(minutes=cycles * (WORK + BREAK))
+    bot.active_timers[1] = session
+
+    update = SimpleNamespace(effective_chat=SimpleNamespace(id=1))
+    context = SimpleNamespace(bot=fake_bot, user_data={})
+    await bot.run_timer(update, context, 1)
+    return fake_bot.calls
+
+
+async def count_credit(user_id, session):
+    pass
+
+
+def main():
+    cycles = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    bot.update_statistics = count_credit
+
+    print(f"{WORK}/{BREAK} min, {cycles} cycles, API calls per cycle")
+    print(f"{'progress':>12} {'view':>10} {'sent':>6} {'edited':>7} {'total':>6}")
+    for mode in cadence.MODES:
+        for dashboard in (False, True):
+            calls = asyncio.run(run_session(cycles, dashboard, mode))
+            # The last message announces the end of the session, not a cycle
+            sent = (calls["send"] - 1) / cycles
+            edited = calls["edit"] / cycles
+            view = "dashboard" if dashboard else "stream"
+            print(f"{mode:>12} {view:>10} {sent:6.1f} {edited:7.1f} {sent + edited:6.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Outbound Bot API throughput as the connection pool size varies.
+
+Starts a local fake Bot API over HTTP/1.1 keep-alive that answers every
+call after a fixed latency. A fixed number of concurrent callers, like
+handlers and timer tasks, then make calls through PooledRequest with
+different pool sizes.
+
+Usage: python benchmarks/bench_http_pool.py [calls] [latency_ms] [callers]
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram.error import TimedOut  # noqa: E402
+
+from http_pool import PooledRequest  # noqa: E402
+
+POOL_SIZES = [1, 4, 16, 64, 128]
+RESPONSE = b'{"ok":true,"result":true}'
+
+
+async def start_fake_api(latency):
+    async def serve(reader, writer):
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = 0
+                for line in head.split(b"\r\n"):
+                    if line.lower().startswith(b"content-length:"):
+                        length = int(line.split(b":", 1)[1])
+                if length:
+                    await reader.readexactly(length)
+                await asyncio.sleep(latency)
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                             b"Content-Length: %d\r\n\r\n%s" % (len(RESPONSE), RESPONSE))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(serve, "127.0.0.1", 0)
+    return server, server.sockets[0].getsockname()[1]
+
+
+async def burst(port, pool_size, calls, callers):
+    request = PooledRequest("outbound", pool_size, pool_timeout=30.0)
+    await request.initialize()
+    url = f"http://127.0.0.1:{port}/bot123:fake/sendMessage"
+
+    async def caller(count):
+        for _ in range(count):
+            try:
+                await request.do_request(url, "POST")
+            except TimedOut:
+                pass
+
+    started = time.perf_counter()
+    await asyncio.gather(*(caller(calls // callers) for _ in range(callers)))
+    elapsed = time.perf_counter() - started
+    await request.shutdown()
+    return elapsed / (calls // callers * callers) * calls, request.stats.as_dict()
+
+
+async def run(calls, latency, callers):
+    server, port = await start_fake_api(latency)
+    try:
+        for pool_size in POOL_SIZES:
+            elapsed, stats = await burst(port, pool_size, calls, callers)
+            print(f"pool={pool_size:4} {calls / elapsed:8.1f} calls/s "
+                  f"wait avg={stats['pool_wait_avg_ms']:8.1f} ms max={stats['pool_wait_max_ms']:8.1f} ms "
+                  f"new={stats['new_connections']:4} reuse={stats['reuse_rate']:.2f}")
+    finally:
+        server.close()
+        await server.wait_closed()
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 640
+    latency = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.05
+    callers = int(sys.argv[3]) if len(sys.argv) > 3 else 64
+    print(f"calls={calls} api_latency={latency * 1000:.0f} ms callers={callers}")
+    asyncio.run(run(calls, latency, callers))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Latency of regular users while one client floods the bot.
+
+Replays one second-by-second traffic pattern: regular users tap a button
+every few seconds, one buggy client sends the same callback many times a
+second. Updates go through UserLanes under a global limit, with and without
+InboundLimiter in front, and handlers wait on simulated Bot API calls.
+
+Usage: python benchmarks/bench_inbound.py [users] [flood_per_second] [seconds]
+"""
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from inbound_limit import InboundLimiter  # noqa: E402
+from lanes import UserLanes  # noqa: E402
+
+API_LATENCY = 0.05
+CONCURRENCY = 64
+FLOODER = -1
+
+
+def make_traffic(users, flood_per_second, seconds, seed=1):
+    rng = random.Random(seed)
+    traffic = []
+    for user_id in range(users):
+        at = rng.uniform(0, 3)
+        while at < seconds:
+            traffic.append((at, user_id, f"tap-{rng.randrange(3)}"))
+            at += rng.uniform(2, 6)
+    for i in range(int(flood_per_second * seconds)):
+        traffic.append((i / flood_per_second, FLOODER, "pause-toggle"))
+    traffic.sort()
+    return traffic
+
+
+async def run(traffic, limiter):
+    lanes = UserLanes()
+    slots = asyncio.Semaphore(CONCURRENCY)
+    latencies = []
+    started = time.perf_counter()
+
+    async def handle():
+        await asyncio.sleep(API_LATENCY)
+
+    async def process(arrived, user_id, data):
+        async with slots:
+            if limiter and limiter.check(user_id, data):
+                return
+            await lanes.run(user_id, handle())
+        if user_id != FLOODER:
+            latencies.append(time.perf_counter() - started - arrived)
+
+    tasks = []
+    for at, user_id, data in traffic:
+        delay = at - (time.perf_counter() - started)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(process(at, user_id, data)))
+    await asyncio.gather(*tasks)
+    return latencies
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    flood = float(sys.argv[2]) if len(sys.argv) > 2 else 40
+    seconds = float(sys.argv[3]) if len(sys.argv) > 3 else 15
+    traffic = make_traffic(users, flood, seconds)
+
+    print(f"users={users} flood={flood:.0f}/s over {seconds:.0f} s, {len(traffic)} updates, "
+          f"concurrency={CONCURRENCY}")
+    for name, limiter in (("no limiter", None), ("inbound limiter", InboundLimiter())):
+        latencies = asyncio.run(run(traffic, limiter))
+        line = (f"{name:16} regular users p50={percentile(latencies, 0.5) * 1000:7.1f} ms "
+                f"p99={percentile(latencies, 0.99) * 1000:7.1f} ms")
+        if limiter:
+            line += f" {limiter.stats()}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Update throughput and latency: sequential processing vs. per-user lanes.
+
+A burst of updates from many users is processed the way Application does
+it, either one update at a time or concurrently with UserLanes under a
+global limit. Handlers wait on simulated Bot API calls, a few of them are
+slow /stats requests. Per-user ordering is checked for every run.
+
+Usage: python benchmarks/bench_lanes.py [users] [updates_per_user]
+"""
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lanes import UserLanes  # noqa: E402
+
+API_LATENCY = 0.05  # One Bot API round trip
+STATS_CALLS = 6  # /stats: file read plus several replies
+STATS_SHARE = 0.05
+CONCURRENCY = 64
+
+
+def make_burst(users, per_user, seed=1):
+    rng = random.Random(seed)
+    burst = [(user_id, seq, rng.random() < STATS_SHARE)
+             for user_id in range(users) for seq in range(per_user)]
+    # Interleave users while keeping each user's updates in order
+    rng.shuffle(burst)
+    burst.sort(key=lambda update: update[1])
+    return burst
+
+
+async def handle(update, seen):
+    user_id, seq, is_stats = update
+    for _ in range(STATS_CALLS if is_stats else 1):
+        await asyncio.sleep(API_LATENCY)
+    seen.setdefault(user_id, []).append(seq)
+
+
+async def sequential(burst):
+    seen, latencies = {}, []
+    started = time.perf_counter()
+    for update in burst:
+        await handle(update, seen)
+        latencies.append(time.perf_counter() - started)
+    return seen, latencies
+
+
+async def with_lanes(burst):
+    lanes = UserLanes()
+    slots = asyncio.Semaphore(CONCURRENCY)
+    seen, latencies = {}, []
+    started = time.perf_counter()
+
+    async def in_slot(update):
+        async with slots:
+            await handle(update, seen)
+
+    async def process(update):
+        # Lane first, as in UserLaneUpdateProcessor
+        await lanes.run(update[0], in_slot(update))
+        latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(asyncio.create_task(process(update)) for update in burst))
+    assert not len(lanes), "lanes must be released once idle"
+    return seen, latencies
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    per_user = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    burst = make_burst(users, per_user)
+
+    print(f"users={users} updates={len(burst)} api_latency={API_LATENCY * 1000:.0f} ms "
+          f"concurrency={CONCURRENCY}")
+    for name, runner in (("sequential", sequential), ("per-user lanes", with_lanes)):
+        started = time.perf_counter()
+        seen, latencies = asyncio.run(runner(burst))
+        elapsed = time.perf_counter() - started
+
+        ordered = all(seqs == sorted(seqs) for seqs in seen.values())
+        print(f"{name:15} {len(burst) / elapsed:8.1f} updates/s "
+              f"p50={percentile(latencies, 0.5) * 1000:8.1f} ms "
+              f"p95={percentile(latencies, 0.95) * 1000:8.1f} ms "
+              f"per-user order={'kept' if ordered else 'BROKEN'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""A peak of sessions on one event loop, without and with the OverloadController.
+
+Updates go through the real UserLaneUpdateProcessor. Progress edits,
+/stats renders, help texts, timer controls and phase notifications each
+cost a fixed amount of CPU, busy-waited on the loop. The sessions' edits
+alone ask for more CPU than there is, so without shedding every update
+waits behind them. Reports the latency of timer controls, how late
+phase notifications go out, and what was shed.
+
+Usage: python benchmarks/bench_overload.py [sessions] [seconds]
+"""
+import asyncio
+import logging
+import os
+import random
+import sys
+import time
+from collections import Counter
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram import Chat, Message, Update, User  # noqa: E402
+
+from overload import HELP, PROGRESS, STATS, STATS_RENDER, OverloadController  # noqa: E402
+from update_processor import UserLaneUpdateProcessor  # noqa: E402
+
+EDIT_EVERY = 0.5  # Seconds between progress edits of a session
+COST = {PROGRESS: 2.0, STATS_RENDER: 10.0, HELP: 1.0, "control": 0.5, "notify": 0.5}  # ms of CPU
+RATES = {"/stats": 20, "/help": 20, "/stop": 10}  # Updates per second
+
+
+def cpu(ms):
+    end = time.perf_counter() + ms / 1000
+    while time.perf_counter() < end:
+        pass
+
+
+def make_update(update_id, user_id, text):
+    user = User(user_id, "user", False)
+    return Update(update_id, message=Message(update_id, datetime.now(), Chat(user_id, "private"),
+                                             from_user=user, text=text))
+
+
+def percentile(values, share):
+    return sorted(values)[int(len(values) * share)] * 1000 if values else 0.0
+
+
+async def run(shedding, sessions, seconds):
+    overload = OverloadController(elevated_lag=0.05, overloaded_lag=0.2, elevated_depth=100,
+                                  overloaded_depth=300, interval=0.1, cooldown=1.0) if shedding else None
+    processor = UserLaneUpdateProcessor(64, overload=overload,
+                                        low_value={"/help": HELP, "/stats": STATS})
+    done = Counter()
+    control_latency, notify_late = [], []
+    stop = time.perf_counter() + seconds
+    rng = random.Random(1)
+
+    async def progress(session):
+        await asyncio.sleep(rng.random() * EDIT_EVERY)
+        while time.perf_counter() < stop:
+            await asyncio.sleep(EDIT_EVERY)
+            if overload and overload.shed(PROGRESS):
+                continue
+            cpu(COST[PROGRESS])
+            done["edits"] += 1
+
+    async def phases(session):
+        # Every session's phase ends once during the run
+        due = time.perf_counter() + rng.random() * seconds
+        await asyncio.sleep(due - time.perf_counter())
+        cpu(COST["notify"])
+        notify_late.append(time.perf_counter() - due)
+
+    async def handle(text, received):
+        await asyncio.sleep(0)
+        if text == "/stop":
+            cpu(COST["control"])
+            control_latency.append(time.perf_counter() - received)
+        elif text == "/help":
+            cpu(COST[HELP])
+            done["help"] += 1
+        elif overload and overload.shed(STATS_RENDER):
+            done["stats stale"] += 1
+        else:
+            cpu(COST[STATS_RENDER])
+            done["stats"] += 1
+
+    async def arrivals():
+        update_id = 0
+        tasks = set()
+        started = time.perf_counter()
+        sent = Counter()
+        while time.perf_counter() < stop:
+            await asyncio.sleep(0.01)
+            elapsed = time.perf_counter() - started
+            for text, rate in RATES.items():
+                while sent[text] < elapsed * rate:
+                    sent[text] += 1
+                    update_id += 1
+                    update = make_update(update_id, 1000 + update_id % 500, text)
+                    task = asyncio.create_task(processor.process_update(
+                        update, handle(text, time.perf_counter())))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+        await asyncio.gather(*tasks)
+
+    if overload:
+        overload.start()
+    await asyncio.gather(arrivals(), *(progress(s) for s in range(sessions)),
+                         *(phases(s) for s in range(sessions)))
+    if overload:
+        await overload.stop()
+    return done, control_latency, notify_late, overload.stats() if overload else None
+
+
+def main():
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 8
+    demand = sessions / EDIT_EVERY * COST[PROGRESS] / 1000
+    print(f"{sessions} sessions editing every {EDIT_EVERY:g} s ({demand:.1f} s of CPU per second), "
+          f"{RATES} per second, {seconds:g} s")
+    # Level changes are logged as warnings, the summary below covers them
+    logging.getLogger("overload").setLevel(logging.ERROR)
+    for shedding in (False, True):
+        done, control, notify, stats = asyncio.run(run(shedding, sessions, seconds))
+        name = "shedding" if shedding else "no shedding"
+        print(f"{name:>11}: /stop p50 {percentile(control, 0.5):4.0f} ms "
+              f"p95 {percentile(control, 0.95):4.0f} ms ({len(control)} done), "
+              f"notifications late p95 {percentile(notify, 0.95):4.0f} ms, "
+              f"done {dict(done)}")
+        if stats:
+            print(f"{'':>11}  shed {stats['shed']}, seconds {stats['seconds']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Per-update persistence overhead: single pickle blob vs. SqliteStore.
+
+Usage: python benchmarks/bench_persistence.py [users] [updates]
+"""
+import asyncio
+import os
+import pickle
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlite_store import SqliteStore  # noqa: E402
+
+
+def make_user_data():
+    return {
+        "session": {"subject": "Математика", "work_time": 25, "break_time": 5,
+                    "total_work_time": 1500.0, "total_work_sessions": 3},
+        "adding_subject": False,
+        "last_activity": time.time(),
+    }
+
+
+def bench_pickle_blob(users, updates, path):
+    """Stock behaviour: rewrite the whole pickle on every update."""
+    data = {user_id: make_user_data() for user_id in range(users)}
+    started = time.perf_counter()
+    for _ in range(updates):
+        user_id = random.randrange(users)
+        data[user_id]["last_activity"] = time.time()
+        with open(path, "wb") as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return (time.perf_counter() - started) / updates
+
+
+async def bench_store(users, updates, path, updates_per_second=200):
+    """SqliteStore with a debounce window, as driven by the bot under load."""
+    store = SqliteStore(path, flush_delay=3600)
+    data = {user_id: make_user_data() for user_id in range(users)}
+    batch_size = max(1, updates_per_second)  # one flush per simulated second
+
+    loop_seconds = 0.0
+    started = time.perf_counter()
+    for i in range(updates):
+        user_id = random.randrange(users)
+        data[user_id]["last_activity"] = time.time()
+        t = time.perf_counter()
+        store.put("user", str(user_id), data[user_id])
+        loop_seconds += time.perf_counter() - t
+        if (i + 1) % batch_size == 0:
+            # Serialization and writes run in a worker thread
+            await store.flush()
+    await store.flush()
+    total = time.perf_counter() - started
+    store.close()
+    return loop_seconds / updates, total / updates, store.stats()
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    updates = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        blob = bench_pickle_blob(users, updates, os.path.join(tmp, "state.pickle"))
+        on_loop, total, stats = asyncio.run(
+            bench_store(users, updates, os.path.join(tmp, "state.sqlite3")))
+
+    print(f"users={users} updates={updates}")
+    print(f"pickle blob rewrite : {blob * 1e6:10.1f} µs/update (all on the event loop)")
+    print(f"sqlite store        : {total * 1e6:10.1f} µs/update total, "
+          f"{on_loop * 1e6:.2f} µs/update on the event loop")
+    print(f"rows written={stats['rows_written']} flushes={stats['flushes']}")
+
+
+if __name__ == "__main__":
+    main()
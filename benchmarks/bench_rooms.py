@@ -0,0 +1,110 @@
+"""API calls and CPU: 30 individual timers vs. one 30-member study room.
+
+Individual timers are modelled as 30 single-member rooms, each with its own
+task, live message and statistics write. Sleeps are instant.
+
+Usage: python benchmarks/bench_rooms.py [members] [cycles]
+"""
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cadence  # noqa: E402
+from formatting import create_progress_bar  # noqa: E402
+from rooms import RoomManager  # noqa: E402
+
+
+class FakeMessage:
+    def __init__(self, message_id):
+        self.message_id = message_id
+
+
+class FakeBot:
+    def __init__(self):
+        self.calls = 0
+
+    async def send_message(self, **kwargs):
+        self.calls += 1
+        return FakeMessage(self.calls)
+
+    async def edit_message_text(self, **kwargs):
+        self.calls += 1
+
+
+class FileStats:
+    """Stats writer with the same read-all/write-all cost as user_data.json."""
+
+    def __init__(self, path):
+        self.path = path
+        self.writes = 0
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({str(i): {"stats": {}, "custom_subjects": []} for i in range(2000)}, f)
+
+    def __call__(self, credits):
+        with open(self.path, encoding="utf-8") as f:
+            data = json.load(f)
+        for user_id, subject, work_time, intervals, sessions in credits:
+            stats = data.setdefault(str(user_id), {"stats": {}})["stats"].setdefault(
+                subject, {"total_sessions": 0, "total_work_time": 0, "total_work_intervals": 0})
+            stats["total_sessions"] += sessions
+            stats["total_work_time"] += work_time
+            stats["total_work_intervals"] += intervals
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        self.writes += 1
+
+
+async def instant_sleep(seconds):
+    await asyncio.sleep(0)
+
+
+async def run(rooms_spec, cycles, stats_path):
+    bot = FakeBot()
+    stats = FileStats(stats_path)
+    manager = RoomManager(stats, create_progress_bar, cadence.CadencePolicy(edit_budget=float("inf")),
+                          sleep=instant_sleep)
+
+    rooms = []
+    user_id = 1
+    for members, shared_chat in rooms_spec:
+        owner = user_id
+        room = manager.create(owner, shared_chat or owner, "Математика", 25, 5)
+        user_id += 1
+        for _ in range(members - 1):
+            await manager.join(bot, user_id, shared_chat or user_id, room.code)
+            user_id += 1
+        rooms.append(room)
+
+    started = time.process_time()
+    for room in rooms:
+        manager.start(bot, room)
+    while any(room.cycles < cycles for room in rooms):
+        await asyncio.sleep(0)
+    for room in rooms:
+        await manager.stop(bot, room)
+    return bot.calls, stats.writes, time.process_time() - started
+
+
+def main():
+    members = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    cycles = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+
+    scenarios = [
+        ("individual timers", [(1, None)] * members),
+        ("room in a group chat", [(members, -100)]),
+        ("room via invites", [(members, None)]),
+    ]
+    print(f"members={members} cycles={cycles} (25/5)")
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, spec in scenarios:
+            calls, writes, cpu = asyncio.run(run(spec, cycles, os.path.join(tmp, "user_data.json")))
+            print(f"{name:22} api_calls={calls:5} stats_writes={writes:4} cpu={cpu * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
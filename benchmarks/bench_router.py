@@ -0,0 +1,102 @@
+"""Reply-keyboard dispatch cost: ordered regex chain vs. exact-text table.
+
+Usage: python benchmarks/bench_router.py [updates]
+"""
+import asyncio
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from router import TextRouter  # noqa: E402
+
+
+async def handler(update, context):
+    return None
+
+
+# Handler order of the RUNNING state and the global handlers before the router
+REGEX_CHAIN = [
+    "❌ Остановить таймер",
+    "⏹ Стоп",
+    "⏸️ Пауза/▶️ Продолжить",
+    "❓ Помощь",
+    "📊 Статистика",
+    "❓ Помощь",
+]
+
+TRAFFIC = [
+    "⏸️ Пауза/▶️ Продолжить",
+    "📊 Статистика",
+    "❌ Остановить таймер",
+    "❓ Помощь",
+    "25",
+    "Подготовка к экзамену по истории",
+]
+
+
+class Message:
+    __slots__ = ("text",)
+
+    def __init__(self, text):
+        self.text = text
+
+
+class Update:
+    __slots__ = ("message",)
+
+    def __init__(self, text):
+        self.message = Message(text)
+
+
+def bench_regex(updates):
+    # filters.Regex compiles once and calls .search() per update
+    chain = [(re.compile(pattern), handler) for pattern in REGEX_CHAIN]
+    started = time.perf_counter()
+    for update in updates:
+        text = update.message.text
+        for pattern, callback in chain:
+            if pattern.search(text):
+                break
+    return (time.perf_counter() - started) / len(updates)
+
+
+def bench_router(updates):
+    router = TextRouter({pattern: handler for pattern in REGEX_CHAIN})
+    routes = router.routes
+    started = time.perf_counter()
+    for update in updates:
+        # filters.Text membership check, then the table lookup in dispatch
+        if update.message.text in routes:
+            router.resolve(update.message.text)
+    return (time.perf_counter() - started) / len(updates)
+
+
+async def bench_dispatch(updates):
+    router = TextRouter({pattern: handler for pattern in REGEX_CHAIN})
+    started = time.perf_counter()
+    for update in updates:
+        if update.message.text in router.routes:
+            await router.dispatch(update, None)
+    return (time.perf_counter() - started) / len(updates)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    updates = [Update(random.choice(TRAFFIC)) for _ in range(count)]
+
+    regex = bench_regex(updates)
+    table = bench_router(updates)
+    dispatch = asyncio.run(bench_dispatch(updates))
+
+    print(f"updates={count}")
+    print(f"regex chain : {regex * 1e9:8.0f} ns/update")
+    print(f"text table  : {table * 1e9:8.0f} ns/update")
+    print(f"table + await dispatch: {dispatch * 1e9:8.0f} ns/update")
+
+
+if __name__ == "__main__":
+    main()
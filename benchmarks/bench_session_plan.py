@@ -0,0 +1,65 @@
+"""Time past end_time: end checked between cycles vs. a plan truncated at it.
+
+Before plans, run_timer checked end_time only before each work phase, so
+a session ran on until the cycle in progress was over. Also times
+compiling a plan and looking up a phase.
+
+Usage: python benchmarks/bench_session_plan.py [sessions]
+"""
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from session_plan import compile_plan  # noqa: E402
+
+WORK_TIMES = [15, 25, 30, 45, 50, 60, 90]
+BREAK_TIMES = [5, 10, 15]
+
+
+def checked_between_cycles(work, rest, minutes):
+    """Minutes a session ran when end_time was checked before each work phase."""
+    elapsed = 0
+    while elapsed < minutes:
+        elapsed += work + rest
+    return elapsed
+
+
+def main():
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    rng = random.Random(1)
+    start = datetime(2024, 5, 1, 9, 0)
+    cases = [(rng.choice(WORK_TIMES), rng.choice(BREAK_TIMES), rng.randint(10, 240))
+             for _ in range(sessions)]
+
+    overrun = [checked_between_cycles(work, rest, minutes) - minutes for work, rest, minutes in cases]
+
+    started = time.perf_counter()
+    plans = [compile_plan(work, rest, start, start + timedelta(minutes=minutes))
+             for work, rest, minutes in cases]
+    compile_seconds = (time.perf_counter() - started) / sessions
+    planned = [max(0, (plan.phases[-1].end - start) / timedelta(minutes=1) - minutes) if plan.phases else 0
+               for plan, (work, rest, minutes) in zip(plans, cases)]
+
+    started = time.perf_counter()
+    lookups = 0
+    for plan in plans:
+        index = 0
+        while plan.phase(index) is not None:
+            index += 1
+        lookups += index + 1
+    lookup_seconds = (time.perf_counter() - started) / lookups
+
+    print(f"{sessions} sessions, 10-240 min, work {WORK_TIMES}, breaks {BREAK_TIMES}")
+    print(f"checked between cycles: {sum(overrun) / sessions:5.1f} min past end_time on average, "
+          f"{max(overrun)} at most, {sum(o > 0 for o in overrun) / sessions:.0%} of sessions")
+    print(f"plan                  : {sum(planned) / sessions:5.1f} min past end_time on average, "
+          f"{max(planned):.0f} at most")
+    print(f"compile_plan: {compile_seconds * 1e6:.1f} µs per session, phase(): {lookup_seconds * 1e9:.0f} ns")
+
+
+if __name__ == "__main__":
+    main()
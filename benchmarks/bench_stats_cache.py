@@ -0,0 +1,67 @@
+"""Cost of a "📊 Статистика" tap: load and render every time vs. the stats cache.
+
+Usage: python benchmarks/bench_stats_cache.py [users] [taps]
+"""
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SUBJECTS = ["Математика", "Физика", "Химия", "Биология", "История Беларуси", "Английский язык"]
+
+
+def write_user_data(path, users, rng):
+    data = {}
+    for user_id in range(users):
+        stats = {subject: {"total_sessions": rng.randint(1, 50),
+                           "total_work_time": rng.randint(600, 200000),
+                           "total_work_intervals": rng.randint(1, 200),
+                           "last_session": "2024-05-01 18:30"}
+                 for subject in rng.sample(SUBJECTS, 4)}
+        data[str(user_id)] = {"stats": stats, "custom_subjects": []}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    taps = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    rng = random.Random(1)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["USER_DATA_FILE"] = os.path.join(tmp, "user_data.json")
+        write_user_data(os.environ["USER_DATA_FILE"], users, rng)
+
+        import main as bot
+
+        # Most taps come from a small group of active users
+        tappers = [str(rng.randrange(50)) for _ in range(taps)]
+
+        started = time.perf_counter()
+        for user_id in tappers:
+            bot.render_stats(bot.load_user_data().get(user_id, {}).get("stats"))
+        uncached = (time.perf_counter() - started) / taps
+
+        started = time.perf_counter()
+        for i, user_id in enumerate(tappers):
+            if i % 50 == 0:
+                # A session ends now and then and invalidates one user
+                bot.stats_cache.bump(user_id)
+            rendered = bot.stats_cache.get(user_id)
+            if rendered is None:
+                version = bot.stats_cache.version(user_id)
+                rendered = bot.render_stats(bot.load_user_data().get(user_id, {}).get("stats"))
+                bot.stats_cache.put(user_id, version, rendered)
+        cached = (time.perf_counter() - started) / taps
+
+    print(f"users={users} taps={taps}")
+    print(f"load and render : {uncached * 1e6:10.1f} µs/tap")
+    print(f"stats cache     : {cached * 1e6:10.1f} µs/tap  {bot.stats_cache.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Render cost per message: compiled templates vs. escaping the whole f-string result.
+
+The naive version builds the message with an f-string and then escapes
+everything except the markup characters, on every render.
+
+Usage: python benchmarks/bench_templates.py [iterations]
+"""
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from formatting import create_progress_bar  # noqa: E402
+from main import WORK_PROGRESS  # noqa: E402
+from templates import MARKUP, SPECIAL, escape  # noqa: E402
+
+SUBJECTS = ["Математика", "C++ (основы)", "История Беларуси", "my_notes.md", "Физика"]
+
+
+def naive(subject, minutes, seconds, until, progress):
+    text = (f"🚀 *Работа над предметом*\n\n"
+            f"📚 Предмет: *{subject}*\n"
+            f"⏱️ Осталось: *{minutes}* мин *{seconds}* сек\n"
+            f"🕒 До: *{until.strftime('%H:%M')}*\n\n"
+            f"{progress}")
+    # Can't tell markup from values any more, so a "_" in a subject still breaks it
+    return "".join("\\" + char if char in SPECIAL and char not in MARKUP else char for char in text)
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    until = datetime(2024, 5, 1, 18, 30)
+    progress = [create_progress_bar(minute, 25) for minute in range(26)]
+    args = [(SUBJECTS[i % len(SUBJECTS)], 24 - i % 25, i % 60, until, progress[i % 26])
+            for i in range(1000)]
+
+    def run(render):
+        started = time.perf_counter()
+        for i in range(iterations):
+            subject, minutes, seconds, end, bar = args[i % 1000]
+            render(subject=subject, minutes=minutes, seconds=seconds, until=end, progress=bar)
+        return (time.perf_counter() - started) / iterations
+
+    results = {
+        "f-string + escape": run(lambda **values: naive(**values)),
+        "template": run(WORK_PROGRESS.render),
+    }
+
+    for name, seconds in results.items():
+        print(f"{name:>26}: {seconds * 1e6:6.2f} µs per message")
+    print("escape cache:", escape.cache_info())
+
+
+if __name__ == "__main__":
+    main()
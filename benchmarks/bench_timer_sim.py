@@ -0,0 +1,81 @@
+"""Scheduler overhead of run_timer for many sessions over a simulated day.
+
+Every session runs the real run_timer loop on a VirtualClock with an
+instant fake bot, starts at a random time of the day and ends at its
+end_time after one to four hours. Statistics credits are counted instead
+of written, so the figures are the cost of the timer engine itself.
+
+Usage: python benchmarks/bench_timer_sim.py [sessions]
+"""
+import asyncio
+import os
+import random
+import sys
+import time
+from collections import Counter
+from datetime import timedelta
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main as bot  # noqa: E402
+from clock import VirtualClock  # noqa: E402
+
+SETTINGS = [(25, 5), (45, 15), (50, 10)]
+
+
+class FakeBot:
+    def __init__(self):
+        self.calls = Counter()
+
+    async def send_message(self, **kwargs):
+        self.calls["sendMessage"] += 1
+        return SimpleNamespace(message_id=self.calls["sendMessage"])
+
+    async def edit_message_text(self, **kwargs):
+        self.calls["editMessageText"] += 1
+
+
+async def simulate(sessions, seed=1):
+    rng = random.Random(seed)
+    clock = VirtualClock()
+    bot.use_timer_clock(clock)
+    fake_bot = FakeBot()
+    credits = 0
+
+    async def count_credit(user_id, session):
+        nonlocal credits
+        credits += 1
+
+    bot.update_statistics = count_credit
+
+    async def one_session(user_id):
+        await clock.sleep(rng.randrange(20 * 3600))
+        session = bot.UserSession()
+        session.subject = "Математика"
+        session.work_time, session.break_time = rng.choice(SETTINGS)
+        session.is_working = True
+        session.end_time = clock.now() + timedelta(minutes=rng.randint(60, 240))
+        bot.active_timers[user_id] = session
+
+        update = SimpleNamespace(effective_chat=SimpleNamespace(id=user_id))
+        context = SimpleNamespace(bot=fake_bot, user_data={})
+        await bot.run_timer(update, context, user_id)
+
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+    await asyncio.gather(*(one_session(user_id) for user_id in range(1, sessions + 1)))
+    return (time.perf_counter() - started, time.process_time() - cpu_started,
+            clock.elapsed, clock.wakeups, fake_bot.calls, credits)
+
+
+def main():
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    wall, cpu, simulated, wakeups, calls, credits = asyncio.run(simulate(sessions))
+    print(f"sessions={sessions} simulated={simulated / 3600:.1f} h in {wall:.1f} s wall, {cpu:.1f} s CPU")
+    print(f"wake-ups={wakeups} ({cpu / max(wakeups, 1) * 1e6:.1f} µs CPU each) "
+          f"bot calls={dict(calls)} credited={credits}")
+
+
+if __name__ == "__main__":
+    main()
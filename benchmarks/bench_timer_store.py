@@ -0,0 +1,134 @@
+"""Timer store writes per session, round-trip cost and takeover by other workers.
+
+Runs the real run_timer loop on a VirtualClock against the key-value
+stand-in, and compares the writes with the ticks a per-tick design would
+write. Then times puts over the network and lets two workers race for
+the sessions of a third whose heartbeat lapsed.
+
+Usage: python benchmarks/bench_timer_store.py [cycles] [puts]
+"""
+import asyncio
+import os
+import sys
+import time
+from datetime import timedelta
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main as bot  # noqa: E402
+from clock import VirtualClock  # noqa: E402
+from kv_server import KVServer  # noqa: E402
+from timer_state import WORK, KVTimerStore, TimerState  # noqa: E402
+
+WORK_MINUTES, BREAK_MINUTES = 25, 5
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = 0
+
+    async def send_message(self, **kwargs):
+        self.sent += 1
+        return SimpleNamespace(message_id=self.sent)
+
+    async def edit_message_text(self, **kwargs):
+        pass
+
+
+async def no_credit(user_id, session):
+    pass
+
+
+async def session_writes(server, cycles):
+    store = KVTimerStore(server.host, server.port)
+    bot.use_timer_store(store)
+    clock = VirtualClock()
+    bot.use_timer_clock(clock)
+    ticks = 0
+    tick = bot.timer_tasks.tick
+
+    def count_tick(user_id):
+        nonlocal ticks
+        ticks += 1
+        tick(user_id)
+
+    bot.timer_tasks.tick = count_tick
+    session = bot.UserSession()
+    session.subject = "Математика"
+    session.work_time, session.break_time = WORK_MINUTES, BREAK_MINUTES
+    session.is_working = True
+    session.end_time = clock.now() + timedelta(minutes=cycles * (WORK_MINUTES + BREAK_MINUTES))
+    bot.active_timers[1] = session
+    commands = server.commands
+
+    update = SimpleNamespace(effective_chat=SimpleNamespace(id=1))
+    await bot.run_timer(update, SimpleNamespace(bot=FakeBot(), user_data={}), 1)
+    await store.close()
+    bot.timer_tasks.tick = tick
+    return store.stats(), server.commands - commands, ticks
+
+
+async def put_latency(server, puts):
+    store = KVTimerStore(server.host, server.port)
+    state = TimerState(1, 1, "worker", "Математика", WORK, time.time() + 1500,
+                       work_time=WORK_MINUTES, break_time=BREAK_MINUTES, message_id=1)
+    started = time.perf_counter()
+    for i in range(puts):
+        state.deadline += 1
+        await store.put(state)
+    elapsed = time.perf_counter() - started
+    await store.delete(1)
+    await store.close()
+    return elapsed / puts
+
+
+async def takeover(server, sessions):
+    dead, first, second = (KVTimerStore(server.host, server.port, prefix="takeover:") for _ in range(3))
+    # Half of the sessions are paused, and due a while ago otherwise
+    for user_id in range(sessions):
+        paused_at = time.time() if user_id % 2 else None
+        await dead.put(TimerState(user_id, user_id, "dead", "Физика", WORK, time.time() - 60 - user_id,
+                                  paused_at=paused_at))
+    # Written after the states, so its lifetime doesn't depend on how long they took
+    await dead.heartbeat("dead", 0.2)
+    for worker, store in (("first", first), ("second", second)):
+        await store.heartbeat(worker, 60)
+
+    alive = await asyncio.gather(first.orphaned("first"), second.orphaned("second"))
+    await asyncio.sleep(0.3)
+    # A later scan, as watch_timer_store runs them after the one at startup
+    due_before = time.time() - 30
+    claimed = await asyncio.gather(first.orphaned("first", due_before=due_before),
+                                   second.orphaned("second", due_before=due_before))
+    for store in (dead, first, second):
+        await store.close()
+    return sum(map(len, alive)), [len(states) for states in claimed]
+
+
+async def run(cycles, puts):
+    server = await KVServer(port=0).start()
+    try:
+        stats, commands, ticks = await session_writes(server, cycles)
+        print(f"{cycles} cycles of {WORK_MINUTES}/{BREAK_MINUTES} min: {stats['writes']} state writes, "
+              f"{stats['deletes']} delete, {commands} server commands; a write per tick would be {ticks}")
+
+        seconds = await put_latency(server, puts)
+        print(f"put over loopback: {seconds * 1e6:.0f} µs ({1 / seconds:.0f} puts/s, 2 commands pipelined)")
+
+        before, claimed = await takeover(server, 200)
+        print(f"200 sessions of a worker, 100 of them paused: {before} taken while its heartbeat "
+              f"lived, {claimed} claimed by two workers after it lapsed, total {sum(claimed)}")
+    finally:
+        await server.close()
+
+
+def main():
+    cycles = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    puts = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    bot.update_statistics = no_credit
+    asyncio.run(run(cycles, puts))
+
+
+if __name__ == "__main__":
+    main()
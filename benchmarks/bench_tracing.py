@@ -0,0 +1,54 @@
+"""Cost of span() with tracing off, and of a traced update with a few spans.
+
+Usage: python benchmarks/bench_tracing.py [iterations]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tracing import Tracer, span  # noqa: E402
+
+
+async def handler():
+    with span("storage.load"):
+        pass
+    with span("render.stats"):
+        pass
+    with span("bot_api.sendMessage", pool="outbound"):
+        pass
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    started = time.perf_counter()
+    for _ in range(iterations):
+        with span("storage.load"):
+            pass
+    off = (time.perf_counter() - started) / iterations
+
+    async def traced(tracer, count):
+        for _ in range(count):
+            await tracer.run("update", handler(), kind="message", lane=1)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for sample_rate in (0.0, 0.01, 1.0):
+            tracer = Tracer(os.path.join(tmp, f"trace-{sample_rate}.jsonl"), sample_rate, slow_ms=500)
+            count = iterations // 10
+            started = time.perf_counter()
+            asyncio.run(traced(tracer, count))
+            results[sample_rate] = (time.perf_counter() - started) / count
+            tracer.close()
+
+    print(f"span() outside a trace      : {off * 1e9:8.0f} ns")
+    for sample_rate, seconds in results.items():
+        print(f"update with 3 spans, kept {sample_rate:4.0%}: {seconds * 1e6:8.1f} µs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Render every template in main.py and rooms.py with random malformed subjects.
+
+Each result is checked against the MarkdownV2 rules: every special
+character is escaped or is balanced markup, and a subject never shows up
+as markup. Prints the first failing case and exits with 1.
+
+Usage: python benchmarks/fuzz_templates.py [cases] [seed]
+"""
+import os
+import random
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+import rooms  # noqa: E402
+from templates import MARKUP, SPECIAL, Markup, Template, escape  # noqa: E402
+
+ALPHABET = SPECIAL + "ab яю 12\n\t\\\\📚"
+
+
+def check(text):
+    """Return why text isn't valid MarkdownV2 as the templates use it, or None."""
+    open_markup = []
+    i = 0
+    while i < len(text):
+        char = text[i]
+        if char == "\\":
+            if i + 1 >= len(text) or text[i + 1] not in SPECIAL:
+                return f"stray backslash at {i}"
+            i += 2
+            continue
+        if char in MARKUP:
+            if open_markup and open_markup[-1] == char:
+                open_markup.pop()
+            elif char == "`" and "`" in open_markup:
+                return f"` closed across other markup at {i}"
+            else:
+                open_markup.append(char)
+        elif char in SPECIAL:
+            return f"unescaped {char!r} at {i}"
+        i += 1
+    if open_markup:
+        return f"unclosed {''.join(open_markup)}"
+    return None
+
+
+def subject(rng):
+    return "".join(rng.choice(ALPHABET) for _ in range(rng.randint(0, 24)))
+
+
+def templates():
+    for module in (main, rooms):
+        for name, value in vars(module).items():
+            if isinstance(value, Template):
+                yield f"{module.__name__}.{name}", value
+
+
+def values(template, rng):
+    now = datetime(2024, 5, 1, rng.randint(0, 23), rng.randint(0, 59))
+    result = {}
+    for part in template._parts:
+        if part.__class__ is str:
+            continue
+        field, spec = part
+        if spec:
+            result[field] = now
+        elif field in ("summary", "subjects", "header", "help"):
+            result[field] = Markup(escape(subject(rng)))
+        else:
+            result[field] = subject(rng)
+    return result
+
+
+def fuzz():
+    cases = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    rng = random.Random(int(sys.argv[2]) if len(sys.argv) > 2 else 1)
+    compiled = list(templates())
+
+    # Templates the bot renders without values have to be valid too
+    for name in ("PAUSED_SCREEN", "RESUMED_SCREEN", "STATS_EMPTY", "WORK_TIME_HELP"):
+        problem = check(getattr(main, name))
+        if problem:
+            print(f"main.{name}: {problem}")
+            return 1
+
+    for case in range(cases):
+        name, template = rng.choice(compiled)
+        kwargs = values(template, rng)
+        text = template.render(**kwargs)
+        problem = check(text)
+        if problem is None and any(value and value not in text for value in kwargs.values()
+                                   if isinstance(value, str) and not isinstance(value, Markup)
+                                   and not set(value) & set(SPECIAL)):
+            problem = "value lost"
+        if problem:
+            print(f"case {case}, {name}: {problem}\n  values: {kwargs!r}\n  text: {text!r}")
+            return 1
+
+    stats = main.render_stats({subject(rng): {"total_sessions": 1, "total_work_time": 60,
+                                              "total_work_intervals": 1, "last_session": subject(rng)}
+                               for _ in range(20)})[0]
+    problem = check(stats)
+    if problem:
+        print(f"render_stats: {problem}\n  text: {stats!r}")
+        return 1
+
+    print(f"{cases} renders of {len(compiled)} templates, all valid MarkdownV2")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(fuzz())
@@ -0,0 +1,265 @@
+"""Admin announcements to every user, paced below the bot's own traffic.
+
+A broadcast first streams the user ids out of storage into an audience
+file, then sends to them in order. Its cursor, the position in the
+audience, is saved to a small JSON file every `save_every` users and
+whenever it stops, so a restarted bot carries on where it was and sends
+to nobody twice, except for the few users since the last save. An
+unexpected error pauses it at its cursor and tells the admin.
+
+Sends are paced to `share` of the Bot API budget of `budget` messages a
+second. Bot API traffic of the rest of the bot, measured by `traffic`,
+comes first: the broadcast only uses what it leaves of the budget, and
+waits while the circuit breaker is open.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TelegramError
+
+from cadence import ApiPressure
+
+logger = logging.getLogger(__name__)
+
+RUNNING = "running"
+PAUSED = "paused"
+DONE = "done"
+CANCELLED = "cancelled"
+
+# Slowest pace while the rest of the bot uses up the whole budget, per second
+MIN_RATE = 0.2
+
+
+class BroadcastError(Exception):
+    """Raised for broadcast operations that can't be performed, carries a user-facing message."""
+
+
+class BroadcastJob:
+    """One broadcast, everything needed to resume it."""
+
+    def __init__(self, text, chat_id, total=0, position=0, status=RUNNING, report_message_id=None,
+                 sent=0, blocked=0, failed=0, started_at=None):
+        self.text = text
+        self.chat_id = chat_id  # Admin chat that gets the progress report
+        self.total = total  # Users in the audience
+        self.position = position  # Users done, the cursor into the audience
+        self.status = status
+        self.report_message_id = report_message_id
+        self.sent = sent
+        self.blocked = blocked  # Users who blocked the bot
+        self.failed = failed
+        self.started_at = started_at or time.time()
+
+    def as_dict(self):
+        return dict(vars(self))
+
+    def format(self):
+        percent = self.position / self.total * 100 if self.total else 100
+        return (f"📣 Рассылка: {STATUS_NAMES[self.status]}\n"
+                f"Обработано {self.position} из {self.total} ({percent:.0f}%)\n"
+                f"Доставлено: {self.sent}, бот заблокирован: {self.blocked}, ошибок: {self.failed}")
+
+
+STATUS_NAMES = {RUNNING: "идет", PAUSED: "на паузе", DONE: "завершена", CANCELLED: "отменена"}
+
+
+class Broadcaster:
+    """Runs at most one broadcast at a time, see the module docstring."""
+
+    def __init__(self, state_path, user_ids, budget=30.0, share=0.2, traffic=None, circuit=None,
+                 save_every=50, report_every=30.0, clock=time.monotonic, sleep=asyncio.sleep):
+        self.state_path = state_path
+        self.audience_path = state_path + ".audience"
+        self.user_ids = user_ids  # Callable returning an iterator over all user ids in storage
+        self.budget = budget
+        self.share = share
+        self.traffic = traffic  # ApiPressure of all outbound Bot API calls, this broadcast's included
+        self.circuit = circuit
+        self.save_every = save_every
+        self.report_every = report_every
+        self.clock = clock
+        self.sleep = sleep
+        self.own = ApiPressure(clock=clock)
+        self.job = None
+        self.task = None
+
+    @property
+    def is_running(self):
+        return self.task is not None and not self.task.done()
+
+    def load(self):
+        """Read a saved broadcast, returns it if it should carry on."""
+        try:
+            with open(self.state_path, encoding="utf-8") as f:
+                self.job = BroadcastJob(**json.load(f))
+        except FileNotFoundError:
+            return None
+        except (ValueError, TypeError) as e:
+            logger.error(f"Error loading broadcast state: {e}")
+            return None
+        return self.job if self.job.status == RUNNING else None
+
+    async def start(self, bot, text, chat_id):
+        if self.job and self.job.status in (RUNNING, PAUSED):
+            raise BroadcastError("Уже есть незавершенная рассылка. Отмени ее командой /broadcast_cancel.")
+        total = await asyncio.to_thread(self._write_audience)
+        self.job = BroadcastJob(text, chat_id, total=total)
+        self._save()
+        self.resume(bot)
+        return self.job
+
+    def resume(self, bot):
+        if self.job is None or self.job.status not in (RUNNING, PAUSED):
+            raise BroadcastError("Нет рассылки, которую можно продолжить.")
+        if self.is_running:
+            return
+        self.job.status = RUNNING
+        self.task = asyncio.create_task(self._run(bot))
+
+    async def pause(self):
+        await self._stop(PAUSED)
+
+    async def cancel(self):
+        await self._stop(CANCELLED)
+
+    async def _stop(self, status):
+        if self.job is None or self.job.status not in (RUNNING, PAUSED):
+            raise BroadcastError("Нет активной рассылки.")
+        if self.task and not self.task.done():
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        self.job.status = status
+        self._save()
+
+    async def shutdown(self):
+        """Save the cursor when the bot stops, a running broadcast resumes at the next start."""
+        if self.is_running:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self._save()
+
+    def _write_audience(self):
+        """Stream the user ids out of storage, one id per line, return how many."""
+        # Storage may be rewritten while it is read, a broken read starts over
+        for attempt in range(3):
+            try:
+                total = 0
+                with open(self.audience_path + ".tmp", "w", encoding="utf-8") as f:
+                    for user_id in self.user_ids():
+                        f.write(f"{user_id}\n")
+                        total += 1
+                os.replace(self.audience_path + ".tmp", self.audience_path)
+                return total
+            except ValueError as e:
+                logger.warning(f"Reading user ids for a broadcast failed, attempt {attempt + 1}: {e}")
+        raise BroadcastError("Не удалось прочитать список пользователей.")
+
+    def _audience(self, position):
+        with open(self.audience_path, encoding="utf-8") as f:
+            for index, line in enumerate(f):
+                if index >= position:
+                    yield int(line)
+
+    def _save(self):
+        """Write the job atomically, so a crash leaves the previous cursor intact."""
+        with open(self.state_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self.job.as_dict(), f, ensure_ascii=False)
+        os.replace(self.state_path + ".tmp", self.state_path)
+
+    def rate(self):
+        """Sends per second allowed right now."""
+        rate = self.budget * self.share
+        if self.traffic is not None:
+            others = max(0.0, self.traffic.rate() - self.own.rate())
+            rate = min(rate, self.budget - others)
+        return max(MIN_RATE, rate)
+
+    async def _run(self, bot):
+        # Anything unexpected pauses the broadcast at its cursor, the admin can resume it
+        try:
+            await self._broadcast(bot)
+        except Exception as e:
+            logger.error(f"Broadcast stopped at user {self.job.position} of {self.job.total}: {e}")
+            self.job.status = PAUSED
+            try:
+                self._save()
+            except OSError as e:
+                logger.error(f"Error saving broadcast state: {e}")
+            await self._report(bot)
+
+    async def _broadcast(self, bot):
+        job = self.job
+        last_report = self.clock()
+        next_send = self.clock()
+        logger.info(f"Broadcast running at user {job.position} of {job.total}")
+        for user_id in self._audience(job.position):
+            while self.circuit and self.circuit.is_open:
+                await self.sleep(1)
+            delay = next_send - self.clock()
+            if delay > 0:
+                await self.sleep(delay)
+            next_send = max(next_send, self.clock() - 1) + 1 / self.rate()
+
+            await self._send(bot, user_id)
+            job.position += 1
+            if job.position % self.save_every == 0:
+                self._save()
+            if self.clock() - last_report >= self.report_every:
+                last_report = self.clock()
+                await self._report(bot)
+
+        job.status = DONE
+        self._save()
+        logger.info(f"Broadcast done: {job.as_dict()}")
+        await self._report(bot)
+
+    async def _send(self, bot, user_id):
+        job = self.job
+        # A 429 names the wait, the same user is tried again after it
+        for attempt in range(3):
+            self.own.record()
+            try:
+                await bot.send_message(chat_id=user_id, text=job.text)
+                job.sent += 1
+                return
+            except RetryAfter as e:
+                await self.sleep(e.retry_after)
+            except Forbidden:
+                job.blocked += 1
+                return
+            except BadRequest as e:
+                logger.warning(f"Broadcast to {user_id} failed: {e}")
+                job.failed += 1
+                return
+            except NetworkError as e:
+                # Retried after a backoff, and once the breaker lets calls through again
+                logger.warning(f"Broadcast to {user_id} failed, retrying: {e}")
+                await self.sleep(2 ** attempt)
+                while self.circuit and self.circuit.is_open:
+                    await self.sleep(1)
+            except TelegramError as e:
+                logger.warning(f"Broadcast to {user_id} failed: {e}")
+                job.failed += 1
+                return
+        job.failed += 1
+
+    async def _report(self, bot):
+        job = self.job
+        try:
+            if job.report_message_id is None:
+                message = await bot.send_message(chat_id=job.chat_id, text=job.format())
+                job.report_message_id = message.message_id
+            else:
+                await bot.edit_message_text(chat_id=job.chat_id, message_id=job.report_message_id,
+                                            text=job.format())
+        except Exception as e:
+            logger.error(f"Error reporting broadcast progress: {e}")
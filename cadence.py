@@ -0,0 +1,74 @@
+import time
+
+# Progress update modes
+ADAPTIVE = "adaptive"        # edit when the progress bar visibly changes
+FIXED = "fixed"              # legacy cadence: every 30 s at work, 15 s at break
+TRANSITIONS = "transitions"  # no progress edits, only phase transitions
+MODES = (ADAPTIVE, FIXED, TRANSITIONS)
+
+LEGACY_WORK_INTERVAL = 30
+LEGACY_BREAK_INTERVAL = 15
+
+
+class ApiPressure:
+    """Approximate rate of progress edits across all sessions."""
+
+    def __init__(self, window=10.0, clock=time.monotonic):
+        self.window = window
+        self.clock = clock
+        self.window_start = clock()
+        self.count = 0
+        self.previous = 0
+
+    def record(self):
+        """Count one outgoing edit."""
+        now = self.clock()
+        if now - self.window_start >= self.window:
+            # A gap longer than one window means the previous window was idle
+            self.previous = self.count if now - self.window_start < 2 * self.window else 0
+            self.count = 0
+            self.window_start = now
+        self.count += 1
+
+    def rate(self):
+        """Edits per second over the last full or current window."""
+        return max(self.previous, self.count) / self.window
+
+
+class CadencePolicy:
+    """Pick the interval between progress edits for a phase.
+
+    In adaptive mode a phase gets one edit per progress bar cell, bounded by
+    `min_interval` and `max_interval`. When the global edit rate exceeds
+    `edit_budget` per second, intervals are stretched proportionally.
+    """
+
+    def __init__(self, mode=ADAPTIVE, bar_width=20, min_interval=15, max_interval=300,
+                 edit_budget=20.0, pressure=None):
+        self.mode = mode if mode in MODES else ADAPTIVE
+        self.bar_width = bar_width
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.edit_budget = edit_budget
+        self.pressure = pressure or ApiPressure()
+
+    def interval(self, phase_seconds, is_break=False, mode=None):
+        """Seconds between progress edits, or None for no edits at all."""
+        mode = mode if mode in MODES else self.mode
+
+        if mode == TRANSITIONS:
+            return None
+        if mode == FIXED:
+            return LEGACY_BREAK_INTERVAL if is_break else LEGACY_WORK_INTERVAL
+
+        interval = phase_seconds / self.bar_width
+        interval = max(self.min_interval, min(self.max_interval, interval))
+
+        rate = self.pressure.rate()
+        if rate > self.edit_budget:
+            interval *= rate / self.edit_budget
+        return interval
+
+    def record_edit(self):
+        """Report an edit so the policy can track API pressure."""
+        self.pressure.record()
@@ -0,0 +1,147 @@
+"""Compact callback-data protocol for inline buttons.
+
+Layout before base64 (URL-safe, unpadded):
+
+    version:u8  action:u8  nonce:u32 (big-endian)  args:varint*
+
+The nonce ties a button to the session that created it, 0 means the button
+is not bound to a session. Payloads stay well below Telegram's 64-byte limit.
+"""
+import base64
+import binascii
+import logging
+import secrets
+from collections import namedtuple
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+VERSION = 1
+
+# Action codes, never reuse a retired code
+WORK = 1
+WORK_CUSTOM = 2
+BREAK = 3
+BREAK_CUSTOM = 4
+START_AT = 5
+START_CUSTOM = 6
+END_AT = 7
+END_NONE = 8
+END_CUSTOM = 9
+HELP = 10
+CANCEL = 11
+STOP = 12
+PAUSE = 13
+RESUME = 14
+SKIP_BREAK = 15
+FORCE_STOP = 16
+RETURN_TO_TIMER = 17
+CLEAR_STATS = 18
+CONFIRM_CLEAR_STATS = 19
+CANCEL_CLEAR_STATS = 20
+BACK_FROM_STATS = 21
+
+STALE_BUTTON_TEXT = "⌛ Эта кнопка устарела"
+
+CallbackData = namedtuple("CallbackData", ["action", "args", "nonce"])
+
+
+def new_nonce():
+    """Return a random non-zero session nonce."""
+    return secrets.randbits(31) + 1
+
+
+def encode(action, *args, nonce=0):
+    """Encode an action, its integer arguments and a nonce as callback data."""
+    payload = bytearray((VERSION, action))
+    payload += nonce.to_bytes(4, "big")
+    for arg in args:
+        if arg < 0:
+            raise ValueError(f"Callback arguments must be non-negative, got {arg}")
+        while True:
+            byte = arg & 0x7F
+            arg >>= 7
+            if arg:
+                payload.append(byte | 0x80)
+            else:
+                payload.append(byte)
+                break
+    return base64.urlsafe_b64encode(bytes(payload)).rstrip(b"=").decode("ascii")
+
+
+@lru_cache(maxsize=4096)
+def decode(data):
+    """Decode callback data, returns None for malformed or foreign payloads."""
+    if not data:
+        return None
+    try:
+        payload = base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+    except (binascii.Error, ValueError):
+        return None
+    if len(payload) < 6 or payload[0] != VERSION:
+        return None
+
+    args = []
+    value = shift = 0
+    for byte in payload[6:]:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            args.append(value)
+            value = shift = 0
+    if shift:
+        return None
+
+    return CallbackData(payload[1], tuple(args), int.from_bytes(payload[2:6], "big"))
+
+
+class CallbackDispatcher:
+    """Route decoded callback queries through a table keyed by action code.
+
+    Buttons carrying a nonce are only honoured while it matches the nonce of
+    the user's current session, as returned by `session_lookup`.
+    """
+
+    def __init__(self, session_lookup):
+        self.session_lookup = session_lookup
+        self.routes = {}
+
+    def add(self, action, callback):
+        """Route an action code to a callback."""
+        self.routes[action] = callback
+
+    def pattern(self, actions):
+        """Return a CallbackQueryHandler pattern accepting the given actions."""
+        actions = frozenset(actions)
+
+        def matches(data):
+            decoded = decode(data) if isinstance(data, str) else None
+            return decoded is not None and decoded.action in actions
+
+        return matches
+
+    async def dispatch(self, update, context):
+        query = update.callback_query
+        decoded = decode(query.data)
+        callback = self.routes.get(decoded.action) if decoded else None
+
+        if callback is None:
+            return await self.reject(update, context)
+
+        if decoded.nonce:
+            session = self.session_lookup(update, context)
+            if session is None or getattr(session, "nonce", None) != decoded.nonce:
+                return await self.reject(update, context)
+
+        return await callback(update, context)
+
+    async def reject(self, update, context):
+        """Answer a button that belongs to an old session or an old protocol."""
+        await update.callback_query.answer(STALE_BUTTON_TEXT)
+        return None
+
+
+def parse(query):
+    """Decode the data of a callback query."""
+    return decode(query.data)
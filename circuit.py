@@ -0,0 +1,106 @@
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class CircuitBreaker:
+    """Stop calling an API that keeps failing, and probe it now and then.
+
+    After `failure_threshold` consecutive failures the circuit opens and
+    calls are refused. After `reset_timeout` seconds one probe call is let
+    through: success closes the circuit, failure opens it again. A probe
+    whose outcome is never recorded, e.g. because it was cancelled, is
+    replaced by another after `reset_timeout`. `on_close` is called
+    whenever the circuit closes after an outage.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic, on_close=None):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.on_close = on_close
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.probe_at = None
+
+        # Totals since startup
+        self.outages = 0
+        self.refused = 0
+
+    @property
+    def is_open(self):
+        """True while the API is considered down, half-open included."""
+        return self.state != CLOSED
+
+    def allow(self):
+        """Whether a call may be made now."""
+        if self.state == CLOSED:
+            return True
+        if self.state == HALF_OPEN and self.clock() - self.probe_at >= self.reset_timeout:
+            # The probe never reported back, let another one through
+            self.probe_at = self.clock()
+            return True
+        if self.state == OPEN and self.clock() - self.opened_at >= self.reset_timeout:
+            # Let exactly one probe through
+            self.state = HALF_OPEN
+            self.probe_at = self.clock()
+            return True
+        self.refused += 1
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        if self.state != CLOSED:
+            logger.warning(f"Bot API is back after {self.clock() - self.opened_at:.0f} s, "
+                           f"{self.refused} calls were refused meanwhile")
+            self.state = CLOSED
+            self.opened_at = None
+            if self.on_close:
+                self.on_close()
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+            if self.state == CLOSED:
+                self.outages += 1
+                logger.warning(f"Bot API failed {self.failures} times in a row, "
+                               f"pausing calls for {self.reset_timeout:.0f} s")
+            self.state = OPEN
+            self.opened_at = self.clock()
+
+    def stats(self):
+        return {"state": self.state, "outages": self.outages, "refused": self.refused}
+
+
+class DeferredNotifications:
+    """The latest undelivered notification per chat, and how many it replaced."""
+
+    def __init__(self):
+        self.pending = {}  # chat_id -> (text, send kwargs, notifications collapsed into it)
+
+    def __len__(self):
+        return len(self.pending)
+
+    def put(self, chat_id, text, kwargs=None):
+        previous = self.pending.get(chat_id)
+        count = previous[2] + 1 if previous else 1
+        self.pending[chat_id] = (text, kwargs or {}, count)
+
+    def requeue(self, chat_id, text, kwargs, count):
+        """Put back an undelivered notification, unless a newer one arrived meanwhile."""
+        newer = self.pending.get(chat_id)
+        if newer:
+            self.pending[chat_id] = (newer[0], newer[1], newer[2] + count)
+        else:
+            self.pending[chat_id] = (text, kwargs, count)
+
+    def drain(self):
+        """Remove and return all pending notifications as (chat_id, text, kwargs, count)."""
+        pending, self.pending = self.pending, {}
+        return [(chat_id, text, kwargs, count) for chat_id, (text, kwargs, count) in pending.items()]
@@ -0,0 +1,76 @@
+"""Time sources for the timer engine.
+
+Timer code reads the time and sleeps only through a clock object. The bot
+runs on WallClock. VirtualClock lets simulations and benchmarks run hours
+of sessions in seconds.
+"""
+import asyncio
+import heapq
+import itertools
+import time
+from datetime import datetime, timedelta
+
+
+class WallClock:
+    """Real time."""
+
+    def now(self):
+        return datetime.now()
+
+    def monotonic(self):
+        return time.monotonic()
+
+    async def sleep(self, seconds):
+        await asyncio.sleep(seconds)
+
+
+class VirtualClock:
+    """Simulated time that jumps straight to the next wake-up.
+
+    Sleepers wait in a heap ordered by deadline. Once the event loop has
+    run `settle_rounds` iterations without new work being woken, the clock
+    advances to the earliest deadline and wakes everybody due by then.
+    Coroutines that wait on real I/O while virtual time passes would see
+    time jump, so simulations should use instant fakes for the Bot API.
+    """
+
+    def __init__(self, start=None, settle_rounds=3):
+        self.start = start or datetime.now().replace(microsecond=0)
+        self.settle_rounds = settle_rounds
+        self.elapsed = 0.0
+        self.wakeups = 0
+        self._sleepers = []  # (deadline, seq, future)
+        self._seq = itertools.count()
+        self._driver = None
+
+    def now(self):
+        return self.start + timedelta(seconds=self.elapsed)
+
+    def monotonic(self):
+        return self.elapsed
+
+    async def sleep(self, seconds):
+        if seconds <= 0:
+            await asyncio.sleep(0)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._sleepers, (self.elapsed + seconds, next(self._seq), future))
+        if self._driver is None or self._driver.done():
+            self._driver = asyncio.create_task(self._drive())
+        await future
+
+    async def _drive(self):
+        while self._sleepers:
+            # Let everything that is runnable run until it sleeps again
+            for _ in range(self.settle_rounds):
+                await asyncio.sleep(0)
+
+            deadline = self._sleepers[0][0]
+            self.elapsed = max(self.elapsed, deadline)
+            while self._sleepers and self._sleepers[0][0] <= self.elapsed:
+                _, _, future = heapq.heappop(self._sleepers)
+                # Cancelled sleepers stay in the heap until their deadline
+                if not future.done():
+                    future.set_result(None)
+                    self.wakeups += 1
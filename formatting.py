@@ -0,0 +1,24 @@
+def create_progress_bar(elapsed_minutes, total_minutes, width=20):
+    """Create a visual progress bar."""
+    progress = min(1.0, elapsed_minutes / total_minutes)
+    filled_width = int(width * progress)
+    empty_width = width - filled_width
+
+    bar = "▓" * filled_width + "░" * empty_width
+    percentage = int(progress * 100)
+
+    return f"[{bar}] {percentage}%"
+
+
+def format_time_duration(seconds):
+    """Format seconds into a readable time duration."""
+    hours = int(seconds // 3600)
+    minutes = int((seconds % 3600) // 60)
+    seconds = int(seconds % 60)
+
+    if hours > 0:
+        return f"{hours} ч {minutes} мин {seconds} сек"
+    elif minutes > 0:
+        return f"{minutes} мин {seconds} сек"
+    else:
+        return f"{seconds} сек"
@@ -0,0 +1,133 @@
+import logging
+from time import perf_counter
+
+import httpx
+from telegram.error import NetworkError, TimedOut
+from telegram.request import HTTPXRequest
+
+from circuit import HALF_OPEN
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+
+class PoolStats:
+    """Connection pool metrics of one request pool."""
+
+    def __init__(self):
+        self.requests = 0
+        self.new_connections = 0
+        self.reused_connections = 0
+        self.pool_timeouts = 0
+        self.pool_wait_total = 0.0
+        self.pool_wait_max = 0.0
+
+    def record_wait(self, seconds, reused):
+        if reused:
+            self.reused_connections += 1
+        else:
+            self.new_connections += 1
+        self.pool_wait_total += seconds
+        self.pool_wait_max = max(self.pool_wait_max, seconds)
+
+    def as_dict(self):
+        connections = self.new_connections + self.reused_connections
+        return {
+            "requests": self.requests,
+            "new_connections": self.new_connections,
+            "reuse_rate": round(self.reused_connections / connections, 3) if connections else 0.0,
+            "pool_wait_avg_ms": round(self.pool_wait_total / connections * 1000, 2) if connections else 0.0,
+            "pool_wait_max_ms": round(self.pool_wait_max * 1000, 2),
+            "pool_timeouts": self.pool_timeouts,
+        }
+
+
+class PooledRequest(HTTPXRequest):
+    """HTTPXRequest with a tunable keep-alive and pool metrics.
+
+    The time a request waits for a connection is measured with httpcore's
+    trace hooks: from handing the request to the pool until it either opens
+    a new connection or starts writing to a reused one.
+
+    With a `breaker`, transport errors and 5xx/429 answers count as failures,
+    and calls fail fast with NetworkError while the circuit is open. A
+    `traffic` ApiPressure counts every call that goes out.
+    """
+
+    def __init__(self, name, pool_size, keepalive_expiry=30.0, read_timeout=5.0, write_timeout=5.0,
+                 connect_timeout=5.0, pool_timeout=1.0, http_version="1.1", breaker=None,
+                 traffic=None):
+        # Read by _build_client(), which the base class calls from __init__
+        self.name = name
+        self.pool_size = pool_size
+        self.keepalive_expiry = keepalive_expiry
+        self.stats = PoolStats()
+        self.breaker = breaker
+        self.traffic = traffic
+        super().__init__(connection_pool_size=pool_size, read_timeout=read_timeout,
+                         write_timeout=write_timeout, connect_timeout=connect_timeout,
+                         pool_timeout=pool_timeout, http_version=http_version)
+
+    def _build_client(self):
+        self._client_kwargs["limits"] = httpx.Limits(max_connections=self.pool_size,
+                                                     max_keepalive_connections=self.pool_size,
+                                                     keepalive_expiry=self.keepalive_expiry)
+        self._client_kwargs["event_hooks"] = {"request": [self._trace_pool_wait]}
+        return super()._build_client()
+
+    async def _trace_pool_wait(self, request):
+        queued = perf_counter()
+        waiting = True
+
+        async def trace(event, info):
+            nonlocal waiting
+            if not waiting:
+                return
+            if event == "connection.connect_tcp.started":
+                waiting = False
+                self.stats.record_wait(perf_counter() - queued, reused=False)
+            elif event.endswith("send_request_headers.started"):
+                waiting = False
+                self.stats.record_wait(perf_counter() - queued, reused=True)
+
+        request.extensions["trace"] = trace
+
+    async def do_request(self, url, *args, **kwargs):
+        # The last path segment is the Bot API method, the rest holds the token
+        with span(f"bot_api.{url.rsplit('/', 1)[-1]}", pool=self.name) as current:
+            code, payload = await self._do_request(url, *args, **kwargs)
+            if current:
+                current.attributes["http.status_code"] = code
+            return code, payload
+
+    async def _do_request(self, *args, **kwargs):
+        if self.breaker and not self.breaker.allow():
+            raise NetworkError("Bot API unavailable, circuit breaker is open")
+        probing = self.breaker is not None and self.breaker.state == HALF_OPEN
+        self.stats.requests += 1
+        if self.traffic:
+            self.traffic.record()
+        try:
+            code, payload = await super().do_request(*args, **kwargs)
+        except TimedOut as e:
+            if "Pool timeout" in str(e):
+                # Our own pool is busy, that says nothing about the Bot API
+                self.stats.pool_timeouts += 1
+            elif self.breaker:
+                self.breaker.record_failure()
+            raise
+        except NetworkError:
+            if self.breaker:
+                self.breaker.record_failure()
+            raise
+        except BaseException:
+            # A cancelled probe must not leave the breaker half-open
+            if probing and self.breaker.state == HALF_OPEN:
+                self.breaker.record_failure()
+            raise
+        if self.breaker:
+            if code >= 500 or code == 429:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+        return code, payload
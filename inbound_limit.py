@@ -0,0 +1,88 @@
+import time
+
+# Reasons an update is dropped
+RATE_LIMITED = "rate"
+DUPLICATE = "duplicate"
+
+
+class TokenBucket:
+    """Tokens of one user, refilled lazily when the user sends an update."""
+
+    __slots__ = ("tokens", "updated", "last_fingerprint", "last_accepted")
+
+    def __init__(self, tokens, now):
+        self.tokens = tokens
+        self.updated = now
+        self.last_fingerprint = None
+        self.last_accepted = now
+
+
+class InboundLimiter:
+    """Per-user flood protection for incoming updates.
+
+    Every user gets a token bucket of `burst` tokens refilled at `rate` per
+    second, an update costs one token. An update identical to the user's
+    previously accepted one within `collapse_window` seconds is a repeated
+    tap and is dropped without spending a token. Dropped updates are only
+    counted, never answered.
+    """
+
+    def __init__(self, rate=1.0, burst=10, collapse_window=1.0, max_users=10000,
+                 clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.collapse_window = collapse_window
+        self.max_users = max_users
+        self.clock = clock
+        self.buckets = {}  # key -> TokenBucket
+
+        # Totals since startup
+        self.accepted = 0
+        self.dropped = {RATE_LIMITED: 0, DUPLICATE: 0}
+
+    def check(self, key, fingerprint=None):
+        """Return None to accept an update, or the reason to drop it."""
+        if key is None:
+            self.accepted += 1
+            return None
+
+        now = self.clock()
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            if len(self.buckets) >= self.max_users:
+                self._evict(now)
+            bucket = self.buckets[key] = TokenBucket(self.burst, now)
+        else:
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+            bucket.updated = now
+
+        if (fingerprint is not None and fingerprint == bucket.last_fingerprint
+                and now - bucket.last_accepted < self.collapse_window):
+            self.dropped[DUPLICATE] += 1
+            return DUPLICATE
+
+        if bucket.tokens < 1:
+            self.dropped[RATE_LIMITED] += 1
+            return RATE_LIMITED
+
+        bucket.tokens -= 1
+        bucket.last_fingerprint = fingerprint
+        bucket.last_accepted = now
+        self.accepted += 1
+        return None
+
+    def _evict(self, now):
+        """Forget buckets that have refilled, they behave like new ones."""
+        full_after = self.burst / self.rate if self.rate else float("inf")
+        idle = max(full_after, self.collapse_window)
+        for key, bucket in list(self.buckets.items()):
+            if now - bucket.updated >= idle:
+                del self.buckets[key]
+        if len(self.buckets) >= self.max_users:
+            # Everybody is active, drop the oldest buckets
+            for key in list(self.buckets)[:len(self.buckets) - self.max_users + 1]:
+                del self.buckets[key]
+
+    def stats(self):
+        """Counters for logging and monitoring."""
+        return {"accepted": self.accepted, **self.dropped, "users": len(self.buckets)}
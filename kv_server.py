@@ -0,0 +1,235 @@
+"""Local stand-in for the key-value server behind KVTimerStore.
+
+Speaks the Redis serialization protocol and implements the commands the
+timer store uses: PING, GET, SET with NX and PX, DEL, EXISTS, ZADD, ZREM
+and ZRANGEBYSCORE with LIMIT. Everything is kept in memory, expired keys
+are dropped when they are read.
+
+    python kv_server.py --port 6380
+    TIMER_STORE_URL=kv://127.0.0.1:6380 python main.py
+"""
+import argparse
+import asyncio
+import bisect
+import logging
+import time
+
+from timer_state import RespClient
+
+logger = logging.getLogger(__name__)
+
+
+class CommandError(Exception):
+    pass
+
+
+class SortedSet:
+    def __init__(self):
+        self.scores = {}  # member -> score
+        self.order = []  # (score, member), sorted
+
+    def add(self, member, score):
+        if member in self.scores:
+            self.remove(member)
+        self.scores[member] = score
+        bisect.insort(self.order, (score, member))
+        return 1
+
+    def remove(self, member):
+        score = self.scores.pop(member, None)
+        if score is None:
+            return 0
+        del self.order[bisect.bisect_left(self.order, (score, member))]
+        return 1
+
+    def range(self, low, high, offset, count):
+        start = bisect.bisect_left(self.order, (low, b""))
+        members = []
+        for score, member in self.order[start:]:
+            if score > high:
+                break
+            members.append(member)
+        return members[offset:offset + count if count >= 0 else None]
+
+
+class KVServer:
+    """In-memory RESP server for development and benchmarks."""
+
+    def __init__(self, host="127.0.0.1", port=6380, clock=time.monotonic):
+        self.host = host
+        self.port = port
+        self.clock = clock
+        self.data = {}  # key -> bytes or SortedSet
+        self.expiry = {}  # key -> clock time
+        self.commands = 0
+        self._server = None
+        self._connections = {}  # writer -> task serving it
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        # Port 0 picks a free port
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self):
+        if self._server:
+            self._server.close()
+            # Closed connections end their tasks, which must not be left to be cancelled
+            tasks = list(self._connections.values())
+            for writer in list(self._connections):
+                writer.close()
+            if tasks:
+                await asyncio.wait(tasks)
+            await self._server.wait_closed()
+
+    async def _serve(self, reader, writer):
+        self._connections[writer] = asyncio.current_task()
+        try:
+            while True:
+                try:
+                    command = await RespClient.read_reply(reader)
+                except asyncio.IncompleteReadError:
+                    break
+                self.commands += 1
+                try:
+                    reply = self.execute(command)
+                except CommandError as e:
+                    writer.write(b"-ERR %s\r\n" % str(e).encode())
+                else:
+                    writer.write(self.encode(reply))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self._connections.pop(writer, None)
+            writer.close()
+
+    @classmethod
+    def encode(cls, reply):
+        if reply is None:
+            return b"$-1\r\n"
+        if reply is True:
+            return b"+OK\r\n"
+        if isinstance(reply, int):
+            return b":%d\r\n" % reply
+        if isinstance(reply, bytes):
+            return b"$%d\r\n%s\r\n" % (len(reply), reply)
+        if isinstance(reply, list):
+            return b"*%d\r\n" % len(reply) + b"".join(cls.encode(item) for item in reply)
+        if isinstance(reply, str):
+            return b"+%s\r\n" % reply.encode()
+        raise TypeError(reply)
+
+    def _live(self, key):
+        expiry = self.expiry.get(key)
+        if expiry is not None and expiry <= self.clock():
+            self.data.pop(key, None)
+            del self.expiry[key]
+        return key in self.data
+
+    def _zset(self, key, create=False):
+        if not self._live(key):
+            if not create:
+                return None
+            self.data[key] = SortedSet()
+        value = self.data[key]
+        if not isinstance(value, SortedSet):
+            raise CommandError("WRONGTYPE Operation against a key holding the wrong kind of value")
+        return value
+
+    def execute(self, command):
+        if not command:
+            raise CommandError("empty command")
+        name, args = command[0].upper(), command[1:]
+        handler = getattr(self, f"cmd_{name.decode()}", None)
+        if handler is None:
+            raise CommandError(f"unknown command '{name.decode()}'")
+        try:
+            return handler(*args)
+        except (TypeError, ValueError) as e:
+            raise CommandError(f"wrong arguments for '{name.decode()}': {e}") from e
+
+    def cmd_PING(self):
+        return "PONG"
+
+    def cmd_GET(self, key):
+        if not self._live(key):
+            return None
+        value = self.data[key]
+        if isinstance(value, SortedSet):
+            raise CommandError("WRONGTYPE Operation against a key holding the wrong kind of value")
+        return value
+
+    def cmd_SET(self, key, value, *options):
+        options = [option.upper() for option in options]
+        ttl = None
+        if b"PX" in options:
+            ttl = int(options[options.index(b"PX") + 1]) / 1000
+        if b"NX" in options and self._live(key):
+            return None
+        self.data[key] = value
+        if ttl is None:
+            self.expiry.pop(key, None)
+        else:
+            self.expiry[key] = self.clock() + ttl
+        return True
+
+    def cmd_DEL(self, *keys):
+        removed = 0
+        for key in keys:
+            if self._live(key):
+                del self.data[key]
+                self.expiry.pop(key, None)
+                removed += 1
+        return removed
+
+    def cmd_EXISTS(self, *keys):
+        return sum(self._live(key) for key in keys)
+
+    def cmd_ZADD(self, key, *pairs):
+        if not pairs or len(pairs) % 2:
+            raise ValueError("expected score member pairs")
+        zset = self._zset(key, create=True)
+        added = 0
+        for score, member in zip(pairs[::2], pairs[1::2]):
+            added += member not in zset.scores
+            zset.add(member, float(score))
+        return added
+
+    def cmd_ZREM(self, key, *members):
+        zset = self._zset(key)
+        return sum(zset.remove(member) for member in members) if zset else 0
+
+    def cmd_ZRANGEBYSCORE(self, key, low, high, *options):
+        offset, count = 0, -1
+        if options:
+            if len(options) != 3 or options[0].upper() != b"LIMIT":
+                raise ValueError("only LIMIT offset count is supported")
+            offset, count = int(options[1]), int(options[2])
+        zset = self._zset(key)
+        return zset.range(float(low), float(high), offset, count) if zset else []
+
+
+async def serve(host, port):
+    server = await KVServer(host, port).start()
+    logger.info(f"Key-value stand-in listening on {server.host}:{server.port}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6380)
+    args = parser.parse_args()
+    logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO)
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
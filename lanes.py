@@ -0,0 +1,56 @@
+import asyncio
+from contextlib import nullcontext
+
+from tracing import span
+
+
+class UserLanes:
+    """Run coroutines one at a time per key while different keys run concurrently.
+
+    A lane is an asyncio.Lock that exists only while the key has a running or
+    waiting coroutine. asyncio locks wake waiters in FIFO order, so coroutines
+    submitted for one key finish in submission order.
+    """
+
+    def __init__(self):
+        self._locks = {}  # key -> lock of the lane
+        self._pending = {}  # key -> running plus waiting coroutines
+        self.processed = 0
+        self.queued = 0  # Coroutines that had to wait for their lane
+
+    def __len__(self):
+        return len(self._locks)
+
+    def pending(self, key):
+        """Number of running and waiting coroutines in the lane of a key."""
+        return self._pending.get(key, 0)
+
+    async def run(self, key, coroutine):
+        """Await a coroutine in the lane of `key`, None runs it without a lane."""
+        if key is None:
+            self.processed += 1
+            return await coroutine
+
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        waits = lock.locked()
+        if waits:
+            self.queued += 1
+        self._pending[key] = self._pending.get(key, 0) + 1
+
+        try:
+            with span("lane.wait") if waits else nullcontext():
+                await lock.acquire()
+            try:
+                self.processed += 1
+                return await coroutine
+            finally:
+                lock.release()
+        finally:
+            # Never awaited if cancelled while waiting, close it to avoid a warning
+            coroutine.close()
+            self._pending[key] -= 1
+            if not self._pending[key]:
+                del self._pending[key]
+                del self._locks[key]
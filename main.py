@@ -1,22 +1,54 @@
+from time import perf_counter
+_import_started = perf_counter()
+
 import logging
 import json
 import os
-from dotenv import load_dotenv
-import threading
 from datetime import datetime, timedelta
 import asyncio
+import secrets
+import socket
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton
-from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, ContextTypes, filters, ConversationHandler
-
-# Load environment variables
-load_dotenv()
+from telegram.error import BadRequest, NetworkError
+from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, ContextTypes, filters, ConversationHandler, TypeHandler
+
+import cadence
+import callback_data as cb
+import profiling
+from analytics import iter_users
+from broadcast import BroadcastError, Broadcaster
+from circuit import CircuitBreaker, DeferredNotifications
+from clock import WallClock
+from formatting import create_progress_bar, format_time_duration
+from http_pool import PooledRequest
+from inbound_limit import InboundLimiter
+from overload import HELP, PROGRESS, STATS, STATS_RENDER, OverloadController
+from persistence import SqlitePersistence
+from recorder import UpdateRecorder
+from rooms import RoomError, RoomManager
+from router import TextRouter
+from settings import (ADMIN_IDS, BOT_API_BUDGET, BREAKER_COOLDOWN, BREAKER_FAILURES, BROADCAST_SHARE,
+                      BROADCAST_STATE_FILE, CONNECT_TIMEOUT, DASHBOARD_MODE,
+                      DEBUG_MAX_SECONDS, HTTP_VERSION, INBOUND_BURST, INBOUND_RATE, KEEPALIVE_EXPIRY,
+                      LOAD_COOLDOWN, LOAD_ELEVATED_DEPTH, LOAD_ELEVATED_LAG_MS, LOAD_OVERLOADED_DEPTH,
+                      LOAD_OVERLOADED_LAG_MS, LOG_FILE, MAX_CONCURRENT_UPDATES, MAX_SESSIONS,
+                      OUTBOUND_POOL_SIZE, OUTBOUND_POOL_TIMEOUT, OUTBOUND_READ_TIMEOUT,
+                      PROGRESS_EDIT_BUDGET, PROGRESS_MODE,
+                      RECORD_UPDATES_FILE, SETUP_TIMEOUT, STATE_DB_FILE, STATE_FLUSH_DELAY,
+                      STATE_SWEEP_INTERVAL, STATS_CACHE_SIZE, STUCK_TASK_AFTER, TAP_COLLAPSE_WINDOW,
+                      TASK_AUDIT_INTERVAL, TIMER_STORE_HEARTBEAT, TIMER_STORE_URL, TRACE_FILE,
+                      TRACE_SAMPLE_RATE, TRACE_SLOW_MS, UPDATES_POOL_SIZE, USER_DATA_FILE, USER_STATE_TTL)
+from startup import StartupReport
+from stats_cache import StatsCache
+from state_lifecycle import StateSweeper, clear_session_state, touch
+from templates import PARSE_MODE, Markup, Template
+from subjects import ADD_SUBJECT_BUTTON, CANCEL_BUTTON, HELP_BUTTON, SubjectRegistry
+from session_plan import OTHER, compile_plan
+from timer_state import BREAK, WORK, MemoryTimerStore, TimerState, open_timer_store
+from timer_tasks import TimerTasks
+from tracing import Tracer, span
+from update_processor import UserLaneUpdateProcessor
 
-# Enhanced logging configuration
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO,
-    handlers=[logging.FileHandler("bot.log"),
-              logging.StreamHandler()])
 logger = logging.getLogger(__name__)
 
 # States for conversation
@@ -28,11 +60,49 @@ MAX_WORK_TIME = 120
 MIN_BREAK_TIME = 1
 MAX_BREAK_TIME = 60
 
+# Progress message updates
+TIMER_POLL_INTERVAL = 15  # How often a running timer checks for pause/stop
+
+PROGRESS_MODE_NAMES = {
+    cadence.ADAPTIVE: "🧠 Адаптивный — обновлять, когда заметно меняется полоса",
+    cadence.FIXED: "⏱️ Частый — каждые 15-30 секунд",
+    cadence.TRANSITIONS: "🔕 Тихий — только смена работы и отдыха",
+}
+
 # Store active timers
 active_timers = {}
 
-# User data file path
-USER_DATA_FILE = "user_data.json"
+# All timer code reads the time and sleeps through this clock, see use_timer_clock()
+timer_clock = WallClock()
+
+# Shared by all outbound Bot API calls. While it is open timers keep running,
+# progress edits are skipped and only the latest notification per chat is kept
+bot_api = CircuitBreaker(BREAKER_FAILURES, BREAKER_COOLDOWN, clock=timer_clock.monotonic)
+deferred_notifications = DeferredNotifications()
+
+# Rate of all outbound Bot API calls, broadcasts get what the rest leaves of the budget
+api_traffic = cadence.ApiPressure()
+
+# Every session's run_timer task, started and cancelled only through here
+timer_tasks = TimerTasks(active_timers, STUCK_TASK_AFTER, TASK_AUDIT_INTERVAL, clock=timer_clock.monotonic)
+
+# Phase, deadline and pause state of every session, visible to other workers,
+# see use_timer_store(). WORKER_ID tells the sessions of this process apart
+timer_store = MemoryTimerStore()
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(4)}"
+
+progress_cadence = cadence.CadencePolicy(PROGRESS_MODE, edit_budget=PROGRESS_EDIT_BUDGET)
+
+# The running /debug_profile or /debug_mem capture, one at a time
+debug_capture = None
+
+# Rendered /stats output per user, valid until the user's statistics change
+stats_cache = StatsCache(STATS_CACHE_SIZE)
+
+# Event loop lag and updates in the pipeline, low-value work is shed when they pile up
+overload = OverloadController(LOAD_ELEVATED_LAG_MS / 1000, LOAD_OVERLOADED_LAG_MS / 1000,
+                              LOAD_ELEVATED_DEPTH, LOAD_OVERLOADED_DEPTH, capacity=MAX_SESSIONS,
+                              cooldown=LOAD_COOLDOWN)
 
 # Predefined emoji sets
 SUBJECT_EMOJIS = {
@@ -52,6 +122,12 @@ SUBJECT_EMOJIS = {
 # Default emoji for custom subjects
 DEFAULT_CUSTOM_EMOJI = "📝"
 
+# Subjects offered to every user
+PREDEFINED_SUBJECTS = [
+    "Русский язык", "История Беларуси", "Биология",
+    "Математика", "Химия", "Физика"
+]
+
 # Help messages
 HELP_MESSAGES = {
     "main": (
@@ -60,6 +136,9 @@ HELP_MESSAGES = {
         "• /start - Начать новую сессию\n"
         "• /stop - Остановить текущий таймер\n"
         "• /stats - Показать статистику\n"
+        "• /progress - Настроить обновление прогресса\n"
+        "• /dashboard - Одно сообщение на сессию вместо ленты сообщений\n"
+        "• /room - Создать комнату с общим таймером (/join, /leave, /roomstart, /roomstop)\n"
         "• /help - Показать эту справку\n\n"
         "*Как использовать:*\n"
         "1. Нажми /start, чтобы начать новую сессию\n"
@@ -112,11 +191,97 @@ HELP_MESSAGES = {
 }
 
 
+# Messages that show user values, compiled once, see templates.py
+WORK_TIME_HELP = Template(HELP_MESSAGES['work_time']).render()
+SUBJECT_ADDED = Template("✅ Предмет *{subject}* успешно добавлен!")
+SUBJECT_EXISTS = Template("ℹ️ Предмет *{subject}* уже есть в списке.")
+SUBJECT_CHOSEN = Template("📌 *Выбран предмет: {subject}*\n\n{help}")
+SESSION_SUMMARY = Template("📚 *Предмет*: {subject}\n"
+                           "⏱ *Время работы*: {work_time} минут\n"
+                           "☕ *Время отдыха*: {break_time} минут\n"
+                           "🕒 *Время начала*: {start:%H:%M}\n"
+                           "🏁 *Время окончания*: {end}\n"
+                           "{plan}")
+PLAN_INTERVALS = Template("🔢 *Рабочих интервалов*: {intervals}\n")
+PLAN_INTERVALS_CUT = Template("🔢 *Рабочих интервалов*: {intervals}, последний — {minutes} мин\n")
+SESSION_STARTED = Template("✅ *Настройки сохранены!*\n\n{summary}\n"
+                           "🚀 Начинаем работу прямо сейчас! Удачи с изучением предмета *{subject}*!\n"
+                           "Используй кнопки для управления таймером.")
+SESSION_ENDED = Template("⏰ *Время окончания достигнуто!*\n\n"
+                         "Сессия по предмету *{subject}* завершена.\n\n"
+                         "📊 *Статистика сессии:*\n"
+                         "• Выполнено рабочих интервалов: *{intervals}*\n"
+                         "• Общее время работы: *{work_time}*\n\n"
+                         "Молодец! Для начала новой сессии нажми кнопку 'Начать новую сессию' или /start.")
+SESSION_STOPPED = Template("⏹ *Таймер остановлен!*\n\n"
+                           "📊 *Статистика сессии:*\n"
+                           "• Выполнено рабочих интервалов: *{intervals}*\n"
+                           "• Общее время работы: *{work_time}*\n\n"
+                           "Молодец! Для начала новой сессии нажми кнопку 'Начать новую сессию' или /start.")
+SESSION_INTERRUPTED = Template("⚠️ *Таймер по предмету {subject} остановлен перезапуском бота.*\n\n"
+                               "📊 *Статистика сессии:*\n"
+                               "• Выполнено рабочих интервалов: *{intervals}*\n"
+                               "• Общее время работы: *{work_time}*\n\n"
+                               "Для начала новой сессии нажми /start.")
+WORK_SCREEN = Template("🚀 *Начинаем работу!*\n\n"
+                       "📚 Предмет: *{subject}*\n"
+                       "⏱️ Продолжительность: *{minutes}* минут\n"
+                       "🕒 До: *{until:%H:%M}*\n\n"
+                       "{progress}")
+WORK_PROGRESS = Template("🚀 *Работа над предметом*\n\n"
+                         "📚 Предмет: *{subject}*\n"
+                         "⏱️ Осталось: *{minutes}* мин *{seconds}* сек\n"
+                         "🕒 До: *{until:%H:%M}*\n\n"
+                         "{progress}")
+BREAK_SCREEN = Template("☕ *Время отдыха!*\n\n"
+                        "💤 Отдыхай *{minutes}* минут\n"
+                        "🕒 До: *{until:%H:%M}*\n\n"
+                        "{progress}")
+BREAK_PROGRESS = Template("☕ *Время отдыха!*\n\n"
+                          "💤 Осталось: *{minutes}* мин *{seconds}* сек\n"
+                          "🕒 До: *{until:%H:%M}*\n\n"
+                          "{progress}")
+BREAK_OVER = Template("🔄 *Перерыв окончен!*\n\n"
+                      "Возвращаемся к работе над предметом *{subject}*.\n\n"
+                      "Небольшая статистика:\n"
+                      "• Выполнено интервалов: {intervals}\n"
+                      "• Общее время работы: {work_time}")
+BREAK_SKIPPED = Template("⏭️ *Перерыв пропущен!*\n\nВозвращаемся к работе над предметом *{subject}*.")
+PAUSED_SCREEN = Template("⏸️ *Таймер приостановлен*\n\nНажми 'Продолжить', чтобы возобновить отсчет.").render()
+RESUMED_SCREEN = Template("▶️ *Таймер возобновлен*\n\nПродолжаем отсчет!").render()
+STATS_EMPTY = Template("📊 *Статистика*\n\n"
+                       "У вас пока нет статистики. Начните сессию, чтобы собрать данные.").render()
+STATS_SUBJECT = Template("*{subject}*\n"
+                         "• Всего сессий: {sessions}\n"
+                         "• Рабочих интервалов: {intervals}\n"
+                         "• Общее время работы: {work_time}\n"
+                         "• Среднее время сессии: {average}\n")
+STATS_LAST_SESSION = Template("• Последняя сессия: {last_session}\n")
+STATS_TOTAL = Template("📊 *Статистика по предметам*\n\n"
+                       "{subjects}"
+                       "*Общая статистика*\n"
+                       "• Всего сессий: {sessions}\n"
+                       "• Всего рабочих интервалов: {intervals}\n"
+                       "• Общее время работы: {work_time}\n\n"
+                       "🏆 Продолжайте в том же духе! 💪")
+ROOM_CREATED = Template("👥 *Комната {code} создана!*\n\n"
+                        "📚 Предмет: *{subject}*\n"
+                        "⏱ Работа: *{work_time}* мин, ☕ отдых: *{break_time}* мин\n\n"
+                        "Участники группы присоединяются командой /join, остальные — `/join {code}` "
+                        "в личном чате с ботом.\n"
+                        "Запусти общий таймер командой /roomstart.")
+ROOM_JOINED = Template("✅ Ты в комнате *{code}* — {subject}. Участников: *{members}*")
+
+# Help topics addressable from inline buttons, by position
+HELP_TOPICS = list(HELP_MESSAGES)
+HELP_TOPIC_IDS = {topic: i for i, topic in enumerate(HELP_TOPICS)}
+
+
 def load_user_data():
     """Load user statistics from file."""
     if os.path.exists(USER_DATA_FILE):
         try:
-            with open(USER_DATA_FILE, 'r', encoding='utf-8') as f:
+            with span("storage.load"), open(USER_DATA_FILE, 'r', encoding='utf-8') as f:
                 return json.load(f)
         except Exception as e:
             logger.error(f"Error loading user data: {e}")
@@ -126,12 +291,30 @@ def load_user_data():
 def save_user_data(user_data):
     """Save user statistics to file."""
     try:
-        with open(USER_DATA_FILE, 'w', encoding='utf-8') as f:
+        with span("storage.save"), open(USER_DATA_FILE, 'w', encoding='utf-8') as f:
             json.dump(user_data, f, ensure_ascii=False, indent=2)
     except Exception as e:
         logger.error(f"Error saving user data: {e}")
 
 
+def iter_user_ids():
+    """Stream the ids of all users in the statistics file without loading it."""
+    if not os.path.exists(USER_DATA_FILE):
+        return
+    with open(USER_DATA_FILE, 'r', encoding='utf-8') as f:
+        for user_id, data in iter_users(f):
+            yield int(user_id)
+
+
+# Admin announcements, one at a time
+broadcaster = Broadcaster(BROADCAST_STATE_FILE, iter_user_ids, BOT_API_BUDGET, BROADCAST_SHARE,
+                          traffic=api_traffic, circuit=bot_api)
+
+
+subject_registry = SubjectRegistry(PREDEFINED_SUBJECTS, SUBJECT_EMOJIS, DEFAULT_CUSTOM_EMOJI,
+                                   load_user_data, save_user_data)
+
+
 class UserSession:
     """Class to store and manage user session data."""
 
@@ -149,6 +332,18 @@ class UserSession:
         self.total_work_sessions = 0  # Track number of completed work sessions
         self.pause_start_time = None  # Track when a pause started
         self.current_progress = 0  # Track current progress in percentage
+        self.nonce = cb.new_nonce()  # Ties inline buttons to this session
+        self.progress_mode = None  # Progress update mode, None for the default
+        self.dashboard = DASHBOARD_MODE  # Edit one message per session instead of sending new ones
+        self.dashboard_message_id = None
+        self.stored_state = None  # Last TimerState written to the timer store
+        self.plan = None  # SessionPlan the timer walks, compiled at the start
+
+    def __getstate__(self):
+        # Running tasks can't be persisted
+        state = self.__dict__.copy()
+        state['task'] = None
+        return state
 
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -158,9 +353,9 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     # Check if user already has an active timer
     if user_id in active_timers:
         keyboard = [
-            [InlineKeyboardButton("⏹️ Остановить текущий таймер", callback_data="force_stop")],
-            [InlineKeyboardButton("🔙 Вернуться к текущему таймеру", callback_data="return_to_timer")],
-            [InlineKeyboardButton("❓ Помощь", callback_data="help")]
+            [InlineKeyboardButton("⏹️ Остановить текущий таймер", callback_data=cb.encode(cb.FORCE_STOP))],
+            [InlineKeyboardButton("🔙 Вернуться к текущему таймеру", callback_data=cb.encode(cb.RETURN_TO_TIMER))],
+            [InlineKeyboardButton("❓ Помощь", callback_data=cb.encode(cb.HELP))]
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
 
@@ -171,48 +366,17 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
             parse_mode='Markdown')
         return RUNNING
 
+    # Beyond this node's capacity, or under overload, a new session has to wait
+    if not overload.admit_session(len(active_timers)):
+        await update.message.reply_text(
+            "🚦 Сейчас идет слишком много сессий, попробуй начать через пару минут.")
+        return ConversationHandler.END
+
     # Initialize user session
     context.user_data['session'] = UserSession()
 
-    # Get predefined and custom subjects from user data
-    user_data = load_user_data()
-    user_str_id = str(user_id)
-
-    if user_str_id not in user_data:
-        user_data[user_str_id] = {"stats": {}, "custom_subjects": []}
-        save_user_data(user_data)
-
-    # Combine predefined and custom subjects
-    predefined_subjects = [
-        "📚 Русский язык", "🏛️ История Беларуси", "🧬 Биология",
-        "🔢 Математика", "⚗️ Химия", "⚛️ Физика"
-    ]
-
-    custom_subjects = user_data[user_str_id].get("custom_subjects", [])
-
-    # Create keyboard for subjects
-    keyboard = []
-
-    # Add predefined subjects
-    for subject in predefined_subjects:
-        keyboard.append([subject])
-
-    # Add custom subjects
-    for subject in custom_subjects:
-        # Check if subject already has an emoji
-        if " " in subject and any(emoji in subject for emoji in SUBJECT_EMOJIS.values()):
-            keyboard.append([subject])
-        else:
-            # Add default emoji if none exists
-            keyboard.append([f"{DEFAULT_CUSTOM_EMOJI} {subject}"])
-
-    # Add options to add new subject or cancel
-    keyboard.append(["➕ Добавить предмет"])
-    keyboard.append(["❓ Помощь", "❌ Отмена"])
-
-    reply_markup = ReplyKeyboardMarkup(keyboard,
-                                    one_time_keyboard=True,
-                                    resize_keyboard=True)
+    # Keyboard is cached per user until their subjects change
+    reply_markup = subject_registry.keyboard(user_id)
 
     await update.message.reply_text(
         "👋 *Привет! Я помогу тебе распределить время для учебы.*\n\n"
@@ -253,47 +417,31 @@ async def subject(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         )
         return await start(update, context)
 
-    # Check for cancel command
-    if update.message.text == "❌ Отмена":
-        return await cancel(update, context)
-
     # Check if user is adding a new subject
     if context.user_data.get('adding_subject'):
-        user_id = str(update.effective_user.id)
         new_subject = update.message.text
 
-        # Skip if cancel is pressed
-        if new_subject == "❌ Отмена":
-            context.user_data['adding_subject'] = False
-            return await start(update, context)
-
-        # Load user data
-        user_data = load_user_data()
-
-        # Add the new subject
-        if user_id not in user_data:
-            user_data[user_id] = {"stats": {}, "custom_subjects": []}
+        new_subject, created = subject_registry.add(update.effective_user.id, new_subject)
 
-        if "custom_subjects" not in user_data[user_id]:
-            user_data[user_id]["custom_subjects"] = []
-
-        # Add emoji if not present
-        if not any(emoji in new_subject for emoji in list(SUBJECT_EMOJIS.values()) + [DEFAULT_CUSTOM_EMOJI]):
-            new_subject = f"{DEFAULT_CUSTOM_EMOJI} {new_subject}"
-
-        user_data[user_id]["custom_subjects"].append(new_subject)
-
-        # Save user data
-        save_user_data(user_data)
+        if new_subject is None:
+            await update.message.reply_text(
+                "⚠️ Название предмета не может быть пустым. Попробуй еще раз:")
+            return SUBJECT
 
         # Clear the flag
         context.user_data['adding_subject'] = False
 
         # Confirmation message
-        await update.message.reply_text(
-            f"✅ Предмет *{new_subject}* успешно добавлен!",
-            parse_mode='Markdown'
-        )
+        if created:
+            await update.message.reply_text(
+                SUBJECT_ADDED.render(subject=new_subject.label),
+                parse_mode=PARSE_MODE
+            )
+        else:
+            await update.message.reply_text(
+                SUBJECT_EXISTS.render(subject=new_subject.label),
+                parse_mode=PARSE_MODE
+            )
 
         # Restart the subject selection
         return await start(update, context)
@@ -304,16 +452,10 @@ async def subject(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     if "➕ Добавить предмет" in subject_text:
         return await add_custom_subject(update, context)
 
-    # Extract the subject name without emoji
-    if " " in subject_text and any(emoji in subject_text for emoji in list(SUBJECT_EMOJIS.values()) + [DEFAULT_CUSTOM_EMOJI]):
-        parts = subject_text.split(" ", 1)
-        emoji = parts[0]
-        subject_name = parts[1]
-        session.subject = subject_name
-        session.subject_with_emoji = subject_text  # Store full name with emoji
-    else:
-        session.subject = subject_text
-        session.subject_with_emoji = f"{DEFAULT_CUSTOM_EMOJI} {subject_text}"
+    # Resolve the subject name without emoji
+    selected = subject_registry.resolve(update.effective_user.id, subject_text)
+    session.subject = selected.name
+    session.subject_with_emoji = selected.label  # Store full name with emoji
 
     # Create styled inline keyboard for work time
     keyboard = []
@@ -323,7 +465,7 @@ async def subject(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     for i, time in enumerate(times):
         row.append(
             InlineKeyboardButton(f"⏱️ {time} мин",
-                              callback_data=f"work_{time}"))
+                              callback_data=cb.encode(cb.WORK, time, nonce=session.nonce)))
         if (i + 1) % 3 == 0:
             keyboard.append(row)
             row = []
@@ -332,17 +474,16 @@ async def subject(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         keyboard.append(row)
 
     keyboard.append(
-        [InlineKeyboardButton("✏️ Свое время", callback_data="work_custom")])
-    keyboard.append([InlineKeyboardButton("❓ Помощь", callback_data="help_work_time")])
-    keyboard.append([InlineKeyboardButton("❌ Отмена", callback_data="cancel")])
+        [InlineKeyboardButton("✏️ Свое время", callback_data=cb.encode(cb.WORK_CUSTOM, nonce=session.nonce))])
+    keyboard.append([InlineKeyboardButton("❓ Помощь", callback_data=cb.encode(cb.HELP, HELP_TOPIC_IDS["work_time"]))])
+    keyboard.append([InlineKeyboardButton("❌ Отмена", callback_data=cb.encode(cb.CANCEL, nonce=session.nonce))])
 
     reply_markup = InlineKeyboardMarkup(keyboard)
 
     await update.message.reply_text(
-        f"📌 *Выбран предмет: {session.subject}*\n\n"
-        f"{HELP_MESSAGES['work_time']}",
+        SUBJECT_CHOSEN.render(subject=session.subject, help=WORK_TIME_HELP),
         reply_markup=reply_markup,
-        parse_mode='Markdown')
+        parse_mode=PARSE_MODE)
 
     return WORK_TIME
 
@@ -354,18 +495,15 @@ async def show_help(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         await query.answer()
         
         # Determine which help message to show based on callback data
-        help_type = query.data.replace("help_", "")
-        
-        if help_type in HELP_MESSAGES:
-            await query.message.reply_text(
-                HELP_MESSAGES[help_type],
-                parse_mode='Markdown'
-            )
-        else:
-            await query.message.reply_text(
-                HELP_MESSAGES["main"],
-                parse_mode='Markdown'
-            )
+        data = cb.parse(query)
+        help_type = "main"
+        if data and data.args and data.args[0] < len(HELP_TOPICS):
+            help_type = HELP_TOPICS[data.args[0]]
+
+        await query.message.reply_text(
+            HELP_MESSAGES[help_type],
+            parse_mode='Markdown'
+        )
         
         # Return to previous state
         return -1  # Will keep current state
@@ -384,7 +522,8 @@ async def custom_work_time(update: Update,
     # Create cancel button
     keyboard = [["❌ Отмена"]]
     reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True, one_time_keyboard=True)
-    
+
+    await update.callback_query.answer()
     await update.callback_query.message.reply_text(
         "✏️ *Ввод времени работы*\n\n"
         f"Введи желаемое время работы в минутах (от {MIN_WORK_TIME} до {MAX_WORK_TIME}):\n\n"
@@ -405,22 +544,7 @@ async def work_time(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     if query:
         await query.answer()
 
-        if query.data == "cancel":
-            await query.message.reply_text(
-                "❌ Настройка отменена. Нажми /start чтобы начать заново.")
-            return ConversationHandler.END
-            
-        if query.data == "help_work_time":
-            await query.message.reply_text(
-                HELP_MESSAGES["work_time"],
-                parse_mode='Markdown'
-            )
-            return WORK_TIME
-
-        if query.data == "work_custom":
-            return await custom_work_time(update, context)
-
-        work_time = int(query.data.split("_")[1])
+        work_time = cb.parse(query).args[0]
         session.work_time = work_time
 
         # Create stylish inline keyboard for break time
@@ -431,7 +555,7 @@ async def work_time(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         for i, time in enumerate(times):
             row.append(
                 InlineKeyboardButton(f"☕ {time} мин",
-                                 callback_data=f"break_{time}"))
+                                 callback_data=cb.encode(cb.BREAK, time, nonce=session.nonce)))
             if (i + 1) % 3 == 0:
                 keyboard.append(row)
                 row = []
@@ -440,11 +564,11 @@ async def work_time(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
             keyboard.append(row)
 
         keyboard.append([
-            InlineKeyboardButton("✏️ Свое время", callback_data="break_custom")
+            InlineKeyboardButton("✏️ Свое время", callback_data=cb.encode(cb.BREAK_CUSTOM, nonce=session.nonce))
         ])
-        keyboard.append([InlineKeyboardButton("❓ Помощь", callback_data="help_break_time")])
+        keyboard.append([InlineKeyboardButton("❓ Помощь", callback_data=cb.encode(cb.HELP, HELP_TOPIC_IDS["break_time"]))])
         keyboard.append(
-            [InlineKeyboardButton("❌ Отмена", callback_data="cancel")])
+            [InlineKeyboardButton("❌ Отмена", callback_data=cb.encode(cb.CANCEL, nonce=session.nonce))])
 
         reply_markup = InlineKeyboardMarkup(keyboard)
 
@@ -458,10 +582,6 @@ async def work_time(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     else:
         # Handle text input for custom time
         try:
-            # Check for cancel
-            if update.message.text == "❌ Отмена":
-                return await cancel(update, context)
-                
             work_time = int(update.message.text)
             if work_time < MIN_WORK_TIME or work_time > MAX_WORK_TIME:
                 await update.message.reply_text(
@@ -479,7 +599,7 @@ async def work_time(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
             for i, time in enumerate(times):
                 row.append(
                     InlineKeyboardButton(f"☕ {time} мин",
-                                     callback_data=f"break_{time}"))
+                                     callback_data=cb.encode(cb.BREAK, time, nonce=session.nonce)))
                 if (i + 1) % 3 == 0:
                     keyboard.append(row)
                     row = []
@@ -489,11 +609,11 @@ async def work_time(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
 
             keyboard.append([
                 InlineKeyboardButton("✏️ Свое время",
-                                 callback_data="break_custom")
+                                 callback_data=cb.encode(cb.BREAK_CUSTOM, nonce=session.nonce))
             ])
-            keyboard.append([InlineKeyboardButton("❓ Помощь", callback_data="help_break_time")])
+            keyboard.append([InlineKeyboardButton("❓ Помощь", callback_data=cb.encode(cb.HELP, HELP_TOPIC_IDS["break_time"]))])
             keyboard.append(
-                [InlineKeyboardButton("❌ Отмена", callback_data="cancel")])
+                [InlineKeyboardButton("❌ Отмена", callback_data=cb.encode(cb.CANCEL, nonce=session.nonce))])
 
             reply_markup = InlineKeyboardMarkup(keyboard)
 
@@ -515,7 +635,8 @@ async def custom_break_time(update: Update, context: ContextTypes.DEFAULT_TYPE)
     # Create cancel button
     keyboard = [["❌ Отмена"]]
     reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True, one_time_keyboard=True)
-    
+
+    await update.callback_query.answer()
     await update.callback_query.message.reply_text(
         "✏️ *Ввод времени отдыха*\n\n"
         f"Введи желаемое время отдыха в минутах (от {MIN_BREAK_TIME} до {MAX_BREAK_TIME}):\n\n"
@@ -537,26 +658,11 @@ async def break_time(update: Update,
     if query:
         await query.answer()
 
-        if query.data == "cancel":
-            await query.message.reply_text(
-                "❌ Настройка отменена. Нажми /start чтобы начать заново.")
-            return ConversationHandler.END
-            
-        if query.data == "help_break_time":
-            await query.message.reply_text(
-                HELP_MESSAGES["break_time"],
-                parse_mode='Markdown'
-            )
-            return BREAK_TIME
-
-        if query.data == "break_custom":
-            return await custom_break_time(update, context)
-
-        break_time = int(query.data.split("_")[1])
+        break_time = cb.parse(query).args[0]
         session.break_time = break_time
 
         # Create a visual time picker interface
-        current_time = datetime.now()
+        current_time = timer_clock.now()
         hour = current_time.hour
         minute = current_time.minute
 
@@ -574,7 +680,7 @@ async def break_time(update: Update,
         # Current time
         keyboard.append([
             InlineKeyboardButton(f"⏱️ Сейчас ({formatted_time})",
-                             callback_data=f"time_{formatted_time}")
+                             callback_data=cb.encode(cb.START_AT, hour * 60 + minute, nonce=session.nonce))
         ])
 
         # Common times
@@ -583,16 +689,16 @@ async def break_time(update: Update,
             h = h % 24
             for m in [0, 15, 30, 45]:
                 # Create a datetime to compare
-                suggest_time = datetime.now().replace(hour=h%24, minute=m, second=0, microsecond=0)
+                suggest_time = timer_clock.now().replace(hour=h%24, minute=m, second=0, microsecond=0)
                 # Only include future times
                 if suggest_time > current_time:
-                    suggestions.append(f"{h%24:02d}:{m:02d}")
+                    suggestions.append(h % 24 * 60 + m)
 
         row = []
-        for i, time_str in enumerate(suggestions[:6]):
+        for i, minutes in enumerate(suggestions[:6]):
             row.append(
-                InlineKeyboardButton(time_str,
-                                 callback_data=f"time_{time_str}"))
+                InlineKeyboardButton(f"{minutes // 60:02d}:{minutes % 60:02d}",
+                                 callback_data=cb.encode(cb.START_AT, minutes, nonce=session.nonce)))
             if (i + 1) % 3 == 0:
                 keyboard.append(row)
                 row = []
@@ -602,11 +708,11 @@ async def break_time(update: Update,
 
         keyboard.append([
             InlineKeyboardButton("✏️ Ввести вручную",
-                             callback_data="time_custom")
+                             callback_data=cb.encode(cb.START_CUSTOM, nonce=session.nonce))
         ])
-        keyboard.append([InlineKeyboardButton("❓ Помощь", callback_data="help_start_time")])
+        keyboard.append([InlineKeyboardButton("❓ Помощь", callback_data=cb.encode(cb.HELP, HELP_TOPIC_IDS["start_time"]))])
         keyboard.append(
-            [InlineKeyboardButton("❌ Отмена", callback_data="cancel")])
+            [InlineKeyboardButton("❌ Отмена", callback_data=cb.encode(cb.CANCEL, nonce=session.nonce))])
 
         reply_markup = InlineKeyboardMarkup(keyboard)
 
@@ -623,10 +729,6 @@ async def break_time(update: Update,
     else:
         # Handle text input for custom time
         try:
-            # Check for cancel
-            if update.message.text == "❌ Отмена":
-                return await cancel(update, context)
-                
             break_time = int(update.message.text)
             if break_time < MIN_BREAK_TIME or break_time > MAX_BREAK_TIME:
                 await update.message.reply_text(
@@ -637,7 +739,7 @@ async def break_time(update: Update,
             session.break_time = break_time
 
             # Create a visual time picker interface
-            current_time = datetime.now()
+            current_time = timer_clock.now()
             hour = current_time.hour
             minute = current_time.minute
 
@@ -655,7 +757,7 @@ async def break_time(update: Update,
             # Current time
             keyboard.append([
                 InlineKeyboardButton(f"⏱️ Сейчас ({formatted_time})",
-                                 callback_data=f"time_{formatted_time}")
+                                 callback_data=cb.encode(cb.START_AT, hour * 60 + minute, nonce=session.nonce))
             ])
 
             # Options to add +15, +30, +45 minutes to current time
@@ -665,17 +767,18 @@ async def break_time(update: Update,
                 time_str = future_time.strftime("%H:%M")
                 row.append(
                     InlineKeyboardButton(f"{label} ({time_str})",
-                                     callback_data=f"time_{time_str}"))
+                                     callback_data=cb.encode(cb.START_AT, future_time.hour * 60 + future_time.minute,
+                                                             nonce=session.nonce)))
 
             keyboard.append(row)
 
             keyboard.append([
                 InlineKeyboardButton("✏️ Ввести вручную",
-                                 callback_data="time_custom")
+                                 callback_data=cb.encode(cb.START_CUSTOM, nonce=session.nonce))
             ])
-            keyboard.append([InlineKeyboardButton("❓ Помощь", callback_data="help_start_time")])
+            keyboard.append([InlineKeyboardButton("❓ Помощь", callback_data=cb.encode(cb.HELP, HELP_TOPIC_IDS["start_time"]))])
             keyboard.append(
-                [InlineKeyboardButton("❌ Отмена", callback_data="cancel")])
+                [InlineKeyboardButton("❌ Отмена", callback_data=cb.encode(cb.CANCEL, nonce=session.nonce))])
 
             reply_markup = InlineKeyboardMarkup(keyboard)
 
@@ -697,7 +800,8 @@ async def custom_start_time(update: Update, context: ContextTypes.DEFAULT_TYPE)
     # Create cancel button
     keyboard = [["❌ Отмена"]]
     reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True, one_time_keyboard=True)
-    
+
+    await update.callback_query.answer()
     await update.callback_query.message.reply_text(
         "✏️ *Ввод времени начала*\n\n"
         "Введи время начала в формате ЧЧ:ММ\n\n"
@@ -719,37 +823,20 @@ async def start_time(update: Update,
         query = update.callback_query
         await query.answer()
 
-        if query.data == "cancel":
-            await query.message.reply_text(
-                "❌ Настройка отменена. Нажми /start чтобы начать заново.")
-            return ConversationHandler.END
-            
-        if query.data == "help_start_time":
-            await query.message.reply_text(
-                HELP_MESSAGES["start_time"],
-                parse_mode='Markdown'
-            )
-            return START_TIME
-
-        if query.data == "time_custom":
-            return await custom_start_time(update, context)
-
-        if query.data.startswith("time_"):
-            time_str = query.data.split("_")[1]
+        data = cb.parse(query)
+        if data.action == cb.START_AT and data.args:
+            hour, minute = divmod(data.args[0], 60)
             try:
-                # Parse the time string
-                start_time = datetime.strptime(time_str, "%H:%M").time()
-                current_date = datetime.now().date()
-
-                # Combine date and time
-                session.start_time = datetime.combine(current_date, start_time)
+                # Button carries minutes since midnight
+                session.start_time = timer_clock.now().replace(hour=hour, minute=minute,
+                                                            second=0, microsecond=0)
 
                 # Now create end time options
                 keyboard = []
                 
                 # No end time option
                 keyboard.append([
-                    InlineKeyboardButton("⏱️ Без окончания", callback_data="end_none")
+                    InlineKeyboardButton("⏱️ Без окончания", callback_data=cb.encode(cb.END_NONE, nonce=session.nonce))
                 ])
                 
                 # Suggested durations
@@ -760,7 +847,8 @@ async def start_time(update: Update,
                     time_str = end_time.strftime("%H:%M")
                     row.append(
                         InlineKeyboardButton(f"+{hours}ч ({time_str})",
-                                         callback_data=f"end_{time_str}"))
+                                         callback_data=cb.encode(cb.END_AT, end_time.hour * 60 + end_time.minute,
+                                                                 nonce=session.nonce)))
                     if (i + 1) % 2 == 0:
                         keyboard.append(row)
                         row = []
@@ -769,15 +857,15 @@ async def start_time(update: Update,
                     keyboard.append(row)
 
                 keyboard.append([
-                    InlineKeyboardButton("✏️ Ввести вручную", callback_data="end_custom")
+                    InlineKeyboardButton("✏️ Ввести вручную", callback_data=cb.encode(cb.END_CUSTOM, nonce=session.nonce))
                 ])
-                keyboard.append([InlineKeyboardButton("❓ Помощь", callback_data="help_end_time")])
-                keyboard.append([InlineKeyboardButton("❌ Отмена", callback_data="cancel")])
+                keyboard.append([InlineKeyboardButton("❓ Помощь", callback_data=cb.encode(cb.HELP, HELP_TOPIC_IDS["end_time"]))])
+                keyboard.append([InlineKeyboardButton("❌ Отмена", callback_data=cb.encode(cb.CANCEL, nonce=session.nonce))])
 
                 reply_markup = InlineKeyboardMarkup(keyboard)
 
                 await query.message.reply_text(
-                    f"🕒 *Время начала: {start_time.strftime('%H:%M')}*\n\n"
+                    f"🕒 *Время начала: {session.start_time.strftime('%H:%M')}*\n\n"
                     f"{HELP_MESSAGES['end_time']}",
                     reply_markup=reply_markup,
                     parse_mode='Markdown')
@@ -792,16 +880,12 @@ async def start_time(update: Update,
 
     # Handle text input for custom time
     elif update.message:
-        # Check for stop command
-        if update.message.text == "❌ Отмена":
-            return await cancel(update, context)
-
         if context.user_data.get('expecting_custom_time', False):
             try:
                 time_str = update.message.text
                 # Parse the time string
                 start_time = datetime.strptime(time_str, "%H:%M").time()
-                current_date = datetime.now().date()
+                current_date = timer_clock.now().date()
 
                 # Combine date and time
                 session.start_time = datetime.combine(current_date, start_time)
@@ -811,7 +895,7 @@ async def start_time(update: Update,
                 
                 # No end time option
                 keyboard.append([
-                    InlineKeyboardButton("⏱️ Без окончания", callback_data="end_none")
+                    InlineKeyboardButton("⏱️ Без окончания", callback_data=cb.encode(cb.END_NONE, nonce=session.nonce))
                 ])
                 
                 # Suggested durations
@@ -822,7 +906,8 @@ async def start_time(update: Update,
                     time_str = end_time.strftime("%H:%M")
                     row.append(
                         InlineKeyboardButton(f"+{hours}ч ({time_str})",
-                                         callback_data=f"end_{time_str}"))
+                                         callback_data=cb.encode(cb.END_AT, end_time.hour * 60 + end_time.minute,
+                                                                 nonce=session.nonce)))
                     if (i + 1) % 2 == 0:
                         keyboard.append(row)
                         row = []
@@ -831,10 +916,10 @@ async def start_time(update: Update,
                     keyboard.append(row)
 
                 keyboard.append([
-                    InlineKeyboardButton("✏️ Ввести вручную", callback_data="end_custom")
+                    InlineKeyboardButton("✏️ Ввести вручную", callback_data=cb.encode(cb.END_CUSTOM, nonce=session.nonce))
                 ])
-                keyboard.append([InlineKeyboardButton("❓ Помощь", callback_data="help_end_time")])
-                keyboard.append([InlineKeyboardButton("❌ Отмена", callback_data="cancel")])
+                keyboard.append([InlineKeyboardButton("❓ Помощь", callback_data=cb.encode(cb.HELP, HELP_TOPIC_IDS["end_time"]))])
+                keyboard.append([InlineKeyboardButton("❌ Отмена", callback_data=cb.encode(cb.CANCEL, nonce=session.nonce))])
 
                 reply_markup = InlineKeyboardMarkup(keyboard)
 
@@ -860,7 +945,8 @@ async def custom_end_time(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     # Create cancel button
     keyboard = [["❌ Отмена"]]
     reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True, one_time_keyboard=True)
-    
+
+    await update.callback_query.answer()
     await update.callback_query.message.reply_text(
         "✏️ *Ввод времени окончания*\n\n"
         "Введи время окончания в формате ЧЧ:ММ\n\n"
@@ -881,34 +967,17 @@ async def end_time(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         query = update.callback_query
         await query.answer()
 
-        if query.data == "cancel":
-            await query.message.reply_text(
-                "❌ Настройка отменена. Нажми /start чтобы начать заново.")
-            return ConversationHandler.END
-            
-        if query.data == "help_end_time":
-            await query.message.reply_text(
-                HELP_MESSAGES["end_time"],
-                parse_mode='Markdown'
-            )
-            return END_TIME
-
-        if query.data == "end_none":
+        data = cb.parse(query)
+        if data.action == cb.END_NONE:
             session.end_time = None
             return await start_timer(update, context)
 
-        if query.data == "end_custom":
-            return await custom_end_time(update, context)
-
-        if query.data.startswith("end_"):
-            time_str = query.data.split("_")[1]
+        if data.action == cb.END_AT and data.args:
+            hour, minute = divmod(data.args[0], 60)
             try:
-                # Parse the time string
-                end_time = datetime.strptime(time_str, "%H:%M").time()
-                current_date = datetime.now().date()
-
-                # Combine date and time
-                session.end_time = datetime.combine(current_date, end_time)
+                # Button carries minutes since midnight
+                session.end_time = timer_clock.now().replace(hour=hour, minute=minute,
+                                                          second=0, microsecond=0)
 
                 # Check if end time is before start time
                 if session.end_time < session.start_time:
@@ -925,16 +994,12 @@ async def end_time(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
 
     # Handle text input for custom end time
     elif update.message:
-        # Check for stop command
-        if update.message.text == "❌ Отмена":
-            return await cancel(update, context)
-
         if context.user_data.get('expecting_custom_end_time', False):
             try:
                 time_str = update.message.text
                 # Parse the time string
                 end_time = datetime.strptime(time_str, "%H:%M").time()
-                current_date = datetime.now().date()
+                current_date = timer_clock.now().date()
 
                 # Combine date and time
                 session.end_time = datetime.combine(current_date, end_time)
@@ -962,27 +1027,40 @@ async def start_timer(update: Update,
     user_id = update.effective_user.id
 
     # Initialize session start timestamp
-    session.start_timestamp = datetime.now()
+    session.start_timestamp = timer_clock.now()
+
+    # Apply the user's progress update and dashboard preferences
+    preferences = load_user_data().get(str(user_id), {})
+    session.progress_mode = preferences.get("progress_mode")
+    session.dashboard = preferences.get("dashboard", DASHBOARD_MODE)
+
+    # The whole session is planned up front, truncated at its end time
+    session.plan = compile_plan(session.work_time, session.break_time, session.start_timestamp,
+                                session.end_time)
+    if session.plan.intervals is None:
+        plan_line = Markup()
+    elif session.plan.last_work_minutes < session.work_time:
+        plan_line = PLAN_INTERVALS_CUT.render(intervals=session.plan.intervals,
+                                              minutes=session.plan.last_work_minutes)
+    else:
+        plan_line = PLAN_INTERVALS.render(intervals=session.plan.intervals)
 
     # Create a visually appealing summary of settings
-    summary = (f"📚 *Предмет*: {session.subject}\n"
-             f"⏱ *Время работы*: {session.work_time} минут\n"
-             f"☕ *Время отдыха*: {session.break_time} минут\n"
-             f"🕒 *Время начала*: {session.start_time.strftime('%H:%M')}\n")
-
-    if session.end_time:
-        summary += f"🏁 *Время окончания*: {session.end_time.strftime('%H:%M')}\n"
-    else:
-        summary += "🏁 *Время окончания*: Не указано\n"
+    summary = SESSION_SUMMARY.render(
+        subject=session.subject, work_time=session.work_time, break_time=session.break_time,
+        start=session.start_time,
+        end=session.end_time.strftime('%H:%M') if session.end_time else "Не указано",
+        plan=plan_line)
+    started_text = SESSION_STARTED.render(summary=summary, subject=session.subject)
 
     # Create more interactive keyboard for timer control
     keyboard = [
-        [InlineKeyboardButton("⏹️ Остановить", callback_data="stop_timer")],
+        [InlineKeyboardButton("⏹️ Остановить", callback_data=cb.encode(cb.STOP, nonce=session.nonce))],
         [
-            InlineKeyboardButton("⏸️ Пауза", callback_data="pause_timer"),
-            InlineKeyboardButton("▶️ Продолжить", callback_data="resume_timer")
+            InlineKeyboardButton("⏸️ Пауза", callback_data=cb.encode(cb.PAUSE, nonce=session.nonce)),
+            InlineKeyboardButton("▶️ Продолжить", callback_data=cb.encode(cb.RESUME, nonce=session.nonce))
         ],
-        [InlineKeyboardButton("❓ Помощь", callback_data="help")]
+        [InlineKeyboardButton("❓ Помощь", callback_data=cb.encode(cb.HELP))]
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
 
@@ -999,26 +1077,22 @@ async def start_timer(update: Update,
     active_timers[user_id] = session
 
     # Create and start the timer task
-    session.task = asyncio.create_task(run_timer(update, context, user_id))
+    timer_tasks.start(user_id, session, run_timer(update, context, user_id))
 
     # Send confirmation message with fancy formatting
     if update.message:
         await update.message.reply_text(
-            f"✅ *Настройки сохранены!*\n\n{summary}\n"
-            f"🚀 Начинаем работу прямо сейчас! Удачи с изучением предмета *{session.subject}*!\n"
-            f"Используй кнопки для управления таймером.",
+            started_text,
             reply_markup=reply_markup,
-            parse_mode='Markdown')
+            parse_mode=PARSE_MODE)
         await update.message.reply_text(
             "Быстрые кнопки управления:",
             reply_markup=stop_markup)
     else:
         await update.callback_query.message.reply_text(
-            f"✅ *Настройки сохранены!*\n\n{summary}\n"
-            f"🚀 Начинаем работу прямо сейчас! Удачи с изучением предмета *{session.subject}*!\n"
-            f"Используй кнопки для управления таймером.",
+            started_text,
             reply_markup=reply_markup,
-            parse_mode='Markdown')
+            parse_mode=PARSE_MODE)
         await update.callback_query.message.reply_text(
             "Быстрые кнопки управления:", 
             reply_markup=stop_markup)
@@ -1026,27 +1100,179 @@ async def start_timer(update: Update,
     return RUNNING
 
 
+async def notify(bot, chat_id, text, **kwargs):
+    """Send an important message, or keep it for later if the Bot API is down.
+
+    Returns the sent message, or None when it was deferred. Deferred messages
+    collapse to the latest one per chat, see deliver_deferred().
+    """
+    try:
+        return await bot.send_message(chat_id=chat_id, text=text, **kwargs)
+    except BadRequest:
+        raise
+    except NetworkError as e:
+        if not bot_api.is_open:
+            logger.warning(f"Deferring notification to chat {chat_id}: {e}")
+        deferred_notifications.put(chat_id, text, kwargs)
+        return None
+
+
+async def deliver_deferred(bot) -> None:
+    """Send what was deferred during an outage, one message per chat."""
+    pending = deferred_notifications.drain()
+    if pending:
+        logger.info(f"Delivering deferred notifications to {len(pending)} chats")
+    for chat_id, text, kwargs, count in pending:
+        if bot_api.is_open:
+            deferred_notifications.requeue(chat_id, text, kwargs, count)
+            continue
+        body = text
+        if count > 1:
+            body = f"📶 Связь восстановлена, пропущено уведомлений: {count - 1}\n\n{text}"
+        try:
+            await bot.send_message(chat_id=chat_id, text=body, **kwargs)
+        except BadRequest as e:
+            logger.error(f"Error delivering deferred notification to chat {chat_id}: {e}")
+        except NetworkError:
+            deferred_notifications.requeue(chat_id, text, kwargs, count)
+
+
+async def show_session_screen(bot, chat_id, session, text, reply_markup=None) -> int:
+    """Show a phase or state of a session and return the id of its message.
+
+    `text` is MarkdownV2, rendered from one of the templates.
+
+    In dashboard mode the session's one message is edited in place, and a
+    new one is only sent when there is none yet or it can't be edited.
+    Otherwise every screen is a new message. When the Bot API is down the
+    screen is kept as the chat's pending notification.
+    """
+    if bot_api.is_open:
+        deferred_notifications.put(chat_id, text, {"parse_mode": PARSE_MODE, "reply_markup": reply_markup})
+        return session.dashboard_message_id
+
+    if session.dashboard and session.dashboard_message_id:
+        try:
+            await bot.edit_message_text(chat_id=chat_id,
+                                        message_id=session.dashboard_message_id,
+                                        text=text,
+                                        parse_mode=PARSE_MODE,
+                                        reply_markup=reply_markup)
+            return session.dashboard_message_id
+        except BadRequest as e:
+            if "not modified" in str(e).lower():
+                return session.dashboard_message_id
+            # Deleted or too old to edit, start a new dashboard below
+            logger.error(f"Error updating dashboard: {e}")
+        except NetworkError as e:
+            logger.warning(f"Deferring dashboard update in chat {chat_id}: {e}")
+            deferred_notifications.put(chat_id, text, {"parse_mode": PARSE_MODE, "reply_markup": reply_markup})
+            return session.dashboard_message_id
+
+    message = await notify(bot, chat_id, text, parse_mode=PARSE_MODE, reply_markup=reply_markup)
+    if message is None:
+        return session.dashboard_message_id
+    if session.dashboard:
+        session.dashboard_message_id = message.message_id
+    return message.message_id
+
+
+async def count_down(bot, chat_id, user_id, session, phase, message_id, reply_markup) -> bool:
+    """Wait for the end of a phase, editing its progress message on the way.
+
+    Returns False as soon as the session is paused, stopped or its break
+    skipped.
+    """
+    is_break = phase.kind == BREAK
+    total_seconds = (phase.end - phase.start).total_seconds()
+    last_edit_seconds = 0
+
+    while True:
+        remaining_seconds = (phase.end - timer_clock.now()).total_seconds()
+        if remaining_seconds <= 0:
+            return True
+        await timer_clock.sleep(min(TIMER_POLL_INTERVAL, remaining_seconds))
+        timer_tasks.tick(user_id)
+
+        if (session.is_paused or (is_break and session.is_working)
+                or active_timers.get(user_id) is not session):
+            return False
+
+        remaining_seconds = max(0, int((phase.end - timer_clock.now()).total_seconds()))
+        elapsed_seconds = total_seconds - remaining_seconds
+        if not is_break:
+            session.current_progress = int(elapsed_seconds / total_seconds * 100)
+
+        # Edit only as often as the cadence policy allows
+        edit_interval = progress_cadence.interval(total_seconds, is_break=is_break,
+                                                  mode=session.progress_mode)
+        if (edit_interval is None or remaining_seconds <= 0
+                or elapsed_seconds - last_edit_seconds < edit_interval):
+            continue
+        # Timers keep running while the Bot API is down or under overload, only the edits stop
+        if bot_api.is_open or message_id is None or overload.shed(PROGRESS):
+            continue
+        last_edit_seconds = elapsed_seconds
+        progress_cadence.record_edit()
+
+        # Update progress bar
+        progress_message = create_progress_bar(elapsed_seconds / 60, total_seconds / 60)
+        minutes, seconds = divmod(remaining_seconds, 60)
+        with span("render.timer"):
+            if is_break:
+                text = BREAK_PROGRESS.render(minutes=minutes, seconds=seconds, until=phase.end,
+                                             progress=progress_message)
+            else:
+                text = WORK_PROGRESS.render(subject=session.subject, minutes=minutes, seconds=seconds,
+                                            until=phase.end, progress=progress_message)
+        try:
+            await bot.edit_message_text(chat_id=chat_id, message_id=message_id, text=text,
+                                        parse_mode=PARSE_MODE, reply_markup=reply_markup)
+        except Exception as e:
+            logger.error(f"Error updating progress: {e}")
+
+
 async def run_timer(update: Update, context: ContextTypes.DEFAULT_TYPE,
-                  user_id: int):
-    """Run the work/break cycle."""
+                  user_id: int, chat_id=None):
+    """Run the work/break cycle by walking the session's plan.
+
+    A session taken over from another worker comes without an update, with
+    its plan compiled and its chat in `chat_id`.
+    """
     session = active_timers.get(user_id)
     if not session:
         return
 
     # Get the chat ID from the update
-    chat_id = update.effective_chat.id
+    if chat_id is None:
+        chat_id = update.effective_chat.id
 
     # Add pause functionality
-    session.is_paused = False
+    if session.plan is None:
+        session.is_paused = False
+        session.plan = compile_plan(session.work_time, session.break_time, timer_clock.now(),
+                                    session.end_time)
+    index = 0
 
     try:
+        # Taken over while paused, the plan starts when the pause ends
+        if session.is_paused:
+            if not await wait_while_paused(user_id, session):
+                return
+            first = session.plan.phase(0)
+            if first is not None:
+                session.plan = compile_plan(session.work_time, session.break_time, timer_clock.now(),
+                                            session.end_time, first=first.kind,
+                                            first_length=first.end - first.start)
+
         while True:
-            now = datetime.now()
+            phase = session.plan.phase(index)
 
-            # Check if we've reached the end time
-            if session.end_time and now >= session.end_time:
-                # Update statistics
-                await update_statistics(user_id, session)
+            # The plan ends at the end time
+            if phase is None:
+                # A stop press may have ended the session already
+                if not await finish_session(user_id, session):
+                    return
 
                 # Create return keyboard
                 keyboard = [
@@ -1056,299 +1282,382 @@ async def run_timer(update: Update, context: ContextTypes.DEFAULT_TYPE,
                 reply_markup = ReplyKeyboardMarkup(keyboard,
                                                 resize_keyboard=True)
 
-                await context.bot.send_message(
-                    chat_id=chat_id,
-                    text=f"⏰ *Время окончания достигнуто!*\n\n"
-                    f"Сессия по предмету *{session.subject}* завершена.\n\n"
-                    f"📊 *Статистика сессии:*\n"
-                    f"• Выполнено рабочих интервалов: *{session.total_work_sessions}*\n"
-                    f"• Общее время работы: *{format_time_duration(session.total_work_time)}*\n\n"
-                    f"Молодец! Для начала новой сессии нажми кнопку 'Начать новую сессию' или /start.",
-                    parse_mode='Markdown',
+                await notify(
+                    context.bot, chat_id,
+                    SESSION_ENDED.render(subject=session.subject,
+                                         intervals=session.total_work_sessions,
+                                         work_time=format_time_duration(session.total_work_time)),
+                    parse_mode=PARSE_MODE,
                     reply_markup=reply_markup)
-                if user_id in active_timers:
-                    del active_timers[user_id]
+                clear_session_state(context.user_data)
                 break
 
-            # Check if timer is paused
-            while session.is_paused:
-                await asyncio.sleep(1)  # Check every second if pause state has changed
-
-                # If timer was deleted while paused, exit
-                if user_id not in active_timers:
-                    return
+            session.is_working = phase.kind == WORK
+            minutes = round((phase.end - phase.start) / timedelta(minutes=1))
 
-            if session.is_working:
-                # Working period
-                # Create inline keyboard for quick control
-                keyboard = [
-                    [
-                        InlineKeyboardButton("⏸️ Пауза", callback_data="pause_timer"),
-                        InlineKeyboardButton("⏹️ Стоп", callback_data="stop_timer")
-                    ]
+            # Create inline keyboard for quick control, breaks can be skipped
+            keyboard = [
+                [
+                    InlineKeyboardButton("⏸️ Пауза", callback_data=cb.encode(cb.PAUSE, nonce=session.nonce)),
+                    InlineKeyboardButton("⏹️ Стоп", callback_data=cb.encode(cb.STOP, nonce=session.nonce))
                 ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-
-                # Calculate end time of this work session
-                end_work = now + timedelta(minutes=session.work_time)
-
-                # Calculate progress for this session
-                progress_message = create_progress_bar(0, session.work_time)
-
-                work_message = await context.bot.send_message(
-                    chat_id=chat_id,
-                    text=f"🚀 *Начинаем работу!*\n\n"
-                    f"📚 Предмет: *{session.subject}*\n"
-                    f"⏱️ Продолжительность: *{session.work_time}* минут\n"
-                    f"🕒 До: *{end_work.strftime('%H:%M')}*\n\n"
-                    f"{progress_message}",
-                    parse_mode='Markdown',
-                    reply_markup=reply_markup)
-
-                # Track the start time of work session for statistics
-                work_start_time = datetime.now()
-
-                # Sleep in shorter intervals and update the progress bar
-                remaining_seconds = session.work_time * 60
-                update_interval = 30  # Update progress every 30 seconds
-
-                while remaining_seconds > 0:
-                    # Sleep for shorter interval or remaining time, whichever is smaller
-                    sleep_time = min(update_interval, remaining_seconds)
-                    await asyncio.sleep(sleep_time)
-
-                    # If paused or stopped, break the loop
-                    if session.is_paused or user_id not in active_timers:
-                        break
-
-                    remaining_seconds -= sleep_time
-                    elapsed_minutes = (session.work_time * 60 - remaining_seconds) / 60
-
-                    # Update progress bar
-                    progress_message = create_progress_bar(elapsed_minutes, session.work_time)
-                    
-                    # Update progress percentage for session
-                    session.current_progress = int((elapsed_minutes / session.work_time) * 100)
-
-                    try:
-                        await context.bot.edit_message_text(
-                            chat_id=chat_id,
-                            message_id=work_message.message_id,
-                            text=f"🚀 *Работа над предметом*\n\n"
-                            f"📚 Предмет: *{session.subject}*\n"
-                            f"⏱️ Осталось: *{int(remaining_seconds / 60)}* мин *{remaining_seconds % 60}* сек\n"
-                            f"🕒 До: *{end_work.strftime('%H:%M')}*\n\n"
-                            f"{progress_message}",
-                            parse_mode='Markdown',
-                            reply_markup=reply_markup)
-                    except Exception as e:
-                        logger.error(f"Error updating progress: {e}")
-
-                # If the timer was paused or stopped, don't continue
-                if session.is_paused or user_id not in active_timers:
-                    continue
+            ]
+            if not session.is_working:
+                keyboard.append([InlineKeyboardButton("⏭️ Пропустить отдых", callback_data=cb.encode(cb.SKIP_BREAK, nonce=session.nonce))])
+            reply_markup = InlineKeyboardMarkup(keyboard)
 
+            # A phase that ended before its session was taken over is only credited
+            message_id = None
+            if phase.end > timer_clock.now():
+                progress_message = create_progress_bar(0, minutes)
+                with span("render.timer"):
+                    if session.is_working:
+                        text = WORK_SCREEN.render(subject=session.subject, minutes=minutes,
+                                                  until=phase.end, progress=progress_message)
+                    else:
+                        text = BREAK_SCREEN.render(minutes=minutes, until=phase.end,
+                                                   progress=progress_message)
+                message_id = await show_session_screen(context.bot, chat_id, session, text, reply_markup)
+                await record_phase(user_id, chat_id, session, phase, message_id)
+
+            if not await count_down(context.bot, chat_id, user_id, session, phase, message_id,
+                                    reply_markup):
+                if active_timers.get(user_id) is not session:
+                    return
+                kind, left = phase.kind, None
+                if session.is_paused:
+                    paused_at = session.pause_start_time or timer_clock.now()
+                    left = phase.end - paused_at
+                    # A pause at or after the deadline came too late, the phase is over
+                    completed = left <= timedelta(0)
+                    # The work done so far counts, the rest of the phase follows the pause
+                    if phase.kind == WORK:
+                        worked = min(paused_at, phase.end) - phase.start
+                        session.total_work_time += max(0, worked.total_seconds())
+                        if completed:
+                            session.total_work_sessions += 1
+                    if completed:
+                        kind, left = OTHER[phase.kind], None
+                    await record_pause(session)
+                    if not await wait_while_paused(user_id, session):
+                        return
+                # A skipped break goes straight to work
+                if phase.kind == BREAK and session.is_working:
+                    kind, left = WORK, None
+                session.plan = compile_plan(session.work_time, session.break_time, timer_clock.now(),
+                                            session.end_time, first=kind,
+                                            first_length=left)
+                index = 0
+                continue
+
+            index += 1
+            is_last = session.plan.phase(index) is None
+
+            if phase.kind == WORK:
                 # Update work statistics
-                work_end_time = datetime.now()
-                work_duration = (work_end_time - work_start_time).total_seconds()
-                session.total_work_time += work_duration
+                session.total_work_time += (phase.end - phase.start).total_seconds()
                 session.total_work_sessions += 1
 
                 # Play a sound or send a notification that work session is complete
-                await context.bot.send_message(
-                    chat_id=chat_id,
-                    text="🎵 *Дзинь!* Рабочий период завершен! Время для отдыха.",
-                    parse_mode='Markdown'
-                )
+                if not is_last:
+                    await notify(
+                        context.bot, chat_id,
+                        "🎵 *Дзинь!* Рабочий период завершен! Время для отдыха.",
+                        parse_mode='Markdown'
+                    )
+                continue
+
+            # Play a sound or send a notification that break is complete
+            await notify(
+                context.bot, chat_id,
+                "🔔 *Дзинь!* Перерыв окончен! Пора возвращаться к работе.",
+                parse_mode='Markdown'
+            )
 
-                # Switch to break
-                session.is_working = False
+            # The dashboard shows the next work phase right away
+            if session.dashboard or is_last:
+                continue
 
-                # Create inline keyboard for break time
-                keyboard = [
-                    [
-                        InlineKeyboardButton("⏸️ Пауза", callback_data="pause_timer"),
-                        InlineKeyboardButton("⏹️ Стоп", callback_data="stop_timer")
-                    ],
-                    [InlineKeyboardButton("⏭️ Пропустить отдых", callback_data="skip_break")]
+            # Create inline keyboard for work period
+            keyboard = [
+                [
+                    InlineKeyboardButton("⏸️ Пауза", callback_data=cb.encode(cb.PAUSE, nonce=session.nonce)),
+                    InlineKeyboardButton("⏹️ Стоп", callback_data=cb.encode(cb.STOP, nonce=session.nonce))
                 ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-
-                # Calculate end time of this break session
-                end_break = now + timedelta(minutes=session.break_time)
-
-                # Create progress bar for break
-                break_progress = create_progress_bar(0, session.break_time)
-
-                break_message = await context.bot.send_message(
-                    chat_id=chat_id,
-                    text=f"☕ *Время отдыха!*\n\n"
-                    f"💤 Отдыхай *{session.break_time}* минут\n"
-                    f"🕒 До: *{end_break.strftime('%H:%M')}*\n\n"
-                    f"{break_progress}",
-                    parse_mode='Markdown',
-                    reply_markup=reply_markup)
-                    
-                # Sleep in shorter intervals and update the progress bar for break
-                remaining_seconds = session.break_time * 60
-                update_interval = 15  # Update progress more frequently during break
-
-                while remaining_seconds > 0:
-                    # Sleep for shorter interval or remaining time, whichever is smaller
-                    sleep_time = min(update_interval, remaining_seconds)
-                    await asyncio.sleep(sleep_time)
-
-                    # If paused or stopped, break the loop
-                    if session.is_paused or user_id not in active_timers:
-                        break
-
-                    remaining_seconds -= sleep_time
-                    elapsed_minutes = (session.break_time * 60 - remaining_seconds) / 60
-
-                    # Update progress bar
-                    break_progress = create_progress_bar(elapsed_minutes, session.break_time)
-
-                    try:
-                        await context.bot.edit_message_text(
-                            chat_id=chat_id,
-                            message_id=break_message.message_id,
-                            text=f"☕ *Время отдыха!*\n\n"
-                            f"💤 Осталось: *{int(remaining_seconds / 60)}* мин *{remaining_seconds % 60}* сек\n"
-                            f"🕒 До: *{end_break.strftime('%H:%M')}*\n\n"
-                            f"{break_progress}",
-                            parse_mode='Markdown',
-                            reply_markup=reply_markup)
-                    except Exception as e:
-                        logger.error(f"Error updating break progress: {e}")
-
-                # If the timer was paused or stopped, don't continue
-                if session.is_paused or user_id not in active_timers:
-                    continue
-
-                # Play a sound or send a notification that break is complete
-                await context.bot.send_message(
-                    chat_id=chat_id,
-                    text="🔔 *Дзинь!* Перерыв окончен! Пора возвращаться к работе.",
-                    parse_mode='Markdown'
-                )
-
-                # Switch to work
-                session.is_working = True
+            ]
+            reply_markup = InlineKeyboardMarkup(keyboard)
 
-                # Create inline keyboard for work period
-                keyboard = [
-                    [
-                        InlineKeyboardButton("⏸️ Пауза", callback_data="pause_timer"),
-                        InlineKeyboardButton("⏹️ Стоп", callback_data="stop_timer")
-                    ]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
+            await notify(
+                context.bot, chat_id,
+                BREAK_OVER.render(subject=session.subject,
+                                  intervals=session.total_work_sessions,
+                                  work_time=format_time_duration(session.total_work_time)),
+                parse_mode=PARSE_MODE,
+                reply_markup=reply_markup)
 
-                await context.bot.send_message(
-                    chat_id=chat_id,
-                    text=f"🔄 *Перерыв окончен!*\n\n"
-                    f"Возвращаемся к работе над предметом *{session.subject}*.\n\n"
-                    f"Небольшая статистика:\n"
-                    f"• Выполнено интервалов: {session.total_work_sessions}\n"
-                    f"• Общее время работы: {format_time_duration(session.total_work_time)}",
-                    parse_mode='Markdown',
-                    reply_markup=reply_markup)
-            else:
-                # Break period (already handled above in the new implementation)
-                # The break period is now handled with progress updates
-                await asyncio.sleep(1)
-                
     except asyncio.CancelledError:
-        # Task was cancelled, clean up
-        if user_id in active_timers:
-            # Update statistics before deleting
-            await update_statistics(user_id, session)
-            del active_timers[user_id]
+        # Task was cancelled, credit the session unless a stop already did
+        await finish_session(user_id, session)
     except Exception as e:
         logger.error(f"Error in timer task: {e}")
-        await context.bot.send_message(
-            chat_id=chat_id,
-            text=f"❌ Произошла ошибка: {str(e)}\n\nПопробуйте перезапустить таймер с помощью /start")
-        if user_id in active_timers:
+        await notify(
+            context.bot, chat_id,
+            f"❌ Произошла ошибка: {str(e)}\n\nПопробуйте перезапустить таймер с помощью /start")
+        if active_timers.get(user_id) is session:
             del active_timers[user_id]
+            await drop_timer_state(user_id, session)
+        clear_session_state(context.user_data)
+
+
+def record_statistics(user_data, user_id, subject, work_time, work_intervals, sessions=1):
+    """Add results for a subject to the in-memory statistics of a user."""
+    user_str_id = str(user_id)
 
+    if user_str_id not in user_data:
+        user_data[user_str_id] = {"stats": {}, "custom_subjects": []}
 
-def create_progress_bar(elapsed_minutes, total_minutes, width=20):
-    """Create a visual progress bar."""
-    progress = min(1.0, elapsed_minutes / total_minutes)
-    filled_width = int(width * progress)
-    empty_width = width - filled_width
+    if "stats" not in user_data[user_str_id]:
+        user_data[user_str_id]["stats"] = {}
 
-    bar = "▓" * filled_width + "░" * empty_width
-    percentage = int(progress * 100)
+    if subject not in user_data[user_str_id]["stats"]:
+        user_data[user_str_id]["stats"][subject] = {
+            "total_sessions": 0,
+            "total_work_time": 0,
+            "total_work_intervals": 0,
+            "last_session": None
+        }
 
-    return f"[{bar}] {percentage}%"
+    # Update statistics
+    stats_cache.bump(user_str_id)
+    stats = user_data[user_str_id]["stats"][subject]
+    stats["total_sessions"] += sessions
+    stats["total_work_time"] += work_time
+    stats["total_work_intervals"] += work_intervals
+    stats["last_session"] = datetime.now().strftime("%Y-%m-%d %H:%M")
 
 
 async def update_statistics(user_id, session):
     """Update user statistics at the end of a session."""
     try:
-        user_str_id = str(user_id)
         user_data = load_user_data()
+        record_statistics(user_data, user_id, session.subject,
+                          session.total_work_time, session.total_work_sessions)
+        save_user_data(user_data)
+    except Exception as e:
+        logger.error(f"Error updating statistics: {e}")
+
+
+async def wait_while_paused(user_id, session) -> bool:
+    """Wait for a paused session to resume, False if it ended meanwhile."""
+    # Check every second if pause state has changed
+    while session.is_paused:
+        await timer_clock.sleep(1)
+        timer_tasks.tick(user_id)
+
+        # If timer was deleted while paused, exit
+        if active_timers.get(user_id) is not session:
+            return False
+    return True
+
+
+async def finish_session(user_id, session) -> bool:
+    """Remove a running session and credit its statistics.
+
+    A stop press, the end time and the task's own cancellation can all try
+    to end the same session. Only the first one credits it, later calls and
+    calls for a session that was replaced since return False.
+    """
+    if active_timers.get(user_id) is not session:
+        return False
+    # Removed before the first await so a concurrent caller sees it gone
+    del active_timers[user_id]
+    await drop_timer_state(user_id, session)
+    await update_statistics(user_id, session)
+    return True
+
+
+async def record_phase(user_id, chat_id, session, phase, message_id) -> None:
+    """Write the phase that just started to the timer store, once per phase."""
+    session.stored_state = TimerState(
+        user_id, chat_id, WORKER_ID, session.subject, phase.kind, phase.end.timestamp(),
+        end_time=session.end_time.timestamp() if session.end_time else None,
+        work_time=session.work_time, break_time=session.break_time, message_id=message_id,
+        total_work_time=session.total_work_time, total_work_sessions=session.total_work_sessions,
+        phase_start=phase.start.timestamp(), nonce=session.nonce, dashboard=session.dashboard,
+        progress_mode=session.progress_mode)
+    await put_timer_state(session.stored_state)
+
+
+async def record_pause(session) -> None:
+    state = session.stored_state
+    if state is None or state.is_paused:
+        return
+    state.paused_at = (session.pause_start_time or timer_clock.now()).timestamp()
+    # The work before the pause was credited to the session just now
+    state.total_work_time = session.total_work_time
+    await put_timer_state(state)
 
-        if user_str_id not in user_data:
-            user_data[user_str_id] = {"stats": {}, "custom_subjects": []}
 
-        if "stats" not in user_data[user_str_id]:
-            user_data[user_str_id]["stats"] = {}
+async def put_timer_state(state) -> None:
+    # Timers run on whether the store is reachable or not
+    try:
+        await timer_store.put(state)
+    except Exception as e:
+        logger.error(f"Error writing timer state of user {state.user_id}: {e}")
+
 
-        subject = session.subject
-        if subject not in user_data[user_str_id]["stats"]:
-            user_data[user_str_id]["stats"][subject] = {
-                "total_sessions": 0,
-                "total_work_time": 0,
-                "total_work_intervals": 0,
-                "last_session": None
-            }
+async def drop_timer_state(user_id, session) -> None:
+    if session.stored_state is None:
+        return
+    session.stored_state = None
+    try:
+        await timer_store.delete(user_id)
+    except Exception as e:
+        logger.error(f"Error deleting timer state of user {user_id}: {e}")
 
-        # Update statistics
-        stats = user_data[user_str_id]["stats"][subject]
-        stats["total_sessions"] += 1
-        stats["total_work_time"] += session.total_work_time
-        stats["total_work_intervals"] += session.total_work_sessions
-        stats["last_session"] = datetime.now().strftime("%Y-%m-%d %H:%M")
 
+async def recover_timers(application, due_before=float("inf")) -> None:
+    """Take over the sessions of workers that are gone.
+
+    Their timers carry on here from the phase they were in. States written
+    by older workers don't hold enough for that, those sessions are
+    credited and closed at their last phase change, telling their users.
+    """
+    try:
+        states = await timer_store.orphaned(WORKER_ID, lease=TIMER_STORE_HEARTBEAT * 3,
+                                            due_before=due_before)
+    except Exception as e:
+        logger.error(f"Error looking for orphaned timers: {e}")
+        return
+    if not states:
+        return
+    logger.warning(f"Recovering {len(states)} timer sessions of workers that are gone")
+    closed = []
+    for state in states:
+        if state.user_id in active_timers:
+            # The user started a new session here meanwhile
+            closed.append(state)
+        elif state.phase_start is None or state.work_time is None:
+            closed.append(state)
+        else:
+            await adopt_timer(application, state)
+    if not closed:
+        return
+    update_statistics_batch([(state.user_id, state.subject, state.total_work_time,
+                              state.total_work_sessions, 1) for state in closed])
+    bot = application.bot
+    for state in closed:
+        try:
+            await timer_store.delete(state.user_id)
+        except Exception as e:
+            logger.error(f"Error deleting timer state of user {state.user_id}: {e}")
+        await notify(bot, state.chat_id,
+                     SESSION_INTERRUPTED.render(subject=state.subject,
+                                                intervals=state.total_work_sessions,
+                                                work_time=format_time_duration(state.total_work_time)),
+                     parse_mode=PARSE_MODE)
+
+
+async def adopt_timer(application, state) -> None:
+    """Run a session claimed from a worker that is gone, from its stored phase on."""
+    session = UserSession()
+    session.subject = state.subject
+    session.work_time, session.break_time = state.work_time, state.break_time
+    session.end_time = datetime.fromtimestamp(state.end_time) if state.end_time else None
+    session.total_work_time = state.total_work_time
+    session.total_work_sessions = state.total_work_sessions
+    session.nonce = state.nonce or session.nonce
+    session.dashboard = state.dashboard
+    session.dashboard_message_id = state.message_id if state.dashboard else None
+    session.progress_mode = state.progress_mode
+    session.is_working = state.phase == WORK
+
+    # The phase keeps its start and deadline, so it is credited in full
+    start, length = state.phase_start, state.deadline - state.phase_start
+    if state.is_paused:
+        session.is_paused = True
+        session.pause_start_time = datetime.fromtimestamp(state.paused_at)
+        start, length = state.paused_at, state.deadline - state.paused_at
+    session.plan = compile_plan(state.work_time, state.break_time, datetime.fromtimestamp(start),
+                                session.end_time, first=state.phase,
+                                first_length=timedelta(seconds=length) if length > 0 else None)
+
+    # Written as ours at once, so no other worker claims it again
+    state.owner = WORKER_ID
+    session.stored_state = state
+    await put_timer_state(state)
+
+    active_timers[state.user_id] = session
+    context = application.context_types.context(application, chat_id=state.chat_id, user_id=state.user_id)
+    timer_tasks.start(state.user_id, session,
+                      run_timer(None, context, state.user_id, chat_id=state.chat_id))
+
+
+async def watch_timer_store(application) -> None:
+    """Keep this worker's heartbeat alive and take over sessions of workers that died."""
+    # Everything is checked once, paused sessions included, then only overdue ones
+    due_before = float("inf")
+    while True:
+        try:
+            await timer_store.heartbeat(WORKER_ID, TIMER_STORE_HEARTBEAT * 3)
+        except Exception as e:
+            logger.error(f"Timer store heartbeat failed: {e}")
+        await recover_timers(application, due_before)
+        await asyncio.sleep(TIMER_STORE_HEARTBEAT)
+        due_before = timer_clock.now().timestamp() - TIMER_STORE_HEARTBEAT * 3
+
+
+async def end_session(user_id):
+    """Cancel a user's timer task and finish the session, return the session.
+
+    Every stop path goes through here so none can leave the task running.
+    """
+    session = active_timers.get(user_id)
+    if session is None:
+        return None
+    timer_tasks.stop(user_id)
+    await finish_session(user_id, session)
+    return session
+
+
+def update_statistics_batch(credits):
+    """Credit several users with one read and one write of the data file."""
+    try:
+        user_data = load_user_data()
+        for user_id, subject, work_time, work_intervals, sessions in credits:
+            record_statistics(user_data, user_id, subject, work_time, work_intervals, sessions)
         save_user_data(user_data)
     except Exception as e:
-        logger.error(f"Error updating statistics: {e}")
+        logger.error(f"Error updating room statistics: {e}")
 
 
-def format_time_duration(seconds):
-    """Format seconds into a readable time duration."""
-    hours = int(seconds // 3600)
-    minutes = int((seconds % 3600) // 60)
-    seconds = int(seconds % 60)
+# Study rooms share one timer task per room
+room_manager = RoomManager(update_statistics_batch, create_progress_bar, progress_cadence,
+                           poll_interval=TIMER_POLL_INTERVAL, sleep=timer_clock.sleep,
+                           circuit=bot_api, overload=overload)
 
-    if hours > 0:
-        return f"{hours} ч {minutes} мин {seconds} сек"
-    elif minutes > 0:
-        return f"{minutes} мин {seconds} сек"
-    else:
-        return f"{seconds} сек"
 
+def use_timer_store(store) -> None:
+    """Keep timer state in `store`, e.g. a KVTimerStore shared with other workers."""
+    global timer_store
+    timer_store = store
 
-async def get_stats(update: Update,
-                  context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Display user statistics."""
-    user_id = str(update.effective_user.id)
-    user_data = load_user_data()
 
-    if user_id not in user_data or "stats" not in user_data[user_id] or not user_data[user_id]["stats"]:
-        await update.message.reply_text(
-            "📊 *Статистика*\n\n"
-            "У вас пока нет статистики. Начните сессию, чтобы собрать данные.",
-            parse_mode='Markdown')
-        return
+def use_timer_clock(clock) -> None:
+    """Drive timers, rooms and the edit cadence from `clock`, e.g. a VirtualClock."""
+    global timer_clock
+    timer_clock = clock
+    room_manager.sleep = clock.sleep
+    bot_api.clock = clock.monotonic
+    timer_tasks.clock = clock.monotonic
+    progress_cadence.pressure.clock = clock.monotonic
+    progress_cadence.pressure.window_start = clock.monotonic()
 
-    stats = user_data[user_id]["stats"]
 
-    # Create a formatted statistics message
-    stats_text = "📊 *Статистика по предметам*\n\n"
+def render_stats(stats):
+    """Build the statistics text and keyboard from the stats of one user."""
+    if not stats:
+        return STATS_EMPTY, None
 
     # Sort subjects by total work time (descending)
     sorted_subjects = sorted(
@@ -1357,47 +1666,67 @@ async def get_stats(update: Update,
         reverse=True
     )
 
+    subjects_text = ""
     for subject, subject_stats in sorted_subjects:
         total_time = format_time_duration(subject_stats["total_work_time"])
         avg_session_time = format_time_duration(
             subject_stats["total_work_time"] / subject_stats["total_sessions"] 
             if subject_stats["total_sessions"] > 0 else 0
         )
-        
-        stats_text += f"*{subject}*\n"
-        stats_text += f"• Всего сессий: {subject_stats['total_sessions']}\n"
-        stats_text += f"• Рабочих интервалов: {subject_stats['total_work_intervals']}\n"
-        stats_text += f"• Общее время работы: {total_time}\n"
-        stats_text += f"• Среднее время сессии: {avg_session_time}\n"
+
+        subjects_text += STATS_SUBJECT.render(subject=subject,
+                                              sessions=subject_stats['total_sessions'],
+                                              intervals=subject_stats['total_work_intervals'],
+                                              work_time=total_time, average=avg_session_time)
 
         last_session = subject_stats.get("last_session")
         if last_session:
-            stats_text += f"• Последняя сессия: {last_session}\n"
+            subjects_text += STATS_LAST_SESSION.render(last_session=last_session)
 
-        stats_text += "\n"
+        subjects_text += "\n"
 
     # Calculate overall statistics
     total_work_time = sum(subject_stats["total_work_time"] for subject_stats in stats.values())
     total_sessions = sum(subject_stats["total_sessions"] for subject_stats in stats.values())
     total_intervals = sum(subject_stats["total_work_intervals"] for subject_stats in stats.values())
-    
-    stats_text += f"*Общая статистика*\n"
-    stats_text += f"• Всего сессий: {total_sessions}\n"
-    stats_text += f"• Всего рабочих интервалов: {total_intervals}\n"
-    stats_text += f"• Общее время работы: {format_time_duration(total_work_time)}\n\n"
-    
-    stats_text += "🏆 Продолжайте в том же духе! 💪"
+
+    stats_text = STATS_TOTAL.render(subjects=Markup(subjects_text), sessions=total_sessions,
+                                    intervals=total_intervals,
+                                    work_time=format_time_duration(total_work_time))
 
     # Create keyboard for statistics interactions
     keyboard = [
-        [InlineKeyboardButton("📝 Очистить статистику", callback_data="clear_stats")],
-        [InlineKeyboardButton("🔙 Назад", callback_data="back_from_stats")]
+        [InlineKeyboardButton("📝 Очистить статистику", callback_data=cb.encode(cb.CLEAR_STATS))],
+        [InlineKeyboardButton("🔙 Назад", callback_data=cb.encode(cb.BACK_FROM_STATS))]
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
 
+    return stats_text, reply_markup
+
+
+async def get_stats(update: Update,
+                  context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Display user statistics."""
+    user_id = str(update.effective_user.id)
+
+    # The rendered text only changes when the user's statistics are written
+    rendered = stats_cache.get(user_id)
+    # Under load an outdated render is served rather than rendering again
+    if rendered is None:
+        stale = stats_cache.peek(user_id)
+        if stale is not None and overload.shed(STATS_RENDER):
+            rendered = stale
+    if rendered is None:
+        version = stats_cache.version(user_id)
+        user_data = load_user_data()
+        with span("render.stats"):
+            rendered = render_stats(user_data.get(user_id, {}).get("stats"))
+        stats_cache.put(user_id, version, rendered)
+
+    stats_text, reply_markup = rendered
     await update.message.reply_text(
         stats_text,
-        parse_mode='Markdown',
+        parse_mode=PARSE_MODE,
         reply_markup=reply_markup)
 
 
@@ -1413,8 +1742,8 @@ async def clear_stats(update: Update,
     if user_id in user_data and "stats" in user_data[user_id]:
         # Confirm clearing stats
         keyboard = [
-            [InlineKeyboardButton("✅ Да, очистить", callback_data="confirm_clear_stats")],
-            [InlineKeyboardButton("❌ Нет, отмена", callback_data="cancel_clear_stats")]
+            [InlineKeyboardButton("✅ Да, очистить", callback_data=cb.encode(cb.CONFIRM_CLEAR_STATS))],
+            [InlineKeyboardButton("❌ Нет, отмена", callback_data=cb.encode(cb.CANCEL_CLEAR_STATS))]
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
 
@@ -1437,6 +1766,7 @@ async def confirm_clear_stats(update: Update,
     if user_id in user_data and "stats" in user_data[user_id]:
         user_data[user_id]["stats"] = {}
         save_user_data(user_data)
+        stats_cache.bump(user_id)
 
         await query.message.reply_text(
             "✅ Статистика успешно очищена.\n\n"
@@ -1483,30 +1813,28 @@ async def toggle_pause(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
             # Resume the timer
             session.is_paused = False
             keyboard = [
-                [InlineKeyboardButton("⏸️ Пауза", callback_data="pause_timer")],
-                [InlineKeyboardButton("⏹️ Стоп", callback_data="stop_timer")]
+                [InlineKeyboardButton("⏸️ Пауза", callback_data=cb.encode(cb.PAUSE, nonce=session.nonce))],
+                [InlineKeyboardButton("⏹️ Стоп", callback_data=cb.encode(cb.STOP, nonce=session.nonce))]
             ]
             reply_markup = InlineKeyboardMarkup(keyboard)
             
-            await update.message.reply_text(
-                "▶️ *Таймер возобновлен*\n\nПродолжаем отсчет!",
-                parse_mode='Markdown',
-                reply_markup=reply_markup)
+            await show_session_screen(context.bot, update.effective_chat.id, session,
+                                      RESUMED_SCREEN,
+                                      reply_markup)
         else:
             # Pause the timer
             session.is_paused = True
-            session.pause_start_time = datetime.now()
+            session.pause_start_time = timer_clock.now()
             
             keyboard = [
-                [InlineKeyboardButton("▶️ Продолжить", callback_data="resume_timer")],
-                [InlineKeyboardButton("⏹️ Стоп", callback_data="stop_timer")]
+                [InlineKeyboardButton("▶️ Продолжить", callback_data=cb.encode(cb.RESUME, nonce=session.nonce))],
+                [InlineKeyboardButton("⏹️ Стоп", callback_data=cb.encode(cb.STOP, nonce=session.nonce))]
             ]
             reply_markup = InlineKeyboardMarkup(keyboard)
             
-            await update.message.reply_text(
-                "⏸️ *Таймер приостановлен*\n\nНажми 'Продолжить', чтобы возобновить отсчет.",
-                parse_mode='Markdown',
-                reply_markup=reply_markup)
+            await show_session_screen(context.bot, update.effective_chat.id, session,
+                                      PAUSED_SCREEN,
+                                      reply_markup)
     else:
         # No active timer
         keyboard = [[KeyboardButton("🚀 Старт"), KeyboardButton("📊 Статистика")]]
@@ -1528,26 +1856,17 @@ async def stop_timer(update: Update,
     if update.callback_query:
         query = update.callback_query
         await query.answer()
+        data = cb.parse(query)
 
-        if query.data == "force_stop":
+        if data and data.action == cb.FORCE_STOP:
             # Force stop existing timer
-            if user_id in active_timers:
-                session = active_timers[user_id]
-
-                # Cancel the timer task
-                if session.task and not session.task.done():
-                    session.task.cancel()
-
-                # Update statistics before removing
-                await update_statistics(user_id, session)
-
-                # Remove from active timers
-                del active_timers[user_id]
+            if await end_session(user_id):
+                clear_session_state(context.user_data)
 
                 # Start a new session
                 return await start(update, context)
 
-        if query.data == "return_to_timer":
+        if data and data.action == cb.RETURN_TO_TIMER:
             # Return to existing timer
             keyboard = [
                 [KeyboardButton("❌ Остановить таймер")],
@@ -1560,18 +1879,10 @@ async def stop_timer(update: Update,
                 reply_markup=reply_markup)
             return RUNNING
 
-        if user_id in active_timers:
-            session = active_timers[user_id]
-
-            # Cancel the timer task
-            if session.task and not session.task.done():
-                session.task.cancel()
-
-            # Update statistics before removing
-            await update_statistics(user_id, session)
-
-            # Remove from active timers
-            del active_timers[user_id]
+        # Cancel the timer task, update statistics and remove from active timers
+        session = await end_session(user_id)
+        if session:
+            clear_session_state(context.user_data)
 
             # Return to start keyboard
             keyboard = [
@@ -1581,12 +1892,9 @@ async def stop_timer(update: Update,
             reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
 
             await query.message.reply_text(
-                "⏹ *Таймер остановлен!*\n\n"
-                f"📊 *Статистика сессии:*\n"
-                f"• Выполнено рабочих интервалов: *{session.total_work_sessions}*\n"
-                f"• Общее время работы: *{format_time_duration(session.total_work_time)}*\n\n"
-                "Молодец! Для начала новой сессии нажми кнопку 'Начать новую сессию' или /start.",
-                parse_mode='Markdown',
+                SESSION_STOPPED.render(intervals=session.total_work_sessions,
+                                       work_time=format_time_duration(session.total_work_time)),
+                parse_mode=PARSE_MODE,
                 reply_markup=reply_markup)
         else:
             # Default keyboard with quick access buttons
@@ -1604,18 +1912,10 @@ async def stop_timer(update: Update,
     elif update.message and (update.message.text == "❌ Остановить таймер"
                           or update.message.text == "/stop"
                           or update.message.text == "⏹ Стоп"):
-        if user_id in active_timers:
-            session = active_timers[user_id]
-
-            # Cancel the timer task
-            if session.task and not session.task.done():
-                session.task.cancel()
-
-            # Update statistics before removing
-            await update_statistics(user_id, session)
-
-            # Remove from active timers
-            del active_timers[user_id]
+        # Cancel the timer task, update statistics and remove from active timers
+        session = await end_session(user_id)
+        if session:
+            clear_session_state(context.user_data)
 
             # Return to start keyboard
             keyboard = [
@@ -1625,12 +1925,9 @@ async def stop_timer(update: Update,
             reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
 
             await update.message.reply_text(
-                "⏹ *Таймер остановлен!*\n\n"
-                f"📊 *Статистика сессии:*\n"
-                f"• Выполнено рабочих интервалов: *{session.total_work_sessions}*\n"
-                f"• Общее время работы: *{format_time_duration(session.total_work_time)}*\n\n"
-                "Молодец! Для начала новой сессии нажми кнопку 'Начать новую сессию' или /start.",
-                parse_mode='Markdown',
+                SESSION_STOPPED.render(intervals=session.total_work_sessions,
+                                       work_time=format_time_duration(session.total_work_time)),
+                parse_mode=PARSE_MODE,
                 reply_markup=reply_markup)
         else:
             # Default keyboard with quick access buttons
@@ -1662,6 +1959,7 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
             parse_mode='Markdown',
             reply_markup=reply_markup)
     elif update.callback_query:
+        await update.callback_query.answer()
         await update.callback_query.message.reply_text(
             "❌ *Настройка отменена*\n\nЧтобы начать заново, нажми /start.",
             parse_mode='Markdown',
@@ -1669,16 +1967,11 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
 
     user_id = update.effective_user.id
 
-    # Clean up any active timer
-    if user_id in active_timers:
-        session = active_timers[user_id]
-
-        # Cancel the timer task
-        if session.task and not session.task.done():
-            session.task.cancel()
+    # Clean up any active timer, crediting the work done so far like a stop
+    await end_session(user_id)
 
-        # Remove from active timers
-        del active_timers[user_id]
+    # Drop per-session keys so abandoned setups don't accumulate
+    clear_session_state(context.user_data)
 
     return ConversationHandler.END
 
@@ -1694,19 +1987,18 @@ async def pause_timer(update: Update,
     if user_id in active_timers:
         session = active_timers[user_id]
         session.is_paused = True
-        session.pause_start_time = datetime.now()
+        session.pause_start_time = timer_clock.now()
 
         # Update keyboard to show resume option
         keyboard = [
-            [InlineKeyboardButton("▶️ Продолжить", callback_data="resume_timer")],
-            [InlineKeyboardButton("⏹️ Стоп", callback_data="stop_timer")]
+            [InlineKeyboardButton("▶️ Продолжить", callback_data=cb.encode(cb.RESUME, nonce=session.nonce))],
+            [InlineKeyboardButton("⏹️ Стоп", callback_data=cb.encode(cb.STOP, nonce=session.nonce))]
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
 
-        await query.message.reply_text(
-            "⏸️ *Таймер приостановлен*\n\nНажми 'Продолжить', чтобы возобновить отсчет.",
-            parse_mode='Markdown',
-            reply_markup=reply_markup)
+        await show_session_screen(context.bot, query.message.chat_id, session,
+                                  PAUSED_SCREEN,
+                                  reply_markup)
     else:
         # Default keyboard with quick access buttons
         keyboard = [
@@ -1736,15 +2028,14 @@ async def resume_timer(update: Update,
 
         # Update keyboard to show pause option
         keyboard = [
-            [InlineKeyboardButton("⏸️ Пауза", callback_data="pause_timer")],
-            [InlineKeyboardButton("⏹️ Стоп", callback_data="stop_timer")]
+            [InlineKeyboardButton("⏸️ Пауза", callback_data=cb.encode(cb.PAUSE, nonce=session.nonce))],
+            [InlineKeyboardButton("⏹️ Стоп", callback_data=cb.encode(cb.STOP, nonce=session.nonce))]
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
 
-        await query.message.reply_text(
-            "▶️ *Таймер возобновлен*\n\nПродолжаем отсчет!",
-            parse_mode='Markdown',
-            reply_markup=reply_markup)
+        await show_session_screen(context.bot, query.message.chat_id, session,
+                                  RESUMED_SCREEN,
+                                  reply_markup)
     else:
         # Default keyboard with quick access buttons
         keyboard = [
@@ -1777,15 +2068,15 @@ async def skip_break(update: Update,
 
             # Create keyboard for work period
             keyboard = [
-                [InlineKeyboardButton("⏸️ Пауза", callback_data="pause_timer")],
-                [InlineKeyboardButton("⏹️ Стоп", callback_data="stop_timer")]
+                [InlineKeyboardButton("⏸️ Пауза", callback_data=cb.encode(cb.PAUSE, nonce=session.nonce))],
+                [InlineKeyboardButton("⏹️ Стоп", callback_data=cb.encode(cb.STOP, nonce=session.nonce))]
             ]
             reply_markup = InlineKeyboardMarkup(keyboard)
 
-            await query.message.reply_text(
-                f"⏭️ *Перерыв пропущен!*\n\nВозвращаемся к работе над предметом *{session.subject}*.",
-                parse_mode='Markdown',
-                reply_markup=reply_markup)
+            await show_session_screen(
+                context.bot, query.message.chat_id, session,
+                BREAK_SKIPPED.render(subject=session.subject),
+                reply_markup)
     else:
         await query.message.reply_text(
             "Нет активных таймеров. Чтобы начать новую сессию, нажми /start.")
@@ -1793,6 +2084,270 @@ async def skip_break(update: Update,
     return RUNNING
 
 
+async def progress_command(update: Update,
+                         context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Show or change how often the progress message is updated."""
+    user_id = update.effective_user.id
+    user_str_id = str(user_id)
+    user_data = load_user_data()
+
+    if context.args and context.args[0] in cadence.MODES:
+        mode = context.args[0]
+        user_data.setdefault(user_str_id, {"stats": {}, "custom_subjects": []})["progress_mode"] = mode
+        save_user_data(user_data)
+
+        # Apply to the running timer right away
+        if user_id in active_timers:
+            active_timers[user_id].progress_mode = mode
+
+        await update.message.reply_text(
+            f"✅ Режим обновления прогресса: {PROGRESS_MODE_NAMES[mode]}")
+        return
+
+    current = user_data.get(user_str_id, {}).get("progress_mode") or progress_cadence.mode
+    modes = "\n".join(f"• `/progress {mode}` — {name}" for mode, name in PROGRESS_MODE_NAMES.items())
+
+    await update.message.reply_text(
+        "📈 *Обновление прогресса*\n\n"
+        f"Сейчас: {PROGRESS_MODE_NAMES[current]}\n\n"
+        f"Доступные режимы:\n{modes}",
+        parse_mode='Markdown')
+
+
+async def dashboard_command(update: Update,
+                          context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Switch between one live message per session and a message per phase."""
+    user_id = update.effective_user.id
+    user_str_id = str(user_id)
+    user_data = load_user_data()
+
+    preferences = user_data.setdefault(user_str_id, {"stats": {}, "custom_subjects": []})
+    enabled = not preferences.get("dashboard", DASHBOARD_MODE)
+    preferences["dashboard"] = enabled
+    save_user_data(user_data)
+
+    # Takes effect with the next screen of a running timer
+    if user_id in active_timers:
+        active_timers[user_id].dashboard = enabled
+
+    if enabled:
+        text = ("📟 *Режим панели включен*\n\n"
+                "Сессия показывается в одном сообщении, которое обновляется на месте. "
+                "Отдельные сообщения приходят только в конце периодов.")
+    else:
+        text = ("📜 *Режим панели выключен*\n\n"
+                "Каждый период и каждое действие будут приходить новым сообщением.")
+    await update.message.reply_text(text, parse_mode='Markdown')
+
+
+async def room_command(update: Update,
+                     context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Create a study room with a shared timer."""
+    work, rest = 25, 5
+    args = list(context.args or [])
+    try:
+        if args and args[0].isdigit():
+            work = int(args.pop(0))
+        if args and args[0].isdigit():
+            rest = int(args.pop(0))
+    except ValueError:
+        pass
+    subject_name = " ".join(args) or "Совместная учеба"
+
+    if not MIN_WORK_TIME <= work <= MAX_WORK_TIME or not MIN_BREAK_TIME <= rest <= MAX_BREAK_TIME:
+        await update.message.reply_text(
+            f"⚠️ Время работы: от {MIN_WORK_TIME} до {MAX_WORK_TIME} минут, "
+            f"время отдыха: от {MIN_BREAK_TIME} до {MAX_BREAK_TIME} минут.\n\n"
+            "Пример: /room 25 5 Математика")
+        return
+
+    try:
+        room = room_manager.create(update.effective_user.id, update.effective_chat.id,
+                                   subject_name, work, rest)
+    except RoomError as e:
+        await update.message.reply_text(f"⚠️ {e}")
+        return
+
+    await update.message.reply_text(
+        ROOM_CREATED.render(code=room.code, subject=room.subject,
+                            work_time=room.work_time, break_time=room.break_time),
+        parse_mode=PARSE_MODE)
+
+
+async def join_room(update: Update,
+                  context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Join a study room by invite code or in the group where it was created."""
+    code = context.args[0] if context.args else None
+    try:
+        room = await room_manager.join(context.bot, update.effective_user.id,
+                                       update.effective_chat.id, code)
+    except RoomError as e:
+        await update.message.reply_text(f"⚠️ {e}")
+        return
+
+    await update.message.reply_text(
+        ROOM_JOINED.render(code=room.code, subject=room.subject, members=len(room.members)),
+        parse_mode=PARSE_MODE)
+
+
+async def leave_room(update: Update,
+                   context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Leave the current study room."""
+    try:
+        room = await room_manager.leave(context.bot, update.effective_user.id)
+    except RoomError as e:
+        await update.message.reply_text(f"⚠️ {e}")
+        return
+
+    await update.message.reply_text(f"👋 Ты вышел из комнаты {room.code}.")
+
+
+async def room_start(update: Update,
+                   context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Start the shared timer of the user's room."""
+    room = room_manager.by_user.get(update.effective_user.id)
+    if room is None or room.owner_id != update.effective_user.id:
+        await update.message.reply_text("⚠️ Запустить таймер может только создатель комнаты.")
+        return
+
+    try:
+        room_manager.start(context.bot, room)
+    except RoomError as e:
+        await update.message.reply_text(f"⚠️ {e}")
+
+
+async def room_stop(update: Update,
+                  context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Stop the shared timer and close the user's room."""
+    room = room_manager.by_user.get(update.effective_user.id)
+    if room is None or room.owner_id != update.effective_user.id:
+        await update.message.reply_text("⚠️ Закрыть комнату может только ее создатель.")
+        return
+
+    await room_manager.stop(context.bot, room)
+
+
+async def debug_seconds(update: Update, context: ContextTypes.DEFAULT_TYPE, default):
+    """Capture length asked for, or None after telling the admin what is allowed."""
+    try:
+        seconds = float(context.args[0]) if context.args else default
+    except ValueError:
+        seconds = 0
+    if not 0 < seconds <= DEBUG_MAX_SECONDS:
+        await update.message.reply_text(
+            f"Укажи длительность замера в секундах, не больше {DEBUG_MAX_SECONDS:g}.")
+        return None
+    return seconds
+
+
+async def start_debug_capture(update: Update, context: ContextTypes.DEFAULT_TYPE,
+                              capture, seconds) -> None:
+    """Run a capture in the background so the admin's lane stays free meanwhile."""
+    global debug_capture
+    if debug_capture and not debug_capture.done():
+        await update.message.reply_text("Уже идет другой замер, дождись его результата.")
+        return
+    await update.message.reply_text(f"🔬 Замер на {seconds:g} с...")
+    debug_capture = context.application.create_task(capture(context.bot, update.effective_chat.id, seconds))
+
+
+async def send_profile(bot, chat_id, seconds) -> None:
+    stacks, idle = await profiling.profile_loop(seconds)
+    await bot.send_message(chat_id=chat_id, text=f"```\n{profiling.format_top(stacks, idle)}\n```",
+                           parse_mode='Markdown')
+    if stacks:
+        await bot.send_document(chat_id=chat_id, document=profiling.collapse(stacks).encode(),
+                                filename=f"profile-{timer_clock.now():%Y%m%d-%H%M%S}.folded")
+
+
+async def send_allocations(bot, chat_id, seconds) -> None:
+    diff, peak = await profiling.trace_allocations(seconds)
+    await bot.send_message(chat_id=chat_id, text=f"```\n{profiling.format_allocations(diff, peak)}\n```",
+                           parse_mode='Markdown')
+
+
+async def debug_profile_command(update: Update,
+                              context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Sample the event loop and reply with where time goes, admins only."""
+    # Others don't learn the command exists
+    if update.effective_user.id not in ADMIN_IDS:
+        return
+    seconds = await debug_seconds(update, context, 10)
+    if seconds is not None:
+        await start_debug_capture(update, context, send_profile, seconds)
+
+
+async def debug_mem_command(update: Update,
+                          context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Trace allocations and reply with where memory grew, admins only."""
+    # Others don't learn the command exists
+    if update.effective_user.id not in ADMIN_IDS:
+        return
+    seconds = await debug_seconds(update, context, 30)
+    if seconds is not None:
+        await start_debug_capture(update, context, send_allocations, seconds)
+
+
+async def debug_load_command(update: Update,
+                           context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Reply with the overload level and what was shed, admins only."""
+    # Others don't learn the command exists
+    if update.effective_user.id not in ADMIN_IDS:
+        return
+    stats = overload.stats()
+    shed = ", ".join(f"{kind}: {count}" for kind, count in stats["shed"].items()) or "ничего"
+    capacity = f" из {MAX_SESSIONS}" if MAX_SESSIONS else ""
+    await update.message.reply_text(
+        f"🚦 Нагрузка: {stats['level']}\n"
+        f"Задержка цикла событий: {stats['lag_ms']:g} мс, обновлений в обработке: {stats['depth']}\n"
+        f"Активных сессий: {len(active_timers)}{capacity}, не начато новых: {stats['sessions_rejected']}\n"
+        f"Отброшено: {shed}\n"
+        f"Смен уровня: {stats['transitions']}, секунд на уровнях: {stats['seconds']}")
+
+
+async def broadcast_command(update: Update,
+                          context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Send the rest of the message to every user, admins only."""
+    # Others don't learn the command exists
+    if update.effective_user.id not in ADMIN_IDS:
+        return
+    # Taken from the raw text, so line breaks survive
+    text = update.message.text.partition(" ")[2].strip()
+    if not text:
+        await update.message.reply_text("Напиши текст объявления после команды: /broadcast <текст>")
+        return
+    try:
+        job = await broadcaster.start(context.bot, text, update.effective_chat.id)
+    except BroadcastError as e:
+        await update.message.reply_text(str(e))
+        return
+    await update.message.reply_text(
+        f"📣 Рассылка для {job.total} пользователей запущена, не больше "
+        f"{BOT_API_BUDGET * BROADCAST_SHARE:g} сообщений в секунду.\n"
+        "/broadcast_status, /broadcast_pause, /broadcast_resume, /broadcast_cancel")
+
+
+async def broadcast_control_command(update: Update,
+                                  context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Show, pause, resume or cancel the broadcast, admins only."""
+    if update.effective_user.id not in ADMIN_IDS:
+        return
+    action = update.message.text.split()[0].split("@")[0].removeprefix("/broadcast_")
+    try:
+        if action == "pause":
+            await broadcaster.pause()
+        elif action == "resume":
+            broadcaster.resume(context.bot)
+        elif action == "cancel":
+            await broadcaster.cancel()
+        elif broadcaster.job is None:
+            raise BroadcastError("Рассылок еще не было.")
+    except BroadcastError as e:
+        await update.message.reply_text(str(e))
+        return
+    await update.message.reply_text(broadcaster.job.format())
+
+
 async def help_command(update: Update,
                      context: ContextTypes.DEFAULT_TYPE) -> None:
     """Send a help message."""
@@ -1828,6 +2383,36 @@ async def return_to_timer_handler(update: Update,
     return RUNNING
 
 
+def current_session(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Return the session that inline buttons of this user may act on."""
+    session = active_timers.get(update.effective_user.id)
+    if session is None and context.user_data is not None:
+        session = context.user_data.get('session')
+    return session
+
+
+async def track_activity(update: Update,
+                       context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Record the time of the user's latest update for the state sweeper."""
+    if update.effective_user and context.user_data is not None:
+        touch(context.user_data)
+
+
+async def setup_expired(bot, chat_id) -> None:
+    """Tell a user that the StateSweeper ended their abandoned setup."""
+    keyboard = [
+        [KeyboardButton("🚀 Старт"), KeyboardButton("📊 Статистика")],
+        [KeyboardButton("❓ Помощь")]
+    ]
+    reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+
+    await bot.send_message(
+        chat_id=chat_id,
+        text="⌛ Настройка сессии отменена из-за неактивности.\n\n"
+        "Чтобы начать заново, нажми /start.",
+        reply_markup=reply_markup)
+
+
 async def error_handler(update: Update,
                       context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle errors in the telegram bot."""
@@ -1843,69 +2428,224 @@ async def error_handler(update: Update,
         )
 
 
+def configure_logging() -> None:
+    """Configure console and file logging for the bot process."""
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO,
+        handlers=[logging.FileHandler(LOG_FILE),
+                  logging.StreamHandler()])
+
+
 def main() -> None:
     """Start the bot."""
+    startup = StartupReport(_import_started)
+    startup.mark("imports")
+
+    # Logging goes to a file only when the bot actually runs
+    configure_logging()
+    startup.mark("logging")
+
     # Load the bot token from environment variable for better security
     token = os.getenv("TELEGRAM_BOT_TOKEN")
     if not token:
         print("Ошибка: Не найден токен бота. Проверьте переменную TELEGRAM_BOT_TOKEN")
         return
 
+    recorder = UpdateRecorder(RECORD_UPDATES_FILE) if RECORD_UPDATES_FILE else None
+    tracer = Tracer(TRACE_FILE, TRACE_SAMPLE_RATE, TRACE_SLOW_MS) if TRACE_FILE else None
+    use_timer_store(open_timer_store(TIMER_STORE_URL))
+    application = build_application(token, startup, recorder=recorder, tracer=tracer)
+
+    # Start the Bot with better error handling
+    try:
+        logger.info("Starting bot...")
+        application.run_polling(allowed_updates=Update.ALL_TYPES)
+    except Exception as e:
+        logger.error(f"Error starting bot: {e}")
+        print(f"Error starting bot: {e}")
+
+
+def build_application(token, startup, request=None, recorder=None, tracer=None) -> Application:
+    """Create the Application with all handlers registered.
+
+    `request` replaces the HTTP client for Bot API calls, replay.py passes a
+    fake Bot API here. `recorder` records every incoming update, `tracer`
+    traces them.
+    """
+    # Separate pools, so long polling and outbound calls don't compete
+    if request is None:
+        request = PooledRequest("outbound", OUTBOUND_POOL_SIZE,
+                                keepalive_expiry=KEEPALIVE_EXPIRY,
+                                read_timeout=OUTBOUND_READ_TIMEOUT,
+                                connect_timeout=CONNECT_TIMEOUT,
+                                pool_timeout=OUTBOUND_POOL_TIMEOUT,
+                                http_version=HTTP_VERSION,
+                                breaker=bot_api,
+                                traffic=api_traffic)
+    updates_request = PooledRequest("updates", UPDATES_POOL_SIZE,
+                                    keepalive_expiry=KEEPALIVE_EXPIRY,
+                                    connect_timeout=CONNECT_TIMEOUT,
+                                    http_version=HTTP_VERSION)
+
+    # Reclaims user_data of users idle for longer than USER_STATE_TTL, and ends
+    # setups idle for longer than SETUP_TIMEOUT
+    sweeper = None
+    store_watch = None
+
+    async def on_startup(app: Application) -> None:
+        nonlocal sweeper, store_watch
+        sweeper = StateSweeper(app, active_timers, USER_STATE_TTL,
+                               min(STATE_SWEEP_INTERVAL, SETUP_TIMEOUT / 5),
+                               conversations=conv_handler, setup_timeout=SETUP_TIMEOUT,
+                               on_setup_expired=lambda chat_id, user_id: setup_expired(app.bot, chat_id),
+                               setup_states=(SUBJECT, WORK_TIME, BREAK_TIME, START_TIME, END_TIME))
+        sweeper.start()
+        timer_tasks.start_watchdog()
+        store_watch = asyncio.create_task(watch_timer_store(app))
+        overload.start()
+
+        # Recovery from an outage flushes what the timers couldn't send
+        bot_api.on_close = lambda: app.create_task(deliver_deferred(app.bot))
+
+        # A broadcast interrupted by a restart carries on
+        if broadcaster.load():
+            broadcaster.resume(app.bot)
+
+        # Persistence is loaded and the bot identity fetched by now
+        startup.mark("initialize")
+        logger.info(startup.format())
+
+    async def on_stop(app: Application) -> None:
+        # The cursor is saved while the bot can still send
+        await broadcaster.shutdown()
+
+    async def on_shutdown(app: Application) -> None:
+        if sweeper:
+            await sweeper.stop()
+        await timer_tasks.stop_watchdog()
+        if store_watch:
+            store_watch.cancel()
+        await overload.stop()
+        logger.info(f"Timer tasks: {timer_tasks.stats()}")
+        logger.info(f"Timer store: {timer_store.stats()}")
+        await timer_store.close()
+        logger.info(f"Stats cache: {stats_cache.stats()}")
+        logger.info(f"Bot API breaker: {bot_api.stats()}, {len(deferred_notifications)} notifications undelivered")
+        for pool in (request, updates_request):
+            if isinstance(pool, PooledRequest):
+                logger.info(f"HTTP pool {pool.name}: {pool.stats.as_dict()}")
+
+    # Floods from one user are dropped before they reach any handler
+    limiter = InboundLimiter(INBOUND_RATE, INBOUND_BURST, TAP_COLLAPSE_WINDOW)
+
+    # Dropped first under overload, timer controls are never among them
+    low_value = {"/help": HELP, HELP_BUTTON: HELP, "/stats": STATS, "📊 Статистика": STATS}
+
     # Create the Application and pass it your bot's token
-    application = Application.builder().token(token).build()
+    application = (Application.builder()
+                   .token(token)
+                   .request(request)
+                   .get_updates_request(updates_request)
+                   .persistence(SqlitePersistence(STATE_DB_FILE, flush_delay=STATE_FLUSH_DELAY))
+                   .concurrent_updates(UserLaneUpdateProcessor(MAX_CONCURRENT_UPDATES, limiter=limiter,
+                                                               recorder=recorder, tracer=tracer,
+                                                               overload=overload, low_value=low_value))
+                   .post_init(on_startup)
+                   .post_stop(on_stop)
+                   .post_shutdown(on_shutdown)
+                   .build())
+
+    startup.mark("application")
+
+    # Track user activity ahead of all other handlers
+    application.add_handler(TypeHandler(Update, track_activity), group=-1)
+
+    # Reply-keyboard texts are dispatched by exact match instead of a regex chain
+    entry_router = TextRouter({
+        "🔄 Начать новую сессию": start,
+        "🚀 Старт": start
+    })
+    timer_routes = {
+        "❌ Остановить таймер": stop_timer,
+        "⏹ Стоп": stop_timer,
+        "⏸️ Пауза/▶️ Продолжить": toggle_pause,
+        "❓ Помощь": help_command
+    }
+    running_router = TextRouter(timer_routes)
+    global_router = TextRouter({**timer_routes, "📊 Статистика": get_stats})
+
+    # Inline buttons are decoded once and routed by action code
+    callbacks = cb.CallbackDispatcher(current_session)
+    for action, callback in {
+        cb.WORK: work_time,
+        cb.WORK_CUSTOM: custom_work_time,
+        cb.BREAK: break_time,
+        cb.BREAK_CUSTOM: custom_break_time,
+        cb.START_AT: start_time,
+        cb.START_CUSTOM: custom_start_time,
+        cb.END_AT: end_time,
+        cb.END_NONE: end_time,
+        cb.END_CUSTOM: custom_end_time,
+        cb.HELP: show_help,
+        cb.CANCEL: cancel,
+        cb.STOP: stop_timer,
+        cb.PAUSE: pause_timer,
+        cb.RESUME: resume_timer,
+        cb.SKIP_BREAK: skip_break,
+        cb.FORCE_STOP: force_stop_handler,
+        cb.RETURN_TO_TIMER: return_to_timer_handler,
+        cb.CLEAR_STATS: clear_stats,
+        cb.CONFIRM_CLEAR_STATS: confirm_clear_stats,
+        cb.CANCEL_CLEAR_STATS: cancel_clear_stats,
+        cb.BACK_FROM_STATS: back_from_stats,
+    }.items():
+        callbacks.add(action, callback)
+
+    def callback_handler(*actions):
+        """Accept only the given actions, so each state keeps its own buttons."""
+        return CallbackQueryHandler(callbacks.dispatch, pattern=callbacks.pattern(actions))
+
+    def setup_text_handler(callback):
+        """Route cancel by exact text, everything else to the state's handler."""
+        router = TextRouter({"❌ Отмена": cancel}, fallback=callback)
+        return MessageHandler(filters.TEXT & ~filters.COMMAND, router.dispatch)
 
     # Add conversation handler with enhanced state handling
     conv_handler = ConversationHandler(
         entry_points=[
             CommandHandler("start", start),
-            MessageHandler(filters.Regex("🔄 Начать новую сессию"), start),
-            MessageHandler(filters.Regex("🚀 Старт"), start)
+            MessageHandler(filters.Text(entry_router.routes), entry_router.dispatch)
         ],
         states={
             SUBJECT: [
-                MessageHandler(filters.TEXT & ~filters.COMMAND, subject),
+                setup_text_handler(subject),
                 CommandHandler("cancel", cancel)
             ],
             WORK_TIME: [
-                CallbackQueryHandler(work_time, pattern=r"^work_"),
-                CallbackQueryHandler(show_help, pattern=r"^help_"),
-                CallbackQueryHandler(cancel, pattern=r"^cancel$"),
-                MessageHandler(filters.TEXT & ~filters.COMMAND, work_time),
+                callback_handler(cb.WORK, cb.WORK_CUSTOM, cb.HELP, cb.CANCEL),
+                setup_text_handler(work_time),
                 CommandHandler("cancel", cancel)
             ],
             BREAK_TIME: [
-                CallbackQueryHandler(break_time, pattern=r"^break_"),
-                CallbackQueryHandler(show_help, pattern=r"^help_"),
-                CallbackQueryHandler(cancel, pattern=r"^cancel$"),
-                MessageHandler(filters.TEXT & ~filters.COMMAND, break_time),
+                callback_handler(cb.BREAK, cb.BREAK_CUSTOM, cb.HELP, cb.CANCEL),
+                setup_text_handler(break_time),
                 CommandHandler("cancel", cancel)
             ],
             START_TIME: [
-                CallbackQueryHandler(start_time, pattern=r"^time_"),
-                CallbackQueryHandler(show_help, pattern=r"^help_"),
-                CallbackQueryHandler(cancel, pattern=r"^cancel$"),
-                MessageHandler(filters.TEXT & ~filters.COMMAND, start_time),
+                callback_handler(cb.START_AT, cb.START_CUSTOM, cb.HELP, cb.CANCEL),
+                setup_text_handler(start_time),
                 CommandHandler("cancel", cancel)
             ],
             END_TIME: [
-                CallbackQueryHandler(end_time, pattern=r"^end_"),
-                CallbackQueryHandler(show_help, pattern=r"^help_"),
-                CallbackQueryHandler(cancel, pattern=r"^cancel$"),
-                MessageHandler(filters.TEXT & ~filters.COMMAND, end_time),
+                callback_handler(cb.END_AT, cb.END_NONE, cb.END_CUSTOM, cb.HELP, cb.CANCEL),
+                setup_text_handler(end_time),
                 CommandHandler("cancel", cancel)
             ],
             RUNNING: [
-                CallbackQueryHandler(stop_timer, pattern=r"^stop_timer$"),
-                CallbackQueryHandler(pause_timer, pattern=r"^pause_timer$"),
-                CallbackQueryHandler(resume_timer, pattern=r"^resume_timer$"),
-                CallbackQueryHandler(skip_break, pattern=r"^skip_break$"),
-                CallbackQueryHandler(force_stop_handler, pattern=r"^force_stop$"),
-                CallbackQueryHandler(return_to_timer_handler, pattern=r"^return_to_timer$"),
-                CallbackQueryHandler(show_help, pattern=r"^help$"),
-                MessageHandler(filters.Regex("❌ Остановить таймер"), stop_timer),
-                MessageHandler(filters.Regex("⏹ Стоп"), stop_timer),
-                MessageHandler(filters.Regex("⏸️ Пауза/▶️ Продолжить"), toggle_pause),
-                MessageHandler(filters.Regex("❓ Помощь"), help_command),
+                callback_handler(cb.STOP, cb.PAUSE, cb.RESUME, cb.SKIP_BREAK,
+                                 cb.FORCE_STOP, cb.RETURN_TO_TIMER, cb.HELP),
+                MessageHandler(filters.Text(running_router.routes), running_router.dispatch),
                 CommandHandler("stop", stop_timer)
             ],
         },
@@ -1914,30 +2654,48 @@ def main() -> None:
             CommandHandler("stop", stop_timer)
         ],
         per_message=False,
-        name="study_timer_bot")
+        name="study_timer_bot",
+        persistent=True)
 
     # Additional handlers
     application.add_handler(conv_handler)
     application.add_handler(CommandHandler("stats", get_stats))
-    application.add_handler(MessageHandler(filters.Regex("📊 Статистика"), get_stats))
     application.add_handler(CommandHandler("help", help_command))
-    application.add_handler(MessageHandler(filters.Regex("❓ Помощь"), help_command))
-    application.add_handler(CallbackQueryHandler(clear_stats, pattern=r"^clear_stats$"))
-    application.add_handler(CallbackQueryHandler(confirm_clear_stats, pattern=r"^confirm_clear_stats$"))
-    application.add_handler(CallbackQueryHandler(cancel_clear_stats, pattern=r"^cancel_clear_stats$"))
-    application.add_handler(CallbackQueryHandler(back_from_stats, pattern=r"^back_from_stats$"))
-    application.add_handler(CallbackQueryHandler(show_help, pattern=r"^help"))
+    application.add_handler(CommandHandler("progress", progress_command))
+    application.add_handler(CommandHandler("dashboard", dashboard_command))
+    application.add_handler(CommandHandler("room", room_command))
+    application.add_handler(CommandHandler("join", join_room))
+    application.add_handler(CommandHandler("leave", leave_room))
+    application.add_handler(CommandHandler("roomstart", room_start))
+    application.add_handler(CommandHandler("roomstop", room_stop))
+    application.add_handler(CommandHandler("debug_profile", debug_profile_command))
+    application.add_handler(CommandHandler("debug_mem", debug_mem_command))
+    application.add_handler(CommandHandler("debug_load", debug_load_command))
+    application.add_handler(CommandHandler("broadcast", broadcast_command))
+    application.add_handler(CommandHandler(["broadcast_status", "broadcast_pause", "broadcast_resume",
+                                            "broadcast_cancel"], broadcast_control_command))
+    application.add_handler(MessageHandler(filters.Text(global_router.routes), global_router.dispatch))
+    application.add_handler(callback_handler(cb.CLEAR_STATS, cb.CONFIRM_CLEAR_STATS,
+                                             cb.CANCEL_CLEAR_STATS, cb.BACK_FROM_STATS, cb.HELP))
+
+    # Timer controls keep working after the conversation has timed out
+    application.add_handler(CommandHandler("stop", stop_timer))
+    application.add_handler(callback_handler(cb.STOP, cb.PAUSE, cb.RESUME, cb.SKIP_BREAK))
+
+    # Anything else is a button from an old session or an old protocol version
+    application.add_handler(CallbackQueryHandler(callbacks.reject))
 
     # Add error handler
     application.add_error_handler(error_handler)
+    startup.mark("handlers")
 
-    # Start the Bot with better error handling
-    try:
-        logger.info("Starting bot...")
-        application.run_polling(allowed_updates=Update.ALL_TYPES)
-    except Exception as e:
-        logger.error(f"Error starting bot: {e}")
-        print(f"Error starting bot: {e}")
+    # Button texts are kept verbatim in recordings, other free text is replaced
+    if recorder:
+        recorder.anonymizer.keep_texts.update(entry_router.routes, global_router.routes,
+                                              (subject.label for subject in subject_registry.predefined),
+                                              (ADD_SUBJECT_BUTTON, CANCEL_BUTTON, HELP_BUTTON))
+
+    return application
 
 
 if __name__ == "__main__":
@@ -0,0 +1,136 @@
+"""Overload levels of the update pipeline, and what is shed at each.
+
+Two signals feed the level: event loop lag, how much later than asked a
+short periodic sleep wakes up, and queue depth, the updates received but
+not finished yet. Either one past its threshold raises the level at
+once. The level only drops after both stayed below it for `cooldown`
+seconds, so it doesn't flap at the edge.
+
+ELEVATED sheds progress edits and serves /stats from a stale render
+instead of rendering it again. OVERLOADED also drops help and /stats
+requests and turns new sessions away. Timer controls and phase
+notifications never ask, so they are never shed.
+"""
+import asyncio
+import logging
+import time
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+NORMAL = 0
+ELEVATED = 1
+OVERLOADED = 2
+LEVEL_NAMES = ("normal", "elevated", "overloaded")
+
+# Kinds of low-value work
+PROGRESS = "progress"  # Progress edits of timers and rooms
+STATS_RENDER = "stats_render"  # Rendering /stats again after the statistics changed
+HELP = "help"  # Help texts
+STATS = "stats"  # /stats requests
+
+# Level from which each kind is shed
+SHED_FROM = {PROGRESS: ELEVATED, STATS_RENDER: ELEVATED, HELP: OVERLOADED, STATS: OVERLOADED}
+
+
+class OverloadController:
+    """Tracks the overload level, see the module docstring.
+
+    The update processor keeps `depth` up to date. `capacity` caps the
+    active sessions of this node, 0 for no cap.
+    """
+
+    def __init__(self, elevated_lag=0.1, overloaded_lag=0.5, elevated_depth=200, overloaded_depth=1000,
+                 capacity=0, interval=0.25, cooldown=10.0, clock=time.monotonic, sleep=asyncio.sleep):
+        self.elevated_lag = elevated_lag
+        self.overloaded_lag = overloaded_lag
+        self.elevated_depth = elevated_depth
+        self.overloaded_depth = overloaded_depth
+        self.capacity = capacity
+        self.interval = interval
+        self.cooldown = cooldown
+        self.clock = clock
+        self.sleep = sleep
+        self.depth = 0  # Updates received and not finished yet
+        self.lag = 0.0  # Seconds, a peak that halves with every calm probe
+        self.level = NORMAL
+        self.level_since = clock()
+        self.calm_since = None  # Since when the signals are below the current level
+        self.level_seconds = [0.0] * len(LEVEL_NAMES)
+        self.transitions = 0
+        self.shed_counts = Counter()
+        self.rejected = 0  # Sessions turned away
+        self.task = None
+
+    def target(self):
+        """Level the current signals call for."""
+        if self.lag >= self.overloaded_lag or self.depth >= self.overloaded_depth:
+            return OVERLOADED
+        if self.lag >= self.elevated_lag or self.depth >= self.elevated_depth:
+            return ELEVATED
+        return NORMAL
+
+    def observe(self, lag):
+        """Take one lag measurement in seconds and update the level."""
+        self.lag = max(lag, self.lag / 2)
+        target = self.target()
+        now = self.clock()
+        if target > self.level:
+            self._set_level(target, now)
+        elif target < self.level:
+            if self.calm_since is None:
+                self.calm_since = now
+            elif now - self.calm_since >= self.cooldown:
+                self._set_level(target, now)
+        else:
+            self.calm_since = None
+
+    def _set_level(self, level, now):
+        self.level_seconds[self.level] += now - self.level_since
+        log = logger.warning if level > self.level else logger.info
+        log(f"Load {LEVEL_NAMES[self.level]} -> {LEVEL_NAMES[level]}: "
+            f"loop lag {self.lag * 1000:.0f} ms, {self.depth} updates in the pipeline")
+        self.level = level
+        self.level_since = now
+        self.calm_since = None
+        self.transitions += 1
+
+    def shed(self, kind):
+        """Whether work of `kind` should be skipped right now, counted if so."""
+        if self.level < SHED_FROM[kind]:
+            return False
+        self.shed_counts[kind] += 1
+        return True
+
+    def admit_session(self, active):
+        """Whether a new session may start next to `active` ones."""
+        if self.level >= OVERLOADED or (self.capacity and active >= self.capacity):
+            self.rejected += 1
+            return False
+        return True
+
+    def start(self):
+        self.task = asyncio.create_task(self._probe())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    async def _probe(self):
+        while True:
+            started = self.clock()
+            await self.sleep(self.interval)
+            self.observe(max(0.0, self.clock() - started - self.interval))
+
+    def stats(self):
+        seconds = list(self.level_seconds)
+        seconds[self.level] += self.clock() - self.level_since
+        return {"level": LEVEL_NAMES[self.level], "lag_ms": round(self.lag * 1000, 1), "depth": self.depth,
+                "transitions": self.transitions, "shed": dict(self.shed_counts),
+                "sessions_rejected": self.rejected,
+                "seconds": {name: round(value, 1) for name, value in zip(LEVEL_NAMES, seconds)}}
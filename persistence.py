@@ -0,0 +1,87 @@
+import asyncio
+import json
+import logging
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from sqlite_store import SqliteStore
+
+logger = logging.getLogger(__name__)
+
+USER_NAMESPACE = "user"
+CHAT_NAMESPACE = "chat"
+BOT_NAMESPACE = "bot"
+CONVERSATION_NAMESPACE = "conv:"
+
+
+class SqlitePersistence(BasePersistence):
+    """Persistence that stores each user, chat and conversation under its own key.
+
+    Unlike PicklePersistence, an update only rewrites the rows that changed,
+    and writes are batched into one transaction every `flush_delay` seconds.
+    """
+
+    def __init__(self, filepath, flush_delay=1.0, update_interval=5):
+        super().__init__(store_data=PersistenceInput(callback_data=False),
+                         update_interval=update_interval)
+        self.store = SqliteStore(filepath, flush_delay=flush_delay)
+
+    async def get_user_data(self):
+        data = await asyncio.to_thread(self.store.load, USER_NAMESPACE)
+        return {int(user_id): value for user_id, value in data.items()}
+
+    async def get_chat_data(self):
+        data = await asyncio.to_thread(self.store.load, CHAT_NAMESPACE)
+        return {int(chat_id): value for chat_id, value in data.items()}
+
+    async def get_bot_data(self):
+        data = await asyncio.to_thread(self.store.load, BOT_NAMESPACE)
+        return data.get("bot", {})
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name):
+        data = await asyncio.to_thread(self.store.load, CONVERSATION_NAMESPACE + name)
+        return {tuple(json.loads(key)): state for key, state in data.items()}
+
+    async def update_conversation(self, name, key, new_state):
+        if new_state is None:
+            self.store.delete(CONVERSATION_NAMESPACE + name, json.dumps(list(key)))
+        else:
+            self.store.put(CONVERSATION_NAMESPACE + name, json.dumps(list(key)), new_state)
+
+    async def update_user_data(self, user_id, data):
+        self.store.put(USER_NAMESPACE, str(user_id), data)
+
+    async def update_chat_data(self, chat_id, data):
+        self.store.put(CHAT_NAMESPACE, str(chat_id), data)
+
+    async def update_bot_data(self, data):
+        self.store.put(BOT_NAMESPACE, "bot", data)
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_user_data(self, user_id):
+        self.store.delete(USER_NAMESPACE, str(user_id))
+
+    async def drop_chat_data(self, chat_id):
+        self.store.delete(CHAT_NAMESPACE, str(chat_id))
+
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    async def flush(self):
+        await self.store.flush()
+        stats = self.store.stats()
+        logger.info(
+            f"State store: {stats['updates']} updates, {stats['rows_written']} rows written "
+            f"in {stats['flushes']} flushes, {stats['seconds_per_update'] * 1e6:.1f} µs per update")
+        await asyncio.to_thread(self.store.close)
@@ -0,0 +1,120 @@
+"""On-demand profiling of the running bot.
+
+Nothing here runs or hooks into the interpreter until a capture is asked
+for, so there is no cost while it's unused.
+
+- sample_stacks() samples the event loop thread's stack from another thread
+  for a number of seconds. format_top() and collapse() turn the samples into
+  a top-N table and a collapsed-stack file for flamegraph tools.
+- trace_allocations() traces memory allocations for a number of seconds and
+  format_allocations() lists where memory grew the most.
+"""
+import asyncio
+import linecache
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+# Leaf frames of a loop waiting for I/O, counted as idle
+IDLE_FRAMES = {("selectors.py", "select"), ("selectors.py", "poll")}
+
+
+def frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def sample_stacks(thread_id, seconds, interval=0.005):
+    """Sample a thread's stack for `seconds`, return (stacks Counter, idle samples).
+
+    Stacks are tuples of frame labels from the outermost frame to the
+    innermost. Samples where the thread waits for I/O are only counted.
+    The sampler needs the GIL to look, so bursts of work shorter than the
+    interpreter's switch interval (5 ms by default) are undercounted.
+    """
+    stacks = Counter()
+    idle = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        frame = sys._current_frames().get(thread_id)
+        if frame is None:
+            break
+        code = frame.f_code
+        if (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+            idle += 1
+        else:
+            stack = []
+            while frame is not None:
+                stack.append(frame_label(frame))
+                frame = frame.f_back
+            stacks[tuple(reversed(stack))] += 1
+        del frame
+        time.sleep(interval)
+    return stacks, idle
+
+
+async def profile_loop(seconds, interval=0.005):
+    """Sample the running event loop from a helper thread, see sample_stacks()."""
+    loop = asyncio.get_running_loop()
+    thread_id = threading.get_ident()
+    return await loop.run_in_executor(None, sample_stacks, thread_id, seconds, interval)
+
+
+def collapse(stacks):
+    """Stacks in the collapsed format of flamegraph.pl and speedscope."""
+    return "".join(f"{';'.join(stack)} {count}\n" for stack, count in stacks.most_common())
+
+
+def top_functions(stacks, limit=15):
+    """(label, self samples, total samples) of the busiest functions."""
+    own = Counter()
+    total = Counter()
+    for stack, count in stacks.items():
+        own[stack[-1]] += count
+        for label in set(stack):
+            total[label] += count
+    return [(label, own[label], total[label]) for label, _ in own.most_common(limit)]
+
+
+def format_top(stacks, idle, limit=15):
+    busy = sum(stacks.values())
+    samples = busy + idle
+    if not samples:
+        return "No samples taken"
+    lines = [f"{samples} samples, loop busy {busy / samples:.0%}",
+             f"{'self':>6} {'total':>6}  function"]
+    for label, own, total in top_functions(stacks, limit):
+        lines.append(f"{own / samples:6.1%} {total / samples:6.1%}  {label}")
+    return "\n".join(lines)
+
+
+async def trace_allocations(seconds, frames=1):
+    """Trace allocations for `seconds`, return the growth per source line.
+
+    Tracing slows every allocation down, so it only runs for the capture.
+    """
+    if tracemalloc.is_tracing():
+        raise RuntimeError("tracemalloc is already running")
+    tracemalloc.start(frames)
+    try:
+        before = tracemalloc.take_snapshot()
+        await asyncio.sleep(seconds)
+        after = tracemalloc.take_snapshot()
+        traced, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    ignore = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, linecache.__file__)]
+    diff = after.filter_traces(ignore).compare_to(before.filter_traces(ignore), "lineno")
+    return diff, peak
+
+
+def format_allocations(diff, peak, limit=15):
+    lines = [f"Peak traced memory {peak / 1024:.0f} KiB", f"{'growth':>10} {'blocks':>7}  line"]
+    for stat in diff[:limit]:
+        where = stat.traceback[0]
+        lines.append(f"{stat.size_diff / 1024:+9.1f}K {stat.count_diff:+7}  "
+                     f"{os.path.basename(where.filename)}:{where.lineno}")
+    return "\n".join(lines)
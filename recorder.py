@@ -0,0 +1,132 @@
+"""Recording of incoming updates for offline replay.
+
+A recording is a gzip-compressed JSON lines file. The first line is a
+header, every other line is `[delay_ms, update, rebind]`: the time since the
+previous update, the anonymized update as returned by `Update.to_dict()`,
+and 1 when its callback data was bound to a session nonce that the replayer
+has to fill in again.
+
+User and chat ids are renumbered in order of appearance, names are dropped
+and free text is replaced with placeholders. Commands, button texts and
+numbers are kept, so a replay takes the same handler paths.
+"""
+import gzip
+import json
+import re
+import time
+
+import callback_data as cb
+
+FORMAT = "study-timer-updates"
+VERSION = 1
+
+# Objects whose "id" identifies a user or a chat
+ID_OBJECTS = frozenset(("from", "chat", "user", "sender_chat", "forward_from", "via_bot"))
+DROPPED_FIELDS = frozenset(("last_name", "username", "title", "bio", "phone_number",
+                            "contact", "location", "venue", "photo", "document", "voice"))
+
+# Durations, clock times and other input that carries no personal data
+NUMERIC_TEXT = re.compile(r"[\d\s:.,-]*")
+
+
+class Anonymizer:
+    """Consistently rewrite ids and free text of update dicts."""
+
+    def __init__(self, keep_texts=()):
+        self.keep_texts = set(keep_texts)
+        self.ids = {}  # abs(original id) -> replacement
+        self.texts = {}  # original text -> placeholder
+
+    def user_id(self, value):
+        # Keep the sign, group chats have negative ids
+        replacement = self.ids.setdefault(abs(value), len(self.ids) + 1000)
+        return -replacement if value < 0 else replacement
+
+    def text(self, value):
+        if value in self.keep_texts or value.startswith("/") or NUMERIC_TEXT.fullmatch(value):
+            return value
+        return self.texts.setdefault(value, f"текст {len(self.texts) + 1}")
+
+    def scrub(self, obj, parent=None):
+        """Return an anonymized copy of an update dict."""
+        if isinstance(obj, list):
+            return [self.scrub(item, parent) for item in obj]
+        if not isinstance(obj, dict):
+            return obj
+
+        result = {}
+        for key, value in obj.items():
+            if key in DROPPED_FIELDS:
+                continue
+            if key == "id" and parent in ID_OBJECTS and isinstance(value, int):
+                result[key] = self.user_id(value)
+            elif key == "first_name":
+                result[key] = "User"
+            elif key == "chat_instance":
+                result[key] = "0"
+            elif key in ("text", "caption") and isinstance(value, str):
+                result[key] = self.text(value)
+            else:
+                result[key] = self.scrub(value, key)
+
+        # Entity offsets refer to the original text
+        for text_key, entities_key in (("text", "entities"), ("caption", "caption_entities")):
+            if text_key in obj and result.get(text_key) != obj[text_key]:
+                result.pop(entities_key, None)
+        return result
+
+
+def unbind_callback(update):
+    """Strip the session nonce from callback data, return True if there was one."""
+    query = update.get("callback_query")
+    decoded = cb.decode(query.get("data")) if query else None
+    if decoded is None or not decoded.nonce:
+        return False
+    query["data"] = cb.encode(decoded.action, *decoded.args)
+    return True
+
+
+class UpdateRecorder:
+    """Append anonymized updates with their inter-arrival times to a recording."""
+
+    def __init__(self, path, keep_texts=(), flush_every=100, clock=time.monotonic):
+        self.path = path
+        self.anonymizer = Anonymizer(keep_texts)
+        self.flush_every = flush_every
+        self.clock = clock
+        self.recorded = 0
+        self._last = None
+        self._file = gzip.open(path, "wt", encoding="utf-8")
+        self._write({"format": FORMAT, "version": VERSION, "started": time.time()})
+
+    def _write(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+    def record(self, update_dict):
+        """Record one update given as a dict."""
+        now = self.clock()
+        delay_ms = 0 if self._last is None else round((now - self._last) * 1000)
+        self._last = now
+
+        update = self.anonymizer.scrub(update_dict)
+        rebind = unbind_callback(update)
+        self._write([delay_ms, update, int(rebind)])
+
+        self.recorded += 1
+        if self.recorded % self.flush_every == 0:
+            self._file.flush()
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+
+def read_recording(path):
+    """Yield (delay_seconds, update_dict, rebind) from a recording."""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        header = json.loads(f.readline())
+        if header.get("format") != FORMAT or header.get("version") != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} update recording")
+        for line in f:
+            delay_ms, update, rebind = json.loads(line)
+            yield delay_ms / 1000, update, bool(rebind)
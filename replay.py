@@ -0,0 +1,199 @@
+"""Replay recorded update streams against a fake Bot API.
+
+Record production traffic by setting RECORD_UPDATES_FILE, then replay it
+into the full Application with its handlers, lanes, limiter and
+persistence:
+
+    python replay.py updates.jsonl.gz --speed 10 --out results.json --baseline previous.json
+
+Bot API calls are answered locally after `--latency` milliseconds. State
+and statistics go to a temporary directory. Timer phases still run on the
+wall clock, so transitions are only reached when the recording spans them.
+`--trace FILE` traces every replayed update to FILE, see tracing.py.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+
+from telegram import Update
+from telegram.request import BaseRequest
+
+import callback_data as cb
+from recorder import read_recording
+from tracing import Tracer, span
+
+REPLAY_TOKEN = "123456:replay"
+
+
+class FakeBotRequest(BaseRequest):
+    """Answer Bot API requests locally after a fixed latency and count them."""
+
+    def __init__(self, latency=0.05):
+        self.latency = latency
+        self.calls = Counter()
+        self._message_id = 0
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def _message(self, parameters):
+        self._message_id += 1
+        chat_id = parameters.get("chat_id", 0)
+        return {"message_id": parameters.get("message_id", self._message_id),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "group"},
+                "text": parameters.get("text", "")}
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        api_method = url.rsplit("/", 1)[-1]
+        parameters = request_data.parameters if request_data else {}
+        self.calls[api_method] += 1
+        if self.latency:
+            with span(f"bot_api.{api_method}", pool="fake"):
+                await asyncio.sleep(self.latency)
+
+        if api_method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Replay", "username": "replay_bot"}
+        elif api_method in ("sendMessage", "editMessageText"):
+            result = self._message(parameters)
+        elif api_method == "getUpdates":
+            result = []
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode("utf-8")
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))] if values else 0.0
+
+
+def rebind_callback(application, data):
+    """Give a recorded button the nonce of the user's current session."""
+    query = data["callback_query"]
+    decoded = cb.decode(query["data"])
+    session = application.user_data.get(query["from"]["id"], {}).get("session")
+    # Without a session the button is stale, as it was when it was pressed
+    nonce = getattr(session, "nonce", None) or 1
+    query["data"] = cb.encode(decoded.action, *decoded.args, nonce=nonce)
+
+
+async def replay(path, speed=1.0, latency=0.05, trace=None):
+    """Feed a recording into the bot and return latency and throughput figures."""
+    # Imported here so the environment set up by main() applies to its settings
+    import main as bot
+    from startup import StartupReport
+
+    request = FakeBotRequest(latency)
+    tracer = Tracer(trace, sample_rate=1.0) if trace else None
+    application = bot.build_application(REPLAY_TOKEN, StartupReport(), request=request, tracer=tracer)
+    processor = application.update_processor
+
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+
+    latencies = []
+    tasks = []
+
+    async def feed(data, rebind):
+        started = time.perf_counter()
+        if rebind:
+            rebind_callback(application, data)
+        update = Update.de_json(data, application.bot)
+        await processor.process_update(update, application.process_update(update))
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    due = 0.0
+    for delay, data, rebind in read_recording(path):
+        if speed:
+            due += delay / speed
+            wait = due - (time.perf_counter() - started)
+            if wait > 0:
+                await asyncio.sleep(wait)
+        tasks.append(asyncio.create_task(feed(data, rebind)))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+
+    for user_id in list(bot.timer_tasks.tasks):
+        bot.timer_tasks.stop(user_id)
+    await application.stop()
+    if application.post_shutdown:
+        await application.post_shutdown(application)
+    await application.shutdown()
+
+    limiter = processor.limiter
+    return {
+        "updates": len(tasks),
+        "seconds": round(elapsed, 3),
+        "throughput": round(len(tasks) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "api_calls": dict(request.calls),
+        "dropped": limiter.dropped if limiter else {},
+    }
+
+
+def compare(results, baseline):
+    """Lines describing the change of each figure against a baseline run."""
+    lines = []
+    for key in ("throughput", "p50_ms", "p95_ms", "p99_ms"):
+        old, new = baseline.get(key), results[key]
+        change = f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+        lines.append(f"{key:10} {old!s:>10} -> {new!s:>10}  {change}")
+    old_calls = sum(baseline.get("api_calls", {}).values())
+    lines.append(f"{'api_calls':10} {old_calls:>10} -> {sum(results['api_calls'].values()):>10}")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("recording")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="replay speed factor, 0 feeds updates without pauses")
+    parser.add_argument("--latency", type=float, default=50, help="fake Bot API latency in ms")
+    parser.add_argument("--out", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="results of a previous run to compare with")
+    parser.add_argument("--trace", help="write a trace of every update to this JSONL file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Keep the replay away from the bot's real state and statistics
+        os.environ["STATE_DB_FILE"] = os.path.join(tmp, "state.sqlite3")
+        os.environ["USER_DATA_FILE"] = os.path.join(tmp, "user_data.json")
+        os.environ["RECORD_UPDATES_FILE"] = ""
+        # A real broadcast in progress would be sent on and its cursor saved
+        os.environ["BROADCAST_STATE_FILE"] = os.path.join(tmp, "broadcast.json")
+        # Never join a shared timer store and take over live workers' sessions
+        os.environ["TIMER_STORE_URL"] = ""
+        results = asyncio.run(replay(args.recording, args.speed, args.latency / 1000, args.trace))
+
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print("\n".join(compare(results, baseline)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
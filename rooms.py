@@ -0,0 +1,242 @@
+import asyncio
+import logging
+import secrets
+
+from overload import PROGRESS
+from templates import PARSE_MODE, Template
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+ROOM_SCREEN = Template("👥 *Комната {code}* — {subject}\n\n"
+                       "{header}\n"
+                       "⏱️ Осталось: *{minutes}* мин *{seconds}* сек\n"
+                       "👤 Участников: *{members}*\n\n"
+                       "{progress}")
+ROOM_WORKING = Template("🚀 *Работаем*").render()
+ROOM_RESTING = Template("☕ *Отдыхаем*").render()
+ROOM_CLOSED = Template("⏹ *Комната {code} закрыта.*\n\nВыполнено циклов: *{cycles}*")
+
+
+class RoomError(Exception):
+    """Raised for room operations that can't be performed, carries a user-facing message."""
+
+
+class StudyRoom:
+    """A shared work/break timer for several users."""
+
+    def __init__(self, code, owner_id, chat_id, subject, work_time, break_time):
+        self.code = code
+        self.owner_id = owner_id
+        self.chat_id = chat_id  # Chat where the room was created
+        self.subject = subject
+        self.work_time = work_time
+        self.break_time = break_time
+        self.members = {}  # user_id -> chat_id where the member follows the room
+        self.messages = {}  # chat_id -> message_id of the live message
+        self.credited = set()  # Members credited with at least one interval
+        self.is_working = True
+        self.cycles = 0
+        self.task = None
+
+    @property
+    def is_running(self):
+        return self.task is not None and not self.task.done()
+
+    def chats(self):
+        """Chats that get the live message, one per chat however many members it has."""
+        return set(self.members.values())
+
+
+class RoomManager:
+    """Owns all study rooms and drives each with a single timer task.
+
+    Every chat taking part in a room gets one live message that is edited in
+    place. When a work interval ends, all members are credited with a single
+    call to `credit_stats(credits)`, where credits is a list of
+    (user_id, subject, work_seconds, work_intervals, sessions) tuples.
+    """
+
+    def __init__(self, credit_stats, progress_bar, cadence_policy, poll_interval=15,
+                 sleep=asyncio.sleep, circuit=None, overload=None):
+        self.credit_stats = credit_stats
+        self.progress_bar = progress_bar
+        self.cadence = cadence_policy
+        self.poll_interval = poll_interval
+        self.sleep = sleep
+        self.circuit = circuit  # Live messages aren't edited while it is open
+        self.overload = overload  # Nor while an OverloadController sheds progress edits
+        self.rooms = {}  # code -> room
+        self.by_user = {}  # user_id -> room
+        self.by_chat = {}  # group chat_id -> room created there
+
+    def create(self, owner_id, chat_id, subject, work_time, break_time):
+        if owner_id in self.by_user:
+            raise RoomError("Ты уже в комнате. Сначала выйди из нее командой /leave.")
+
+        code = secrets.token_hex(3).upper()
+        while code in self.rooms:
+            code = secrets.token_hex(3).upper()
+
+        room = StudyRoom(code, owner_id, chat_id, subject, work_time, break_time)
+        room.members[owner_id] = chat_id
+        self.rooms[code] = room
+        self.by_user[owner_id] = room
+        if chat_id != owner_id:
+            # Group chats: members can join without a code
+            self.by_chat[chat_id] = room
+        return room
+
+    def find(self, chat_id, code=None):
+        if code:
+            return self.rooms.get(code.upper())
+        return self.by_chat.get(chat_id)
+
+    async def join(self, bot, user_id, chat_id, code=None):
+        room = self.find(chat_id, code)
+        if room is None:
+            raise RoomError("Комната не найдена. Проверь код приглашения.")
+        if user_id in self.by_user:
+            raise RoomError("Ты уже в комнате. Сначала выйди из нее командой /leave.")
+
+        room.members[user_id] = chat_id
+        self.by_user[user_id] = room
+
+        # A running room gets a live message in the newcomer's chat right away
+        if room.is_running and chat_id not in room.messages:
+            try:
+                message = await bot.send_message(chat_id=chat_id, text=self.render(room, None),
+                                                 parse_mode=PARSE_MODE)
+                room.messages[chat_id] = message.message_id
+            except Exception as e:
+                logger.error(f"Error posting room {room.code} message in chat {chat_id}: {e}")
+        return room
+
+    async def leave(self, bot, user_id):
+        room = self.by_user.pop(user_id, None)
+        if room is None:
+            raise RoomError("Ты не состоишь ни в одной комнате.")
+
+        room.members.pop(user_id, None)
+        if user_id in room.credited:
+            room.credited.discard(user_id)
+            self.credit_stats([(user_id, room.subject, 0, 0, 1)])
+
+        if not room.members:
+            await self.stop(bot, room)
+        elif user_id == room.owner_id:
+            # Hand the room over to the longest-standing member
+            room.owner_id = next(iter(room.members))
+        return room
+
+    def start(self, bot, room):
+        if room.is_running:
+            raise RoomError("Таймер комнаты уже запущен.")
+        room.task = asyncio.create_task(self._run(bot, room))
+
+    async def stop(self, bot, room):
+        if room.task and not room.task.done():
+            room.task.cancel()
+            try:
+                await room.task
+            except asyncio.CancelledError:
+                pass
+
+        # One session per member who took part in at least one interval
+        credits = [(user_id, room.subject, 0, 0, 1) for user_id in room.credited]
+        if credits:
+            self.credit_stats(credits)
+        room.credited.clear()
+
+        for user_id in list(room.members):
+            if self.by_user.get(user_id) is room:
+                del self.by_user[user_id]
+        self.rooms.pop(room.code, None)
+        if self.by_chat.get(room.chat_id) is room:
+            del self.by_chat[room.chat_id]
+
+        for chat_id in room.chats():
+            try:
+                await bot.send_message(
+                    chat_id=chat_id,
+                    text=ROOM_CLOSED.render(code=room.code, cycles=room.cycles),
+                    parse_mode=PARSE_MODE)
+            except Exception as e:
+                logger.error(f"Error notifying room {room.code} in chat {chat_id}: {e}")
+
+    def render(self, room, remaining_seconds):
+        phase_minutes = room.work_time if room.is_working else room.break_time
+        if remaining_seconds is None:
+            remaining_seconds = phase_minutes * 60
+        elapsed_minutes = phase_minutes - remaining_seconds / 60
+        with span("render.room"):
+            return ROOM_SCREEN.render(code=room.code, subject=room.subject,
+                                      header=ROOM_WORKING if room.is_working else ROOM_RESTING,
+                                      minutes=int(remaining_seconds // 60),
+                                      seconds=int(remaining_seconds % 60), members=len(room.members),
+                                      progress=self.progress_bar(elapsed_minutes, phase_minutes))
+
+    async def _post_live_messages(self, bot, room, remaining_seconds):
+        """Send a fresh live message to every chat of the room."""
+        text = self.render(room, remaining_seconds)
+        room.messages = {}
+        for chat_id in room.chats():
+            try:
+                message = await bot.send_message(chat_id=chat_id, text=text, parse_mode=PARSE_MODE)
+                room.messages[chat_id] = message.message_id
+            except Exception as e:
+                logger.error(f"Error posting room {room.code} message in chat {chat_id}: {e}")
+
+    async def _edit_live_messages(self, bot, room, remaining_seconds):
+        if self.circuit and self.circuit.is_open:
+            return
+        if self.overload and self.overload.shed(PROGRESS):
+            return
+        text = self.render(room, remaining_seconds)
+        for chat_id, message_id in list(room.messages.items()):
+            try:
+                await bot.edit_message_text(chat_id=chat_id, message_id=message_id,
+                                            text=text, parse_mode=PARSE_MODE)
+            except Exception as e:
+                logger.error(f"Error updating room {room.code} message in chat {chat_id}: {e}")
+
+    async def _phase(self, bot, room, minutes):
+        phase_seconds = minutes * 60
+        remaining_seconds = phase_seconds
+        last_edit_seconds = 0
+
+        await self._post_live_messages(bot, room, remaining_seconds)
+
+        while remaining_seconds > 0:
+            sleep_time = min(self.poll_interval, remaining_seconds)
+            await self.sleep(sleep_time)
+            remaining_seconds -= sleep_time
+
+            edit_interval = self.cadence.interval(phase_seconds, is_break=not room.is_working)
+            elapsed_seconds = phase_seconds - remaining_seconds
+            if (edit_interval is None or remaining_seconds <= 0
+                    or elapsed_seconds - last_edit_seconds < edit_interval):
+                continue
+            last_edit_seconds = elapsed_seconds
+            # One edit per chat, counted once per room tick
+            self.cadence.record_edit()
+            await self._edit_live_messages(bot, room, remaining_seconds)
+
+    async def _run(self, bot, room):
+        try:
+            while room.members:
+                room.is_working = True
+                await self._phase(bot, room, room.work_time)
+
+                # Credit everybody in the room with one batched write
+                credits = [(user_id, room.subject, room.work_time * 60, 1, 0) for user_id in room.members]
+                self.credit_stats(credits)
+                room.credited.update(room.members)
+                room.cycles += 1
+
+                room.is_working = False
+                await self._phase(bot, room, room.break_time)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error in room {room.code} timer: {e}")
@@ -0,0 +1,26 @@
+class TextRouter:
+    """Dispatch reply-keyboard texts through a table of exact strings.
+
+    Texts without a route go to `fallback`, typically the free-text handler
+    of a conversation state. Register the router with
+    `MessageHandler(filters.Text(router.routes), router.dispatch)`, or with a
+    plain text filter when a fallback is set.
+    """
+
+    def __init__(self, routes=None, fallback=None):
+        self.routes = dict(routes or {})
+        self.fallback = fallback
+
+    def add(self, text, callback):
+        """Route an exact text to a callback."""
+        self.routes[text] = callback
+
+    def resolve(self, text):
+        """Return the callback for a text, or the fallback."""
+        return self.routes.get(text, self.fallback)
+
+    async def dispatch(self, update, context):
+        callback = self.routes.get(update.message.text, self.fallback)
+        if callback is None:
+            return None
+        return await callback(update, context)
@@ -0,0 +1,105 @@
+"""Phase boundaries of a timer session, compiled once and walked by run_timer.
+
+A session with an end time is compiled into every work and break phase up
+to that time. A phase running past the end is cut at it, or dropped if
+less than MIN_PHASE of it is left, and a break at the very end is dropped.
+An open-ended session compiles OPEN_ENDED_CYCLES cycles at a time and
+grows when run_timer reaches the last one.
+
+Pausing or skipping a break recompiles the plan from that moment, the
+current phase first with what is left of it.
+"""
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from timer_state import BREAK, WORK
+
+# Truncated phases shorter than this aren't worth starting
+MIN_PHASE = timedelta(minutes=1)
+
+# Work/break cycles compiled at a time for sessions without an end time
+OPEN_ENDED_CYCLES = 8
+
+Phase = namedtuple("Phase", ["kind", "start", "end"])
+
+OTHER = {WORK: BREAK, BREAK: WORK}
+
+
+class SessionPlan:
+    """The phases of a session in order, see compile_plan()."""
+    __slots__ = ("work", "rest", "end_time", "phases")
+
+    def __init__(self, work, rest, end_time, phases):
+        self.work = work
+        self.rest = rest
+        self.end_time = end_time
+        self.phases = phases
+
+    def phase(self, index):
+        """The phase at `index`, None once the session is over."""
+        if index >= len(self.phases) and self.end_time is None:
+            self._extend(self.phases[-1].end, OTHER[self.phases[-1].kind])
+        return self.phases[index] if index < len(self.phases) else None
+
+    def _extend(self, start, kind):
+        for _ in range(OPEN_ENDED_CYCLES * 2):
+            length = self.work if kind == WORK else self.rest
+            self.phases.append(Phase(kind, start, start + length))
+            start += length
+            kind = OTHER[kind]
+
+    @property
+    def intervals(self):
+        """Work phases of a session with an end time, None without one."""
+        if self.end_time is None:
+            return None
+        return sum(phase.kind == WORK for phase in self.phases)
+
+    @property
+    def last_work_minutes(self):
+        """Length of the last work phase in minutes, it may be cut short."""
+        works = [phase for phase in self.phases if phase.kind == WORK]
+        return int((works[-1].end - works[-1].start) / timedelta(minutes=1)) if works else 0
+
+    def to_json(self):
+        """The plan as plain data, for checkpoints."""
+        return {"work": self.work.total_seconds(), "rest": self.rest.total_seconds(),
+                "end_time": self.end_time.timestamp() if self.end_time else None,
+                "phases": [(phase.kind, phase.start.timestamp(), phase.end.timestamp())
+                           for phase in self.phases]}
+
+    @classmethod
+    def from_json(cls, data):
+        end_time = data["end_time"]
+        return cls(timedelta(seconds=data["work"]), timedelta(seconds=data["rest"]),
+                   datetime.fromtimestamp(end_time) if end_time is not None else None,
+                   [Phase(kind, datetime.fromtimestamp(start), datetime.fromtimestamp(end))
+                    for kind, start, end in data["phases"]])
+
+
+def compile_plan(work_minutes, break_minutes, start, end_time=None, first=WORK, first_length=None):
+    """Compile the phases from `start` on, beginning with a `first` phase.
+
+    `first_length` shortens the first phase, e.g. to what was left of it
+    at a pause.
+    """
+    plan = SessionPlan(timedelta(minutes=work_minutes), timedelta(minutes=break_minutes),
+                       end_time, [])
+    if end_time is None:
+        length = first_length or (plan.work if first == WORK else plan.rest)
+        plan.phases.append(Phase(first, start, start + length))
+        plan._extend(start + length, OTHER[first])
+        return plan
+
+    kind, length = first, first_length
+    while start < end_time:
+        length = length or (plan.work if kind == WORK else plan.rest)
+        end = min(start + length, end_time)
+        if end < start + length and end - start < MIN_PHASE:
+            break
+        plan.phases.append(Phase(kind, start, end))
+        start, kind, length = end, OTHER[kind], None
+    # Nothing follows a break at the end
+    if plan.phases and plan.phases[-1].kind == BREAK:
+        plan.phases.pop()
+    return plan
@@ -0,0 +1,101 @@
+"""Runtime settings read from the environment and the .env file.
+
+Only the bot entry point imports this module, so helpers and tools that
+import e.g. formatting or cadence don't read .env as a side effect.
+"""
+import os
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+LOG_FILE = os.getenv("LOG_FILE", "bot.log")
+
+# User statistics file path and how many users' rendered /stats are cached
+USER_DATA_FILE = os.getenv("USER_DATA_FILE", "user_data.json")
+STATS_CACHE_SIZE = int(os.getenv("STATS_CACHE_SIZE", "1024"))
+
+# State lifecycle (seconds)
+SETUP_TIMEOUT = int(os.getenv("SETUP_TIMEOUT", "900"))
+USER_STATE_TTL = int(os.getenv("USER_STATE_TTL", "86400"))
+STATE_SWEEP_INTERVAL = int(os.getenv("STATE_SWEEP_INTERVAL", "600"))
+
+# Timer task watchdog: seconds between audits for orphaned tasks and sessions,
+# and seconds without a tick after which a running timer task is reported stuck
+TASK_AUDIT_INTERVAL = int(os.getenv("TASK_AUDIT_INTERVAL", "60"))
+STUCK_TASK_AFTER = int(os.getenv("STUCK_TASK_AFTER", "120"))
+
+# Live timer state: empty keeps it in this process, kv://host:port shares it with
+# other workers through a Redis-compatible server (see kv_server.py). Workers renew
+# a heartbeat every TIMER_STORE_HEARTBEAT seconds, sessions of a worker that
+# missed three are ended and credited by another
+TIMER_STORE_URL = os.getenv("TIMER_STORE_URL", "")
+TIMER_STORE_HEARTBEAT = float(os.getenv("TIMER_STORE_HEARTBEAT", "10"))
+
+# Conversation and user_data persistence
+STATE_DB_FILE = os.getenv("STATE_DB_FILE", "bot_state.sqlite3")
+STATE_FLUSH_DELAY = float(os.getenv("STATE_FLUSH_DELAY", "1.0"))
+
+# Bot API connection pools: getUpdates long polling gets its own small pool, so
+# sends and edits never wait behind it. Timeouts in seconds. HTTP_VERSION is 1.1
+# or 2, HTTP/2 needs python-telegram-bot[http2]
+OUTBOUND_POOL_SIZE = int(os.getenv("OUTBOUND_POOL_SIZE", "16"))
+OUTBOUND_POOL_TIMEOUT = float(os.getenv("OUTBOUND_POOL_TIMEOUT", "5.0"))
+OUTBOUND_READ_TIMEOUT = float(os.getenv("OUTBOUND_READ_TIMEOUT", "10.0"))
+UPDATES_POOL_SIZE = int(os.getenv("UPDATES_POOL_SIZE", "2"))
+CONNECT_TIMEOUT = float(os.getenv("CONNECT_TIMEOUT", "5.0"))
+KEEPALIVE_EXPIRY = float(os.getenv("KEEPALIVE_EXPIRY", "30.0"))
+HTTP_VERSION = os.getenv("HTTP_VERSION", "1.1")
+
+# Bot API circuit breaker: consecutive failed calls that open it, and seconds
+# before a probe call is let through. Timers keep running while it is open
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", "30"))
+
+# Updates processed at once, updates of one user always run in order
+MAX_CONCURRENT_UPDATES = int(os.getenv("MAX_CONCURRENT_UPDATES", "64"))
+
+# Inbound flood protection: tokens per second and bucket size per user, and
+# the window in which identical taps collapse into one
+INBOUND_RATE = float(os.getenv("INBOUND_RATE", "1.0"))
+INBOUND_BURST = int(os.getenv("INBOUND_BURST", "10"))
+TAP_COLLAPSE_WINDOW = float(os.getenv("TAP_COLLAPSE_WINDOW", "1.0"))
+
+# Progress message updates
+PROGRESS_MODE = os.getenv("PROGRESS_MODE", "adaptive")
+PROGRESS_EDIT_BUDGET = float(os.getenv("PROGRESS_EDIT_BUDGET", "20"))
+
+# Show each session in one message edited in place, users can switch with /dashboard
+DASHBOARD_MODE = os.getenv("DASHBOARD_MODE", "1") == "1"
+
+# Record anonymized incoming updates to this file for replay.py, off when empty
+RECORD_UPDATES_FILE = os.getenv("RECORD_UPDATES_FILE", "")
+
+# Trace updates to this JSONL file, off when empty. A share of TRACE_SAMPLE_RATE
+# of all updates is kept, plus every update that took TRACE_SLOW_MS or longer
+TRACE_FILE = os.getenv("TRACE_FILE", "")
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", "500"))
+
+# Telegram user ids allowed to run /debug_profile and /debug_mem, comma separated,
+# and the longest capture they may ask for in seconds
+ADMIN_IDS = {int(user_id) for user_id in os.getenv("ADMIN_IDS", "").split(",") if user_id.strip()}
+DEBUG_MAX_SECONDS = float(os.getenv("DEBUG_MAX_SECONDS", "120"))
+
+# Admin broadcasts: messages per second the bot may send in all, the share of that
+# a broadcast may use, and the file that keeps its cursor across restarts
+BOT_API_BUDGET = float(os.getenv("BOT_API_BUDGET", "30"))
+BROADCAST_SHARE = float(os.getenv("BROADCAST_SHARE", "0.2"))
+BROADCAST_STATE_FILE = os.getenv("BROADCAST_STATE_FILE", "broadcast.json")
+
+# Overload protection: event loop lag in milliseconds or updates in the pipeline at
+# which progress edits are shed (LOAD_ELEVATED_*), and help texts, /stats and new
+# sessions too (LOAD_OVERLOADED_*). The level drops after LOAD_COOLDOWN calm seconds.
+# MAX_SESSIONS caps the active sessions of this process, 0 for no cap
+LOAD_ELEVATED_LAG_MS = float(os.getenv("LOAD_ELEVATED_LAG_MS", "100"))
+LOAD_OVERLOADED_LAG_MS = float(os.getenv("LOAD_OVERLOADED_LAG_MS", "500"))
+LOAD_ELEVATED_DEPTH = int(os.getenv("LOAD_ELEVATED_DEPTH", "200"))
+LOAD_OVERLOADED_DEPTH = int(os.getenv("LOAD_OVERLOADED_DEPTH", "1000"))
+LOAD_COOLDOWN = float(os.getenv("LOAD_COOLDOWN", "10"))
+MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", "0"))
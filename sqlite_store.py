@@ -0,0 +1,193 @@
+import asyncio
+import logging
+import pickle
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Marker for pending deletions
+_DELETE = object()
+
+
+class SqliteStore:
+    """Namespaced key-value store on SQLite with debounced, batched writes.
+
+    Values are pickled and written off the event loop. Every flush commits all
+    pending keys in a single transaction and skips values whose serialized
+    form did not change since the last write.
+    """
+
+    def __init__(self, path, flush_delay=1.0):
+        self.path = path
+        self.flush_delay = flush_delay
+
+        # The database is opened on first use, not at construction
+        self._conn = None
+        self._db_lock = threading.Lock()
+
+        self._pending = {}
+        self._written = {}  # (namespace, key) -> hash of last written value
+        self._flush_task = None
+
+        # Metrics
+        self.updates = 0
+        self.flushes = 0
+        self.rows_written = 0
+        self.rows_skipped = 0
+        self.flush_seconds = 0.0
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS kv ("
+                "namespace TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL, "
+                "PRIMARY KEY (namespace, key)) WITHOUT ROWID")
+            self._conn.commit()
+        return self._conn
+
+    def load(self, namespace):
+        """Load all values of a namespace as a dict keyed by key."""
+        with self._db_lock:
+            rows = self._connection().execute(
+                "SELECT key, value FROM kv WHERE namespace = ?", (namespace,)).fetchall()
+
+        result = {}
+        for key, blob in rows:
+            try:
+                result[key] = pickle.loads(blob)
+                self._written[(namespace, key)] = hash(blob)
+            except Exception as e:
+                logger.error(f"Error loading {namespace}/{key} from state store: {e}")
+        return result
+
+    def put(self, namespace, key, value):
+        """Queue a value for the next flush."""
+        self._pending[(namespace, key)] = value
+        self.updates += 1
+        self._schedule_flush()
+
+    def delete(self, namespace, key):
+        """Queue a deletion for the next flush."""
+        self._pending[(namespace, key)] = _DELETE
+        self.updates += 1
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        if self._flush_task is None or self._flush_task.done():
+            try:
+                self._flush_task = asyncio.get_running_loop().create_task(self._delayed_flush())
+            except RuntimeError:
+                # No running loop, the caller is expected to flush explicitly
+                self._flush_task = None
+
+    async def _delayed_flush(self):
+        await asyncio.sleep(self.flush_delay)
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Error flushing state store, the batch is retried on the next flush: {e}")
+
+    async def flush(self):
+        """Write all pending changes in one transaction off the event loop."""
+        if not self._pending:
+            return
+        batch = self._pending
+        self._pending = {}
+        # Shallow copies keep the worker thread from iterating dicts the handlers mutate
+        batch = {k: (dict(v) if isinstance(v, dict) else v) for k, v in batch.items()}
+
+        try:
+            failed = await asyncio.to_thread(self._write_batch, batch)
+        except Exception:
+            self._restore(batch)
+            raise
+
+        # Values that could not be serialized are retried on the next flush
+        for key in failed:
+            self._pending.setdefault(key, batch[key])
+
+    def flush_sync(self):
+        """Write all pending changes from the calling thread."""
+        batch, self._pending = self._pending, {}
+        try:
+            self._write_batch(batch)
+        except Exception:
+            self._restore(batch)
+            raise
+
+    def _restore(self, batch):
+        # Changes made while the batch was being written are newer, they win
+        for key, value in batch.items():
+            self._pending.setdefault(key, value)
+
+    def _write_batch(self, batch):
+        started = time.perf_counter()
+        upserts = []
+        deletes = []
+        failed = []
+        digests = {}  # Recorded in _written once the transaction commits
+
+        for (namespace, key), value in batch.items():
+            if value is _DELETE:
+                deletes.append((namespace, key))
+                continue
+            try:
+                blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            except Exception as e:
+                logger.error(f"Error serializing {namespace}/{key}: {e}")
+                failed.append((namespace, key))
+                continue
+
+            digest = hash(blob)
+            if self._written.get((namespace, key)) == digest:
+                self.rows_skipped += 1
+                continue
+            digests[(namespace, key)] = digest
+            upserts.append((namespace, key, blob))
+
+        if upserts or deletes:
+            with self._db_lock:
+                conn = self._connection()
+                with conn:
+                    if upserts:
+                        conn.executemany(
+                            "INSERT INTO kv (namespace, key, value) VALUES (?, ?, ?) "
+                            "ON CONFLICT (namespace, key) DO UPDATE SET value = excluded.value",
+                            upserts)
+                    if deletes:
+                        conn.executemany(
+                            "DELETE FROM kv WHERE namespace = ? AND key = ?", deletes)
+            for key in deletes:
+                self._written.pop(key, None)
+            self._written.update(digests)
+
+        self.flushes += 1
+        self.rows_written += len(upserts) + len(deletes)
+        self.flush_seconds += time.perf_counter() - started
+        return failed
+
+    def close(self):
+        """Flush outstanding changes and close the database."""
+        if self._flush_task and not self._flush_task.done():
+            self._flush_task.cancel()
+        self.flush_sync()
+        with self._db_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def stats(self):
+        """Return write metrics since startup."""
+        return {
+            "updates": self.updates,
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+            "rows_skipped": self.rows_skipped,
+            "flush_seconds": self.flush_seconds,
+            "seconds_per_update": self.flush_seconds / self.updates if self.updates else 0.0,
+        }
@@ -0,0 +1,64 @@
+"""Startup cost reporting.
+
+Run `python startup.py [module ...]` to see what each import adds to a cold
+start, in the order the bot imports them.
+"""
+import importlib
+import sys
+from time import perf_counter
+
+# Import order of the bot, cheap helpers first
+DEFAULT_MODULES = [
+    "formatting", "clock", "cadence", "callback_data", "router", "state_lifecycle",
+    "sqlite_store", "stats_cache", "rooms", "dotenv", "settings", "telegram", "telegram.ext",
+    "circuit", "http_pool", "persistence", "recorder", "subjects", "lanes", "inbound_limit",
+    "update_processor", "timer_state", "session_plan", "timer_tasks", "profiling", "tracing",
+    "templates", "analytics", "broadcast", "overload", "main",
+]
+
+
+class StartupReport:
+    """Durations of consecutive startup phases."""
+
+    def __init__(self, started=None):
+        self.started = perf_counter() if started is None else started
+        self.last = self.started
+        self.phases = []
+
+    def mark(self, name):
+        """Close the phase that ran since the previous mark."""
+        now = perf_counter()
+        self.phases.append((name, now - self.last))
+        self.last = now
+
+    def total(self):
+        return self.last - self.started
+
+    def format(self):
+        phases = ", ".join(f"{name} {seconds * 1000:.1f} ms" for name, seconds in self.phases)
+        return f"Startup in {self.total() * 1000:.1f} ms: {phases}"
+
+
+def profile_imports(modules):
+    """Import modules in order and return the added cost of each."""
+    results = []
+    for name in modules:
+        started = perf_counter()
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            results.append((name, None, str(e)))
+            continue
+        results.append((name, perf_counter() - started, None))
+    return results
+
+
+if __name__ == "__main__":
+    total = 0.0
+    for name, seconds, error in profile_imports(sys.argv[1:] or DEFAULT_MODULES):
+        if error:
+            print(f"{name:16} not importable: {error}")
+            continue
+        total += seconds
+        print(f"{name:16} {seconds * 1000:8.1f} ms")
+    print(f"{'total':16} {total * 1000:8.1f} ms")
@@ -0,0 +1,191 @@
+import asyncio
+import logging
+import sys
+import time
+
+logger = logging.getLogger(__name__)
+
+# Keys that live in context.user_data only for the duration of one session
+SESSION_KEYS = (
+    "session",
+    "adding_subject",
+    "expecting_custom_work",
+    "expecting_custom_break",
+    "expecting_custom_time",
+    "expecting_custom_end_time",
+)
+
+# Key used to remember when the user last sent an update
+LAST_ACTIVITY_KEY = "last_activity"
+
+
+def deep_sizeof(obj, seen=None):
+    """Approximate the memory footprint of an object graph in bytes."""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    elif hasattr(obj, "__dict__") and not isinstance(obj, asyncio.Task):
+        size += deep_sizeof(vars(obj), seen)
+    return size
+
+
+def touch(user_data):
+    """Record activity for a user."""
+    user_data[LAST_ACTIVITY_KEY] = time.time()
+
+
+def clear_session_state(user_data):
+    """Remove per-session keys from user_data and return how many were removed."""
+    removed = 0
+    for key in SESSION_KEYS:
+        if key in user_data:
+            del user_data[key]
+            removed += 1
+    return removed
+
+
+class StateSweeper:
+    """Periodically reclaim user_data of users who have been idle past a TTL.
+
+    With a ConversationHandler in `conversations` it also ends conversations
+    idle past `setup_timeout` in one of `setup_states` whose user has no
+    running timer, clears their session keys and awaits
+    `on_setup_expired(chat_id, user_id)`. This does the job of
+    conversation_timeout, which needs PTB's optional JobQueue.
+    """
+
+    def __init__(self, application, active_timers, ttl, interval, conversations=None,
+                 setup_timeout=None, on_setup_expired=None, setup_states=()):
+        self.application = application
+        self.active_timers = active_timers
+        self.ttl = ttl
+        self.interval = interval
+        self.conversations = conversations
+        self.setup_timeout = setup_timeout
+        self.on_setup_expired = on_setup_expired
+        self.setup_states = setup_states
+        # When conversations of users without user_data were first seen
+        self.first_seen = {}
+        self.task = None
+
+        # Totals since startup
+        self.expired_setups = 0
+        self.swept_users = 0
+        self.reclaimed_entries = 0
+        self.reclaimed_bytes = 0
+
+    def start(self):
+        """Start the background sweep loop."""
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the background sweep loop."""
+        if self.task and not self.task.done():
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        self.task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            expired = []
+            try:
+                expired = self.expire_setups()
+                self.sweep()
+            except Exception as e:
+                logger.error(f"Error sweeping idle user state: {e}")
+            for chat_id, user_id in expired:
+                if self.on_setup_expired:
+                    try:
+                        await self.on_setup_expired(chat_id, user_id)
+                    except Exception as e:
+                        logger.error(f"Error telling user {user_id} their setup expired: {e}")
+
+    def expire_setups(self, now=None):
+        """End conversations idle past the setup timeout, return their (chat_id, user_id) keys."""
+        if self.conversations is None or not self.setup_timeout:
+            return []
+        if now is None:
+            now = time.time()
+
+        expired = []
+        conversations = self.conversations._conversations
+        for key in list(self.first_seen):
+            if key not in conversations:
+                del self.first_seen[key]
+        # PTB has no public way to end a conversation from outside, its own
+        # conversation_timeout goes through _update_state as well
+        for key, state in list(conversations.items()):
+            chat_id, user_id = key[0], key[-1]
+            # Only the setup times out, a session that ended on its own stays in its last state
+            if state not in self.setup_states:
+                continue
+            # A running timer outlives the conversation, its controls are registered globally
+            if user_id in self.active_timers:
+                continue
+            data = self.application.user_data.get(user_id)
+            if data is None:
+                # No activity recorded yet, give it a full timeout as sweep() gives a full TTL
+                last_activity = self.first_seen.setdefault(key, now)
+            else:
+                self.first_seen.pop(key, None)
+                last_activity = data.get(LAST_ACTIVITY_KEY, now)
+            if now - last_activity < self.setup_timeout:
+                continue
+            self.first_seen.pop(key, None)
+            self.conversations._update_state(self.conversations.END, key)
+            if data is not None:
+                clear_session_state(data)
+            expired.append((chat_id, user_id))
+
+        if expired:
+            self.expired_setups += len(expired)
+            logger.info(f"Expired {len(expired)} idle setups (total {self.expired_setups})")
+        return expired
+
+    def sweep(self, now=None):
+        """Drop state of idle users and return (users, entries, bytes) reclaimed."""
+        if now is None:
+            now = time.time()
+
+        users = entries = reclaimed = 0
+        for user_id, data in list(self.application.user_data.items()):
+            # Never touch users whose timer is still running
+            if user_id in self.active_timers:
+                continue
+
+            last_activity = data.get(LAST_ACTIVITY_KEY)
+            if last_activity is None:
+                # State from before the sweeper started, give it a full TTL
+                touch(data)
+                continue
+
+            if now - last_activity < self.ttl:
+                continue
+
+            entries += len(data)
+            reclaimed += deep_sizeof(data)
+            users += 1
+            self.application.drop_user_data(user_id)
+
+        if users:
+            self.swept_users += users
+            self.reclaimed_entries += entries
+            self.reclaimed_bytes += reclaimed
+            logger.info(
+                f"Swept idle state of {users} users: {entries} entries, ~{reclaimed} bytes "
+                f"(total {self.reclaimed_entries} entries, ~{self.reclaimed_bytes} bytes)")
+
+        return users, entries, reclaimed
@@ -0,0 +1,57 @@
+from collections import OrderedDict
+
+
+class StatsCache:
+    """LRU cache of rendered statistics, invalidated by per-user version numbers.
+
+    Writers call `bump(user_id)` whenever a user's statistics change. A
+    cached entry is only served while it was rendered at the current
+    version, so nothing has to be deleted on write.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.versions = {}  # user_id -> version of the user's statistics
+        self.entries = OrderedDict()  # user_id -> (version, value)
+        self.hits = 0
+        self.misses = 0
+
+    def version(self, user_id):
+        return self.versions.get(user_id, 0)
+
+    def bump(self, user_id):
+        """Mark the statistics of a user as changed."""
+        self.versions[user_id] = self.versions.get(user_id, 0) + 1
+
+    def get(self, user_id):
+        """Return the cached value for the current version, or None."""
+        entry = self.entries.get(user_id)
+        if entry is None or entry[0] != self.version(user_id):
+            self.misses += 1
+            return None
+        self.entries.move_to_end(user_id)
+        self.hits += 1
+        return entry[1]
+
+    def peek(self, user_id):
+        """Return the cached value even if the statistics changed since, or None."""
+        entry = self.entries.get(user_id)
+        return entry[1] if entry else None
+
+    def put(self, user_id, version, value):
+        """Cache a value rendered from the statistics at `version`."""
+        if version != self.version(user_id):
+            # Statistics changed while rendering, don't cache stale output
+            return
+        self.entries[user_id] = (version, value)
+        self.entries.move_to_end(user_id)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": round(self.hit_rate(), 3),
+                "entries": len(self.entries)}
@@ -0,0 +1,155 @@
+import logging
+from collections import OrderedDict
+
+from telegram import ReplyKeyboardMarkup
+
+logger = logging.getLogger(__name__)
+
+ADD_SUBJECT_BUTTON = "➕ Добавить предмет"
+HELP_BUTTON = "❓ Помощь"
+CANCEL_BUTTON = "❌ Отмена"
+
+
+def normalize_name(name):
+    """Collapse whitespace in a subject name."""
+    return " ".join(name.split())
+
+
+class Subject:
+    """A subject with its name and emoji kept separately."""
+
+    __slots__ = ("id", "name", "emoji")
+
+    def __init__(self, subject_id, name, emoji):
+        self.id = subject_id
+        self.name = name
+        self.emoji = emoji
+
+    @property
+    def key(self):
+        return self.name.casefold()
+
+    @property
+    def label(self):
+        return f"{self.emoji} {self.name}"
+
+
+class UserSubjects:
+    """Subjects of a single user with O(1) lookups and a cached keyboard."""
+
+    def __init__(self):
+        self.by_id = {}
+        self.by_key = {}
+        self.by_label = {}
+        self.custom = []
+        self.keyboard = None
+
+    def insert(self, subject, custom):
+        self.by_id[subject.id] = subject
+        self.by_key[subject.key] = subject
+        self.by_label[subject.label] = subject
+        if custom:
+            self.custom.append(subject)
+        self.keyboard = None
+
+
+class SubjectRegistry:
+    """Per-user subject registry backed by the user data file.
+
+    Custom subjects are still stored as "emoji name" labels in
+    `custom_subjects`, so existing data files load unchanged; duplicates
+    in old files are collapsed on load.
+    """
+
+    def __init__(self, predefined, emojis, default_emoji, load_data, save_data, max_users=10000):
+        self.emojis = emojis
+        self.default_emoji = default_emoji
+        self.emoji_set = frozenset(emojis.values()) | {default_emoji}
+        self.predefined = [Subject(i, name, emojis.get(name, default_emoji))
+                           for i, name in enumerate(predefined)]
+        self.load_data = load_data
+        self.save_data = save_data
+        self.max_users = max_users
+        self._users = OrderedDict()
+
+    def split_emoji(self, text):
+        """Split "emoji name" into (emoji, name), emoji is None if absent."""
+        head, sep, tail = text.strip().partition(" ")
+        if sep and head in self.emoji_set:
+            return head, normalize_name(tail)
+        return None, normalize_name(text)
+
+    def _load(self, user_id):
+        subjects = UserSubjects()
+        for subject in self.predefined:
+            subjects.insert(subject, custom=False)
+
+        user_data = self.load_data()
+        for label in user_data.get(str(user_id), {}).get("custom_subjects", []):
+            emoji, name = self.split_emoji(label)
+            if name and name.casefold() not in subjects.by_key:
+                subjects.insert(Subject(len(subjects.by_id), name, emoji or self.default_emoji), custom=True)
+        return subjects
+
+    def get(self, user_id):
+        """Return the subjects of a user, loading them on first access."""
+        subjects = self._users.get(user_id)
+        if subjects is None:
+            subjects = self._load(user_id)
+            self._users[user_id] = subjects
+            if len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        else:
+            self._users.move_to_end(user_id)
+        return subjects
+
+    def by_id(self, user_id, subject_id):
+        """Look up a subject by its id."""
+        return self.get(user_id).by_id.get(subject_id)
+
+    def resolve(self, user_id, text):
+        """Map keyboard or free text to a subject, registered or not."""
+        subjects = self.get(user_id)
+        subject = subjects.by_label.get(text)
+        if subject:
+            return subject
+
+        emoji, name = self.split_emoji(text)
+        subject = subjects.by_key.get(name.casefold())
+        if subject:
+            return subject
+        return Subject(None, name, emoji or self.emojis.get(name, self.default_emoji))
+
+    def add(self, user_id, text):
+        """Add a custom subject, returns (subject, created) or (None, False) for empty names."""
+        emoji, name = self.split_emoji(text)
+        if not name:
+            return None, False
+
+        subjects = self.get(user_id)
+        existing = subjects.by_key.get(name.casefold())
+        if existing:
+            return existing, False
+
+        subject = Subject(len(subjects.by_id), name, emoji or self.emojis.get(name, self.default_emoji))
+        subjects.insert(subject, custom=True)
+
+        user_data = self.load_data()
+        user_record = user_data.setdefault(str(user_id), {"stats": {}, "custom_subjects": []})
+        user_record["custom_subjects"] = [s.label for s in subjects.custom]
+        self.save_data(user_data)
+
+        return subject, True
+
+    def keyboard(self, user_id):
+        """Return the subject selection keyboard, built once per change."""
+        subjects = self.get(user_id)
+        if subjects.keyboard is None:
+            rows = [[subject.label] for subject in self.predefined]
+            rows.extend([subject.label] for subject in subjects.custom)
+            rows.append([ADD_SUBJECT_BUTTON])
+            rows.append([HELP_BUTTON, CANCEL_BUTTON])
+            subjects.keyboard = ReplyKeyboardMarkup(rows,
+                                                    one_time_keyboard=True,
+                                                    resize_keyboard=True)
+        return subjects.keyboard
@@ -0,0 +1,74 @@
+"""Message templates compiled once, with user values escaped for MarkdownV2.
+
+Template sources are format strings written in the markup the bot's
+messages have always used: *bold*, _italic_ and `code`. Compiling escapes
+every other MarkdownV2 special character in the literal text once, so
+rendering only escapes the values. Values are escaped whole, so a subject
+called "C*" or "my_notes" can't open or close an entity. Render results
+are Markup and are inserted into other templates as they are.
+
+    SCREEN = Template("📚 Предмет: *{subject}*\\n🕒 До: *{end:%H:%M}*")
+    text = SCREEN.render(subject=session.subject, end=end_work)
+    await bot.send_message(chat_id, text, parse_mode=PARSE_MODE)
+"""
+from functools import lru_cache
+from string import Formatter
+
+PARSE_MODE = "MarkdownV2"
+
+# Characters that must be escaped outside of entities in MarkdownV2
+SPECIAL = "\\_*[]()~`>#+-=|{}.!"
+
+# Characters a template uses as markup
+MARKUP = "*_`"
+
+_ESCAPE_ALL = str.maketrans({char: "\\" + char for char in SPECIAL})
+_ESCAPE_LITERAL = str.maketrans({char: "\\" + char for char in SPECIAL if char not in MARKUP})
+
+
+class Markup(str):
+    """Text that is valid MarkdownV2 already."""
+    __slots__ = ()
+
+
+@lru_cache(maxsize=4096)
+def escape(text):
+    """Escape text so it renders literally, anywhere in a MarkdownV2 message."""
+    return text.translate(_ESCAPE_ALL)
+
+
+class Template:
+    """A message format string compiled to MarkdownV2."""
+    __slots__ = ("source", "_parts")
+
+    def __init__(self, source):
+        self.source = source
+        parts = []
+        markup = ""
+        for literal, field, spec, conversion in Formatter().parse(source):
+            if literal:
+                parts.append(literal.translate(_ESCAPE_LITERAL))
+                markup += "".join(char for char in literal if char in MARKUP)
+            if field is None:
+                continue
+            if not field.isidentifier() or conversion:
+                raise ValueError(f"Unsupported field {{{field}}} in template {source!r}")
+            parts.append((field, spec))
+        for char in MARKUP:
+            if markup.count(char) % 2:
+                raise ValueError(f"Unbalanced {char} in template {source!r}")
+        self._parts = tuple(parts)
+
+    def render(self, **values):
+        out = []
+        for part in self._parts:
+            if part.__class__ is str:
+                out.append(part)
+                continue
+            field, spec = part
+            value = values[field]
+            if isinstance(value, Markup):
+                out.append(value)
+            else:
+                out.append(escape(format(value, spec) if spec else str(value)))
+        return Markup("".join(out))
@@ -0,0 +1,70 @@
+import os
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from state_lifecycle import LAST_ACTIVITY_KEY, StateSweeper  # noqa: E402
+
+SETUP, RUNNING, END = 0, 5, -1
+TIMEOUT = 600
+NOW = 100_000.0
+
+
+class FakeConversations:
+    END = END
+
+    def __init__(self, conversations):
+        self._conversations = conversations
+
+    def _update_state(self, state, key):
+        if state == END:
+            self._conversations.pop(key, None)
+        else:
+            self._conversations[key] = state
+
+
+def make_sweeper(conversations, user_data, active_timers=()):
+    application = SimpleNamespace(user_data=user_data, drop_user_data=user_data.pop)
+    return StateSweeper(application, set(active_timers), ttl=3600, interval=60,
+                        conversations=FakeConversations(conversations), setup_timeout=TIMEOUT,
+                        setup_states=(SETUP,))
+
+
+def test_idle_setup_expires():
+    conversations = {(42, 42): SETUP}
+    user_data = {42: {LAST_ACTIVITY_KEY: NOW - TIMEOUT, "session": object()}}
+    sweeper = make_sweeper(conversations, user_data)
+    assert sweeper.expire_setups(NOW) == [(42, 42)]
+    assert conversations == {}
+    assert "session" not in user_data[42]
+
+
+def test_recent_setup_stays():
+    conversations = {(42, 42): SETUP}
+    sweeper = make_sweeper(conversations, {42: {LAST_ACTIVITY_KEY: NOW - 10}})
+    assert sweeper.expire_setups(NOW) == []
+    assert conversations == {(42, 42): SETUP}
+
+
+def test_finished_session_is_not_expired():
+    # A session that ended on its own leaves the conversation in RUNNING
+    conversations = {(42, 42): RUNNING}
+    sweeper = make_sweeper(conversations, {42: {LAST_ACTIVITY_KEY: NOW - 3600}})
+    assert sweeper.expire_setups(NOW) == []
+    assert conversations == {(42, 42): RUNNING}
+
+
+def test_running_timer_is_not_expired():
+    conversations = {(42, 42): SETUP}
+    sweeper = make_sweeper(conversations, {42: {LAST_ACTIVITY_KEY: NOW - 3600}}, active_timers=[42])
+    assert sweeper.expire_setups(NOW) == []
+
+
+def test_setup_without_user_data_gets_a_full_timeout():
+    conversations = {(42, 42): SETUP}
+    sweeper = make_sweeper(conversations, {})
+    assert sweeper.expire_setups(NOW) == []
+    assert sweeper.expire_setups(NOW + TIMEOUT - 1) == []
+    assert sweeper.expire_setups(NOW + TIMEOUT) == [(42, 42)]
+    assert sweeper.first_seen == {}
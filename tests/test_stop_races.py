@@ -0,0 +1,199 @@
+"""Races around ending a session, and one user's flood against everybody else.
+
+Runs the real stop_timer, run_timer and finish_session on a VirtualClock
+with a fake Bot API, the user's updates in their UserLanes lane as in
+the bot:
+
+- two stop presses at once: the session is credited once, one press
+  gets the summary and the other "no active timers"
+- a stop while a phase transition is being sent: credited once, with the
+  finished work phase, and no later phase is shown
+- a stop while the end-of-session message is being sent: credited once
+- a pause handled only after the work phase's deadline: the phase counts
+  as done and the break follows the pause, the work isn't started over
+- one user's flood through UserLaneUpdateProcessor doesn't hold the
+  global slots, another user's update runs right away
+"""
+import asyncio
+import os
+import sys
+from datetime import timedelta
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+
+import main as bot  # noqa: E402
+from clock import VirtualClock  # noqa: E402
+from lanes import UserLanes  # noqa: E402
+from update_processor import UserLaneUpdateProcessor  # noqa: E402
+
+USER = 1
+NO_TIMERS = "Нет активных таймеров"
+
+
+class FakeBot:
+    """Bot API that answers at once, or holds messages containing `hold` until released."""
+
+    def __init__(self, hold=None):
+        self.hold = hold
+        self.held = asyncio.Event()
+        self.release = asyncio.Event()
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if self.hold and self.hold in text and not self.release.is_set():
+            self.held.set()
+            await self.release.wait()
+        self.sent.append(str(text))
+        return SimpleNamespace(message_id=len(self.sent))
+
+    async def edit_message_text(self, **kwargs):
+        pass
+
+
+class FakeMessage:
+    def __init__(self, fake_bot, text):
+        self.bot = fake_bot
+        self.text = text
+
+    async def reply_text(self, text, **kwargs):
+        await asyncio.sleep(0)
+        self.bot.sent.append(str(text))
+
+
+def stop_press(fake_bot):
+    update = SimpleNamespace(effective_user=SimpleNamespace(id=USER), callback_query=None,
+                             message=FakeMessage(fake_bot, "/stop"))
+    return update, SimpleNamespace(bot=fake_bot, user_data={})
+
+
+credits = []
+
+
+@pytest.fixture(autouse=True)
+def virtual_time(monkeypatch):
+    monkeypatch.setattr(bot, "update_statistics", count_credit)
+    clock = VirtualClock()
+    bot.use_timer_clock(clock)
+    bot.active_timers.clear()
+    credits.clear()
+    return clock
+
+
+async def count_credit(user_id, session):
+    # Yields like a real write could, to widen any race window
+    await asyncio.sleep(0)
+    credits.append((user_id, session.total_work_time, session.total_work_sessions))
+
+
+def start_session(fake_bot, work, rest, end_minutes=None):
+    session = bot.UserSession()
+    session.subject = "Математика"
+    session.work_time, session.break_time = work, rest
+    session.is_working = True
+    session.dashboard = False
+    if end_minutes:
+        session.end_time = bot.timer_clock.now() + timedelta(minutes=end_minutes)
+    bot.active_timers[USER] = session
+    update = SimpleNamespace(effective_chat=SimpleNamespace(id=USER))
+    context = SimpleNamespace(bot=fake_bot, user_data={})
+    task = bot.timer_tasks.start(USER, session, bot.run_timer(update, context, USER))
+    return session, task
+
+
+async def settle(task):
+    try:
+        await asyncio.wait_for(asyncio.shield(task), 1)
+    except asyncio.CancelledError:
+        pass
+
+
+def test_two_stop_presses(virtual_time):
+    async def run():
+        fake_bot = FakeBot()
+        lanes = UserLanes()
+        _, task = start_session(fake_bot, 25, 5)
+        await virtual_time.sleep(60)
+        credits.clear()
+        await asyncio.gather(*(lanes.run(USER, bot.stop_timer(*stop_press(fake_bot))) for _ in range(2)))
+        await settle(task)
+        assert len(credits) == 1
+        assert sum(NO_TIMERS in text for text in fake_bot.sent) == 1, fake_bot.sent[1:]
+        assert USER not in bot.active_timers and task.done()
+
+    asyncio.run(run())
+
+
+def test_stop_during_transition(virtual_time):
+    async def run():
+        fake_bot = FakeBot(hold="Рабочий период завершен")
+        _, task = start_session(fake_bot, 1, 1)
+        await fake_bot.held.wait()
+        sent = len(fake_bot.sent)
+        await bot.stop_timer(*stop_press(fake_bot))
+        fake_bot.release.set()
+        await settle(task)
+        await virtual_time.sleep(180)
+        # One credit of the finished work phase
+        assert credits == [(USER, 60, 1)]
+        later = [text for text in fake_bot.sent[sent:] if NO_TIMERS not in text and "остановлен" not in text]
+        assert later == []
+        assert USER not in bot.active_timers and task.done()
+
+    asyncio.run(run())
+
+
+def test_stop_during_end(virtual_time):
+    async def run():
+        fake_bot = FakeBot(hold="завершена")
+        _, task = start_session(fake_bot, 1, 1, end_minutes=1)
+        await fake_bot.held.wait()
+        await bot.stop_timer(*stop_press(fake_bot))
+        fake_bot.release.set()
+        await settle(task)
+        assert len(credits) == 1
+        # The stop found no session left to end
+        assert any(NO_TIMERS in text for text in fake_bot.sent), fake_bot.sent
+
+    asyncio.run(run())
+
+
+def test_pause_after_deadline(virtual_time):
+    async def run():
+        fake_bot = FakeBot()
+        session, task = start_session(fake_bot, 1, 1, end_minutes=4)
+        await virtual_time.sleep(59)
+        # Pressed before the deadline, handled after it
+        session.is_paused = True
+        session.pause_start_time = bot.timer_clock.now() + timedelta(seconds=2)
+        await virtual_time.sleep(60)
+        session.is_paused = False
+        await settle(task)
+        # Both work phases count in full
+        assert credits == [(USER, 120, 2)]
+
+    asyncio.run(run())
+
+
+def test_flood_holds_no_slots():
+    async def run():
+        processor = UserLaneUpdateProcessor(4)
+        processor.lane_key = lambda update: update
+        latency = {}
+
+        async def handle(name):
+            await asyncio.sleep(0.01)
+            latency.setdefault(name, asyncio.get_running_loop().time())
+
+        started = asyncio.get_running_loop().time()
+        tasks = [asyncio.create_task(processor.process_update("flooder", handle(f"flood {i}")))
+                 for i in range(50)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(processor.process_update("other", handle("other"))))
+        await asyncio.gather(*tasks)
+        # Behind 50 updates of one user in 4 slots it would wait about 130 ms
+        assert latency["other"] - started < 0.1
+
+    asyncio.run(run())
@@ -0,0 +1,327 @@
+"""Live timer state kept outside the process that runs the timer.
+
+A TimerState holds what another worker needs to take over a session: the
+phase, its deadline, the pause state and the ids of the messages to edit.
+It is written when a phase starts, on pause and when the session ends,
+never per tick, and a write whose serialized state didn't change is
+skipped. Progress within a phase follows from the deadline.
+
+Backends:
+
+    MemoryTimerStore()                  one process, the default
+    KVTimerStore("127.0.0.1", 6379)     any RESP key-value server, e.g. Redis
+                                        or the stand-in in kv_server.py
+
+Workers announce themselves with heartbeat(). Sessions of a worker whose
+heartbeat has lapsed are orphaned, and orphaned() hands each of them to
+exactly one of the workers asking, through claim().
+"""
+import asyncio
+import json
+import time
+from urllib.parse import urlsplit
+
+WORK = "work"
+BREAK = "break"
+
+
+class TimerState:
+    """The externally visible state of one running session."""
+    __slots__ = ("user_id", "chat_id", "owner", "subject", "phase", "deadline", "paused_at",
+                 "end_time", "work_time", "break_time", "message_id",
+                 "total_work_time", "total_work_sessions", "phase_start", "nonce", "dashboard",
+                 "progress_mode")
+
+    def __init__(self, user_id, chat_id, owner, subject, phase, deadline, paused_at=None,
+                 end_time=None, work_time=None, break_time=None, message_id=None,
+                 total_work_time=0, total_work_sessions=0, phase_start=None, nonce=0,
+                 dashboard=False, progress_mode=None):
+        self.user_id = user_id
+        self.chat_id = chat_id
+        self.owner = owner  # Worker running the timer
+        self.subject = subject
+        self.phase = phase
+        self.deadline = deadline  # Unix time the phase ends, if it isn't paused
+        self.paused_at = paused_at  # Unix time of the pause
+        self.end_time = end_time  # Unix time the session ends, None for open-ended
+        self.work_time = work_time
+        self.break_time = break_time
+        self.message_id = message_id  # Message showing the phase
+        self.total_work_time = total_work_time
+        self.total_work_sessions = total_work_sessions
+        self.phase_start = phase_start  # Unix time the phase started, None in states of older workers
+        self.nonce = nonce  # Ties the session's inline buttons to it
+        self.dashboard = dashboard
+        self.progress_mode = progress_mode
+
+    @property
+    def is_paused(self):
+        return self.paused_at is not None
+
+    def due_at(self):
+        """When the next transition is due, paused sessions never are."""
+        if self.is_paused:
+            return float("inf")
+        if self.end_time is not None:
+            return min(self.deadline, self.end_time)
+        return self.deadline
+
+    def to_json(self):
+        return json.dumps({name: getattr(self, name) for name in self.__slots__},
+                          ensure_ascii=False, separators=(",", ":"))
+
+    @classmethod
+    def from_json(cls, text):
+        return cls(**json.loads(text))
+
+
+class TimerStore:
+    """Base of the backends, they implement the underscored methods."""
+
+    def __init__(self):
+        self._written = {}  # user_id -> last serialized state written by this process
+
+        # Metrics
+        self.writes = 0
+        self.skipped = 0
+        self.deletes = 0
+
+    async def put(self, state):
+        """Write a state unless this process wrote the same one last."""
+        text = state.to_json()
+        if self._written.get(state.user_id) == text:
+            self.skipped += 1
+            return
+        await self._put(state.user_id, text, state.due_at())
+        self._written[state.user_id] = text
+        self.writes += 1
+
+    async def get(self, user_id):
+        text = await self._get(user_id)
+        return TimerState.from_json(text) if text is not None else None
+
+    async def delete(self, user_id):
+        self._written.pop(user_id, None)
+        await self._delete(user_id)
+        self.deletes += 1
+
+    async def due(self, now, limit=100):
+        """User ids whose next transition is due by `now`, earliest first."""
+        return await self._range(float("-inf"), now, limit)
+
+    async def orphaned(self, worker, lease=60.0, due_before=float("inf"), limit=1000):
+        """Claim and return the states of workers without a live heartbeat.
+
+        A live worker writes the next phase as soon as one is due, so after a
+        full scan at startup it's enough to look at states overdue by more
+        than a heartbeat's lifetime. Paused states are never due and are
+        looked at on every scan.
+        """
+        result = []
+        owners = {worker: True}
+        user_ids = await self._range(float("-inf"), due_before, limit)
+        if due_before != float("inf"):
+            user_ids += await self._range(float("inf"), float("inf"), limit)
+        for user_id in user_ids:
+            state = await self.get(user_id)
+            if state is None:
+                continue
+            if state.owner not in owners:
+                owners[state.owner] = await self._alive(state.owner)
+            if not owners[state.owner] and await self._claim(user_id, worker, lease):
+                result.append(state)
+        return result
+
+    async def heartbeat(self, worker, ttl):
+        """Mark a worker alive for `ttl` seconds."""
+        await self._heartbeat(worker, ttl)
+
+    async def close(self):
+        pass
+
+    def stats(self):
+        return {"writes": self.writes, "skipped": self.skipped, "deletes": self.deletes}
+
+
+class MemoryTimerStore(TimerStore):
+    """States in a dict of this process, nothing survives a restart."""
+
+    def __init__(self, clock=time.monotonic):
+        super().__init__()
+        self.clock = clock
+        self.states = {}  # user_id -> serialized state
+        self.due_at = {}  # user_id -> due time
+        self.heartbeats = {}  # worker -> expiry
+        self.claims = {}  # user_id -> (worker, expiry)
+
+    async def _put(self, user_id, text, due_at):
+        self.states[user_id] = text
+        self.due_at[user_id] = due_at
+
+    async def _get(self, user_id):
+        return self.states.get(user_id)
+
+    async def _delete(self, user_id):
+        self.states.pop(user_id, None)
+        self.due_at.pop(user_id, None)
+
+    async def _range(self, low, high, limit):
+        items = sorted((due_at, user_id) for user_id, due_at in self.due_at.items()
+                       if low <= due_at <= high)
+        return [user_id for due_at, user_id in items[:limit]]
+
+    async def _heartbeat(self, worker, ttl):
+        self.heartbeats[worker] = self.clock() + ttl
+
+    async def _alive(self, worker):
+        return self.heartbeats.get(worker, 0) > self.clock()
+
+    async def _claim(self, user_id, worker, lease):
+        now = self.clock()
+        # Leases expire as the key-value store's do, drop the expired ones
+        self.claims = {claimed: claim for claimed, claim in self.claims.items() if claim[1] > now}
+        if user_id in self.claims:
+            return False
+        self.claims[user_id] = (worker, now + lease)
+        return True
+
+
+class KVError(Exception):
+    """An error reply of the key-value server."""
+
+
+class RespClient:
+    """Minimal client for the Redis serialization protocol over one connection.
+
+    Commands of one execute() call are pipelined. A broken connection is
+    dropped and opened again by the next call.
+    """
+
+    def __init__(self, host, port, timeout=5.0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._reader = None
+        self._writer = None
+        self._lock = asyncio.Lock()
+
+    async def execute(self, *commands):
+        """Send commands, each a tuple of arguments, and return their replies."""
+        payload = b"".join(self.encode(command) for command in commands)
+        async with self._lock:
+            try:
+                return await asyncio.wait_for(self._roundtrip(payload, len(commands)), self.timeout)
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+                self._drop()
+                raise ConnectionError(f"key-value server {self.host}:{self.port}: {e!r}") from e
+
+    async def _roundtrip(self, payload, count):
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        self._writer.write(payload)
+        await self._writer.drain()
+        replies = [await self.read_reply(self._reader) for _ in range(count)]
+        for reply in replies:
+            if isinstance(reply, KVError):
+                raise reply
+        return replies
+
+    def _drop(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+    async def close(self):
+        async with self._lock:
+            writer = self._writer
+            self._drop()
+            if writer is not None:
+                await writer.wait_closed()
+
+    @staticmethod
+    def encode(args):
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode()
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        return b"".join(parts)
+
+    @classmethod
+    async def read_reply(cls, reader):
+        line = await reader.readuntil(b"\r\n")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            return KVError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            if int(rest) < 0:
+                return None
+            return (await reader.readexactly(int(rest) + 2))[:-2]
+        if kind == b"*":
+            if int(rest) < 0:
+                return None
+            return [await cls.read_reply(reader) for _ in range(int(rest))]
+        raise KVError(f"unexpected reply {line!r}")
+
+
+def _score(value):
+    return "+inf" if value == float("inf") else "-inf" if value == float("-inf") else repr(value)
+
+
+class KVTimerStore(TimerStore):
+    """States in a RESP key-value server shared by all workers.
+
+    Each state is a string key, and a sorted set indexes the users by due
+    time, so a put is one pipelined round trip of two commands.
+    """
+
+    def __init__(self, host, port, prefix="timer:", timeout=5.0):
+        super().__init__()
+        self.client = RespClient(host, port, timeout)
+        self.prefix = prefix
+        self.index = prefix + "due"
+
+    async def _put(self, user_id, text, due_at):
+        await self.client.execute(("SET", f"{self.prefix}state:{user_id}", text),
+                                  ("ZADD", self.index, _score(due_at), user_id))
+
+    async def _get(self, user_id):
+        reply, = await self.client.execute(("GET", f"{self.prefix}state:{user_id}"))
+        return reply.decode() if reply is not None else None
+
+    async def _delete(self, user_id):
+        await self.client.execute(("DEL", f"{self.prefix}state:{user_id}"),
+                                  ("ZREM", self.index, user_id))
+
+    async def _range(self, low, high, limit):
+        reply, = await self.client.execute(
+            ("ZRANGEBYSCORE", self.index, _score(low), _score(high), "LIMIT", 0, limit))
+        return [int(user_id) for user_id in reply]
+
+    async def _heartbeat(self, worker, ttl):
+        await self.client.execute(("SET", f"{self.prefix}worker:{worker}", 1, "PX", int(ttl * 1000)))
+
+    async def _alive(self, worker):
+        reply, = await self.client.execute(("EXISTS", f"{self.prefix}worker:{worker}"))
+        return reply > 0
+
+    async def _claim(self, user_id, worker, lease):
+        reply, = await self.client.execute(
+            ("SET", f"{self.prefix}claim:{user_id}", worker, "NX", "PX", int(lease * 1000)))
+        return reply == "OK"
+
+    async def close(self):
+        await self.client.close()
+
+
+def open_timer_store(url):
+    """Store for a TIMER_STORE_URL: empty for memory, kv://host:port or redis://host:port."""
+    if not url:
+        return MemoryTimerStore()
+    parts = urlsplit(url)
+    if parts.scheme not in ("kv", "redis"):
+        raise ValueError(f"Unsupported timer store {url!r}")
+    return KVTimerStore(parts.hostname or "127.0.0.1", parts.port or 6379)
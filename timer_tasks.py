@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class TimerTasks:
+    """Owns the task of every running session and watches over them.
+
+    Sessions live in `active_timers`, their tasks here. start() cancels a
+    previous task of the same user and stop() cancels the current one, so no
+    stop path can leave a task running. A running task reports tick() each
+    time it wakes up. The watchdog loop reaps tasks without a session and
+    sessions without a task, and flags tasks that haven't ticked for
+    `stuck_after` seconds.
+    """
+
+    def __init__(self, active_timers, stuck_after, interval, clock=time.monotonic):
+        self.active_timers = active_timers
+        self.stuck_after = stuck_after
+        self.interval = interval
+        self.clock = clock
+        self.tasks = {}  # user_id -> task
+        self.ticks = {}  # user_id -> clock() of the last tick
+        self.flagged = set()  # user_ids reported as stuck and not ticked since
+        self.watchdog = None
+
+        # Totals since startup
+        self.reaped_tasks = 0
+        self.reaped_sessions = 0
+        self.stuck_reports = 0
+
+    def __len__(self):
+        return len(self.tasks)
+
+    def start(self, user_id, session, coroutine):
+        """Run the timer coroutine of a session as the user's only task."""
+        self.stop(user_id)
+        task = asyncio.create_task(coroutine)
+        session.task = task
+        self.tasks[user_id] = task
+        self.ticks[user_id] = self.clock()
+        task.add_done_callback(lambda done: self._forget(user_id, done))
+        return task
+
+    def stop(self, user_id):
+        """Cancel the user's task, return whether one was running."""
+        task = self.tasks.pop(user_id, None)
+        self.ticks.pop(user_id, None)
+        self.flagged.discard(user_id)
+        if task is None or task.done():
+            return False
+        task.cancel()
+        return True
+
+    def tick(self, user_id):
+        if user_id in self.tasks:
+            self.ticks[user_id] = self.clock()
+            self.flagged.discard(user_id)
+
+    def _forget(self, user_id, task):
+        if self.tasks.get(user_id) is task:
+            del self.tasks[user_id]
+            self.ticks.pop(user_id, None)
+            self.flagged.discard(user_id)
+
+    def audit(self):
+        """Reap orphans and return (tasks cancelled, sessions removed).
+
+        A task is orphaned when its user has no session or a different one,
+        a session when its task is missing or finished.
+        """
+        tasks = 0
+        for user_id, task in list(self.tasks.items()):
+            session = self.active_timers.get(user_id)
+            if session is None or session.task is not task:
+                logger.warning(f"Cancelling orphaned timer task of user {user_id}")
+                self.stop(user_id)
+                tasks += 1
+
+        sessions = 0
+        for user_id, session in list(self.active_timers.items()):
+            task = self.tasks.get(user_id)
+            if task is None or task.done():
+                logger.warning(f"Removing timer session of user {user_id} without a running task")
+                del self.active_timers[user_id]
+                sessions += 1
+
+        self.reaped_tasks += tasks
+        self.reaped_sessions += sessions
+        return tasks, sessions
+
+    def stuck(self, now=None):
+        """Users whose task hasn't ticked for longer than stuck_after."""
+        if now is None:
+            now = self.clock()
+        return [user_id for user_id, last in self.ticks.items() if now - last > self.stuck_after]
+
+    def check(self):
+        """Audit once and report newly stuck tasks with where they wait."""
+        self.audit()
+        now = self.clock()
+        for user_id in self.stuck(now):
+            if user_id in self.flagged:
+                continue
+            self.flagged.add(user_id)
+            self.stuck_reports += 1
+            task = self.tasks[user_id]
+            frames = task.get_stack(limit=1)
+            where = (f"{frames[0].f_code.co_filename}:{frames[0].f_lineno}" if frames else "unknown")
+            logger.warning(f"Timer task of user {user_id} hasn't ticked for "
+                           f"{now - self.ticks[user_id]:.0f} s, waiting at {where}")
+
+    def start_watchdog(self):
+        """Start the background audit loop."""
+        if self.watchdog is None or self.watchdog.done():
+            self.watchdog = asyncio.create_task(self._run())
+
+    async def stop_watchdog(self):
+        """Stop the background audit loop."""
+        if self.watchdog and not self.watchdog.done():
+            self.watchdog.cancel()
+            try:
+                await self.watchdog
+            except asyncio.CancelledError:
+                pass
+        self.watchdog = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.check()
+            except Exception as e:
+                logger.error(f"Error auditing timer tasks: {e}")
+
+    def stats(self):
+        return {"tasks": len(self.tasks), "reaped_tasks": self.reaped_tasks,
+                "reaped_sessions": self.reaped_sessions, "stuck_reports": self.stuck_reports}
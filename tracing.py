@@ -0,0 +1,139 @@
+"""Per-update span tracing.
+
+The update processor runs each update under Tracer.run(), which makes a
+trace current for the task. Code on the way, storage, rendering and Bot API
+calls, marks its work with `with span(name):`. Outside a trace span() only
+reads a context variable, so instrumented code costs next to nothing when
+tracing is off.
+
+When the update is done the trace is kept if it was slow, otherwise with
+probability `sample_rate`, and its spans are appended to a JSONL file, one
+span per line, with the field names of OpenTelemetry's OTLP/JSON format.
+"""
+import json
+import random
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+
+class Span:
+    __slots__ = ("name", "span_id", "parent_id", "start", "end", "attributes", "error")
+
+    def __init__(self, name, parent_id, attributes):
+        self.name = name
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.start = time.time_ns()
+        self.end = None
+        self.attributes = attributes
+        self.error = None
+
+
+class Trace:
+    __slots__ = ("trace_id", "spans", "finished")
+
+    def __init__(self):
+        self.trace_id = f"{random.getrandbits(128):032x}"
+        self.spans = []
+        self.finished = False
+
+
+# The trace and the innermost open span of the running task
+_trace = ContextVar("trace", default=None)
+_parent = ContextVar("span", default=None)
+
+
+# Shared by every span() call outside a trace
+_NO_SPAN = nullcontext()
+
+
+def span(name, **attributes):
+    """Time a block as a child of the current span, if there is a trace."""
+    trace = _trace.get()
+    # Tasks started from a handler inherit its trace, ignore them once it's done
+    if trace is None or trace.finished:
+        return _NO_SPAN
+    return _open_span(trace, name, attributes)
+
+
+@contextmanager
+def _open_span(trace, name, attributes):
+    current = Span(name, _parent.get(), attributes)
+    trace.spans.append(current)
+    token = _parent.set(current.span_id)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.end = time.time_ns()
+        _parent.reset(token)
+
+
+class Tracer:
+    """Trace updates and write sampled and slow traces to a JSONL file."""
+
+    def __init__(self, path, sample_rate=0.01, slow_ms=500, flush_every=20, rng=random.random):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.slow_ns = slow_ms * 1_000_000
+        self.flush_every = flush_every
+        self.rng = rng
+        self._file = open(path, "a", encoding="utf-8")
+
+        # Totals since startup
+        self.traces = 0
+        self.kept = 0
+        self.kept_slow = 0
+
+    async def run(self, name, coroutine, **attributes):
+        """Await a coroutine as the root span of a new trace."""
+        trace = Trace()
+        trace_token = _trace.set(trace)
+        try:
+            with span(name, **attributes):
+                return await coroutine
+        finally:
+            trace.finished = True
+            _trace.reset(trace_token)
+            self.finish(trace)
+
+    def finish(self, trace):
+        self.traces += 1
+        root = trace.spans[0]
+        slow = root.end - root.start >= self.slow_ns
+        if not slow and self.rng() >= self.sample_rate:
+            return
+        self.kept += 1
+        self.kept_slow += slow
+        for item in trace.spans:
+            self._file.write(json.dumps(self.to_json(trace, item), ensure_ascii=False,
+                                        separators=(",", ":")) + "\n")
+        if self.kept % self.flush_every == 0:
+            self._file.flush()
+
+    @staticmethod
+    def to_json(trace, item):
+        record = {
+            "traceId": trace.trace_id,
+            "spanId": item.span_id,
+            "name": item.name,
+            # Spans of a background task may still be open when the update is done
+            "startTimeUnixNano": str(item.start),
+            "endTimeUnixNano": str(item.end or time.time_ns()),
+            "attributes": [{"key": key, "value": {"stringValue": str(value)}}
+                           for key, value in item.attributes.items()],
+            "status": {"code": 2, "message": item.error} if item.error else {"code": 1},
+        }
+        if item.parent_id:
+            record["parentSpanId"] = item.parent_id
+        return record
+
+    def stats(self):
+        return {"traces": self.traces, "kept": self.kept, "kept_slow": self.kept_slow}
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import sys
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from lanes import UserLanes
+
+logger = logging.getLogger(__name__)
+
+
+class UserLaneUpdateProcessor(BaseUpdateProcessor):
+    """Process updates of different users concurrently, and of one user in order.
+
+    Updates are keyed by the sending user, or by the chat when there is no
+    user. Updates without either run without a lane. At most
+    `max_concurrent_updates` updates run at once, and an update only takes
+    one of these slots once it is first in its lane.
+
+    An optional InboundLimiter runs ahead of everything else: updates it
+    rejects are dropped before they reach a lane, persistence or a handler.
+    An optional UpdateRecorder sees every update, dropped ones included.
+    An optional Tracer traces every update that isn't dropped.
+
+    An optional OverloadController is kept informed of the updates in the
+    pipeline, those waiting for their lane or a slot included. Messages whose text
+    is a key of `low_value` are work of that kind, dropped while the
+    controller sheds it.
+
+    The base class's final process_update() takes its own semaphore before
+    do_process_update(), slot first. That semaphore is left unbounded and
+    the slots are a semaphore of this class, taken in do_process_update()
+    once the update is first in its lane. Its `max_concurrent_updates`
+    reports the unbounded one.
+    """
+
+    def __init__(self, max_concurrent_updates=64, limiter=None, recorder=None, tracer=None,
+                 overload=None, low_value=None):
+        if max_concurrent_updates < 1:
+            raise ValueError("`max_concurrent_updates` must be a positive integer!")
+        super().__init__(sys.maxsize)
+        self.slots = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self.lanes = UserLanes()
+        self.limiter = limiter
+        self.recorder = recorder
+        self.tracer = tracer
+        self.overload = overload
+        self.low_value = low_value or {}
+
+    @staticmethod
+    def lane_key(update):
+        if not isinstance(update, Update):
+            return None
+        if update.effective_user:
+            return update.effective_user.id
+        if update.effective_chat:
+            return update.effective_chat.id
+        return None
+
+    @staticmethod
+    def fingerprint(update):
+        """What makes two taps of the same user identical."""
+        if not isinstance(update, Update):
+            return None
+        if update.callback_query:
+            return update.callback_query.data
+        if update.message:
+            return update.message.text
+        return None
+
+    @staticmethod
+    def kind(update):
+        if not isinstance(update, Update):
+            return type(update).__name__
+        if update.callback_query:
+            return "callback_query"
+        if update.message and update.message.text and update.message.text.startswith("/"):
+            return "command"
+        if update.message:
+            return "message"
+        return "other"
+
+    async def do_process_update(self, update, coroutine):
+        """Drop, or run in the update's lane and then in one of the global slots.
+
+        An update waiting behind earlier updates of the same user holds no
+        slot, so one user's flood can't take every slot from the others.
+        """
+        if self.overload:
+            self.overload.depth += 1
+        try:
+            await self._process(update, coroutine)
+        finally:
+            # Never awaited if dropped or cancelled while waiting
+            coroutine.close()
+            if self.overload:
+                self.overload.depth -= 1
+
+    async def _process(self, update, coroutine):
+        key = self.lane_key(update)
+        if self.recorder and isinstance(update, Update):
+            try:
+                self.recorder.record(update.to_dict())
+            except Exception as e:
+                logger.error(f"Error recording update: {e}")
+        if self.limiter:
+            reason = self.limiter.check(key, self.fingerprint(update))
+            if reason:
+                logger.debug(f"Dropped update from {key}: {reason}")
+                return
+        if self.overload and isinstance(update, Update) and update.message:
+            kind = self.low_value.get(update.message.text)
+            if kind and self.overload.shed(kind):
+                logger.debug(f"Shed update from {key}: {kind}")
+                return
+        work = self.lanes.run(key, self._in_slot(coroutine))
+        if self.tracer:
+            attributes = {"load": self.overload.level} if self.overload else {}
+            await self.tracer.run("update", work, kind=self.kind(update), lane=key, **attributes)
+        else:
+            await work
+
+    async def _in_slot(self, coroutine):
+        async with self.slots:
+            await coroutine
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        logger.info(f"Processed {self.lanes.processed} updates, "
+                    f"{self.lanes.queued} waited for an earlier update of the same user")
+        if self.limiter:
+            logger.info(f"Inbound limiter: {self.limiter.stats()}")
+        if self.overload:
+            logger.info(f"Overload: {self.overload.stats()}")
+        if self.recorder:
+            self.recorder.close()
+            logger.info(f"Recorded {self.recorder.recorded} updates to {self.recorder.path}")
+        if self.tracer:
+            self.tracer.close()
+            logger.info(f"Tracer: {self.tracer.stats()}, written to {self.tracer.path}")